@@ -0,0 +1,469 @@
+import asyncio
+import functools
+import inspect
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from config import DATABASE_NAME, DB_READ_CONNECTIONS, DB_POOL_TIMEOUT, DB_GROUP_COMMIT_MS, DB_GROUP_COMMIT_MAX, \
+    CACHE_MAX_USERS, CACHE_TTL
+from database import Database
+from utils.metrics import DB_SECONDS, DB_ERRORS
+from utils.ttl_cache import TTLCache, MISSING
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Пул соединений с одним файлом базы.
+
+    Чтение идет через несколько соединений, а все записи - через одно
+    соединение-писатель под блокировкой, так что SQLite никогда не видит
+    двух одновременных писателей из нашего процесса.
+    Пул ведет счетчики времени ожидания соединения.
+    """
+
+    def __init__(self, db_name, readers=DB_READ_CONNECTIONS, timeout=DB_POOL_TIMEOUT, pragmas=None):
+        self.db_name = db_name
+        self.pragmas = pragmas
+        self.size = readers
+        self.timeout = timeout
+
+        # Писатель создается первым: он же создает таблицы
+        self._writer = self._connect()
+        self._writer_lock = threading.Lock()
+        self._readers = queue.Queue(maxsize=readers)
+        for _ in range(readers):
+            self._readers.put(self._connect())
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "reads": 0,
+            "writes": 0,
+            "read_wait_total": 0.0,
+            "read_wait_max": 0.0,
+            "write_wait_total": 0.0,
+            "write_wait_max": 0.0,
+            "timeouts": 0,
+            "reconnects": 0,
+        }
+
+    def _connect(self) -> Database:
+        return Database(self.db_name, check_same_thread=False, pragmas=self.pragmas)
+
+    def _record_wait(self, kind, waited):
+        with self._stats_lock:
+            self._stats[f"{kind}s"] += 1
+            self._stats[f"{kind}_wait_total"] += waited
+            self._stats[f"{kind}_wait_max"] = max(self._stats[f"{kind}_wait_max"], waited)
+
+    def _timeout(self, kind):
+        with self._stats_lock:
+            self._stats["timeouts"] += 1
+        raise PoolTimeoutError(f"Немає вільного з'єднання ({kind}) за {self.timeout} с")
+
+    @contextmanager
+    def reader(self):
+        started = time.perf_counter()
+        try:
+            db = self._readers.get(timeout=self.timeout)
+        except queue.Empty:
+            self._timeout("read")
+        self._record_wait("read", time.perf_counter() - started)
+        try:
+            yield db
+        finally:
+            self._readers.put(db)
+
+    @contextmanager
+    def writer(self):
+        started = time.perf_counter()
+        if not self._writer_lock.acquire(timeout=self.timeout):
+            self._timeout("write")
+        self._record_wait("write", time.perf_counter() - started)
+        try:
+            yield self._writer
+        finally:
+            self._writer_lock.release()
+
+    def _is_alive(self, db: Database) -> bool:
+        try:
+            db.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _reconnect(self, db: Database) -> Database:
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+        with self._stats_lock:
+            self._stats["reconnects"] += 1
+        return self._connect()
+
+    def health_check(self) -> bool:
+        """
+        Проверяет писателя и все свободные соединения для чтения,
+        заменяя сломанные новыми. Возвращает True, если база доступна.
+        """
+        try:
+            with self.writer():
+                if not self._is_alive(self._writer):
+                    self._writer = self._reconnect(self._writer)
+                healthy = self._is_alive(self._writer)
+
+            # Проверяем только те соединения, что сейчас свободны
+            for _ in range(self._readers.qsize()):
+                try:
+                    db = self._readers.get_nowait()
+                except queue.Empty:
+                    break
+                if not self._is_alive(db):
+                    db = self._reconnect(db)
+                    healthy = healthy and self._is_alive(db)
+                self._readers.put(db)
+            return healthy
+        except (PoolTimeoutError, sqlite3.Error):
+            return False
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["readers_total"] = self.size
+        stats["readers_idle"] = self._readers.qsize()
+        return stats
+
+    def close(self):
+        with self._writer_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+
+def _fail(future: asyncio.Future, error: Exception):
+    """Завершает future с ошибкой из любого цикла событий; если его цикл уже закрыт, ждать некому"""
+    def set_exception():
+        if not future.done():
+            future.set_exception(error)
+    try:
+        future.get_loop().call_soon_threadsafe(set_exception)
+    except RuntimeError:
+        pass
+
+
+class GroupCommitWriter:
+    """
+    Групповая фиксация показаний.
+
+    Показания, пришедшие в течение window_ms миллисекунд, записываются
+    одной транзакцией через Database.add_readings_batch, то есть с одним
+    fsync на всю пачку. Каждый вызывающий получает свой результат
+    (записано ли, предыдущее показание), как от обычного submit_reading.
+    """
+
+    def __init__(self, database, window_ms=DB_GROUP_COMMIT_MS, max_batch=DB_GROUP_COMMIT_MAX):
+        self._database = database
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.submitted = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and not self._task.done():
+            return
+        orphaned = []
+        while self._queue is not None and not self._queue.empty():
+            orphaned.append(self._queue.get_nowait())
+        same_loop = self._loop is loop
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+        # Показания из очереди остановившейся задачи: в том же цикле их запишет
+        # новая задача, а ожидающим в другом цикле сообщаем об ошибке, иначе они
+        # ждали бы результата вечно
+        for item in orphaned:
+            if same_loop:
+                self._queue.put_nowait(item)
+            else:
+                _fail(item[2], RuntimeError("GroupCommitWriter перезапущено в іншому циклі подій"))
+
+    def queue_size(self) -> int:
+        """Сколько показаний ждут записи"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, counter_id: int, value: int) -> Tuple[bool, Optional[int]]:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((counter_id, value, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Ждет первое показание, затем добирает остальные в пределах окна"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self.batches += 1
+            self.submitted += len(batch)
+            try:
+                results = await self._database.run("add_readings_batch", [(c, v) for c, v, _ in batch])
+            except asyncio.CancelledError:
+                # Задачу остановили посреди записи: результат пачки неизвестен
+                for _, _, future in batch:
+                    _fail(future, RuntimeError("Запис показань перервано"))
+                raise
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class AsyncDatabase:
+    """
+    Асинхронная обертка над Database.
+
+    Каждый метод Database доступен как корутина: сам запрос выполняется
+    в отдельном пуле потоков, поэтому медленный fsync или большой отчет
+    не блокируют цикл событий, в котором работают оба бота.
+    Соединения берутся из общего ConnectionPool: методы из WRITE_METHODS
+    идут через писателя, остальные - через соединения для чтения.
+    submit_reading (и add_reading) идет через GroupCommitWriter, если group_commit_ms > 0.
+    data_version растет после каждой записи: по нему кэши понимают,
+    что данные могли измениться.
+
+    get_user и get_counters читаются через кэш в памяти процесса; записи
+    сбрасывают кэш затронутого пользователя (по user_id или, для методов
+    со счетчиком, по владельцу счетчика).
+    """
+
+    WRITE_METHODS = frozenset({
+        "add_user",
+        "register_user",
+        "add_counter",
+        "add_reading",
+        "submit_reading",
+        "add_readings_batch",
+        "update_user_field",
+        "rename_counter",
+        "delete_counter",
+        "set_meters_count",
+        "add_monthly_reading",
+        "start_broadcast",
+        "plan_broadcast",
+        "record_broadcast_results",
+        "finish_broadcast",
+        "save_fsm_states",
+        "purge_fsm_states",
+        "write_audit_events",
+        "purge_audit_events",
+    })
+
+    # Записи, которые не меняют данные отчетов и профилей: data_version не растет
+    UNVERSIONED_WRITES = frozenset({
+        "start_broadcast",
+        "plan_broadcast",
+        "record_broadcast_results",
+        "finish_broadcast",
+        "save_fsm_states",
+        "purge_fsm_states",
+        "write_audit_events",
+        "purge_audit_events",
+    })
+
+    # Какой аргумент записи указывает на затронутого пользователя или счетчик
+    USER_WRITES = {
+        "add_user": "user_id",
+        "register_user": "user_id",
+        "add_counter": "user_id",
+        "update_user_field": "user_id",
+        "set_meters_count": "user_id",
+    }
+    COUNTER_WRITES = {
+        "add_reading": "counter_id",
+        "submit_reading": "counter_id",
+        "rename_counter": "counter_id",
+        "delete_counter": "counter_id",
+        "add_monthly_reading": "counter_id",
+    }
+
+    def __init__(self, pool: ConnectionPool, group_commit_ms=DB_GROUP_COMMIT_MS):
+        self.pool = pool
+        # Один поток на каждое соединение пула плюс один для писателя
+        self._executor = ThreadPoolExecutor(max_workers=pool.size + 1, thread_name_prefix="db")
+        self._readings_writer = GroupCommitWriter(self, group_commit_ms) if group_commit_ms > 0 else None
+        self.data_version = 0
+
+        self._users = TTLCache(CACHE_MAX_USERS, CACHE_TTL)
+        self._counters = TTLCache(CACHE_MAX_USERS, CACHE_TTL, on_evict=self._forget_counters)
+        # counter_id -> user_id для закэшированных списков счетчиков
+        self._counter_owners = {}
+
+    def _call(self, method, args, kwargs):
+        connection = self.pool.writer() if method in self.WRITE_METHODS else self.pool.reader()
+        with connection as db:
+            started = time.perf_counter()
+            try:
+                return getattr(db, method)(*args, **kwargs)
+            except Exception as e:
+                DB_ERRORS.inc(method, type(e).__name__)
+                raise
+            finally:
+                DB_SECONDS.observe(time.perf_counter() - started, method)
+
+    async def run(self, method: str, *args, **kwargs):
+        """Выполняет метод Database в пуле потоков и возвращает его результат"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(self._call, method, args, kwargs)
+            )
+        finally:
+            if method in self.WRITE_METHODS and method not in self.UNVERSIONED_WRITES:
+                self.data_version += 1
+                self._invalidate(method, args, kwargs)
+
+    def _invalidate(self, method, args, kwargs):
+        """Сбрасывает кэш пользователей, которых затронула запись"""
+        if method == "add_readings_batch":
+            readings = args[0] if args else kwargs["readings"]
+            for counter_id, _ in readings:
+                self._invalidate_counter(counter_id)
+            return
+
+        arguments = _bind_arguments(method, args, kwargs)
+        if method in self.USER_WRITES:
+            self._invalidate_user(arguments[self.USER_WRITES[method]])
+        elif method in self.COUNTER_WRITES:
+            self._invalidate_counter(arguments[self.COUNTER_WRITES[method]])
+
+    def _invalidate_user(self, user_id):
+        self._users.pop(user_id)
+        counters = self._counters.pop(user_id)
+        if counters is not MISSING:
+            self._forget_counters(user_id, counters)
+
+    def _invalidate_counter(self, counter_id):
+        # Если владельца нет в кэше, то и сбрасывать нечего
+        user_id = self._counter_owners.get(counter_id)
+        if user_id is not None:
+            self._invalidate_user(user_id)
+
+    def _forget_counters(self, user_id, counters):
+        for counter in counters:
+            self._counter_owners.pop(counter[0], None)
+
+    async def _read_through(self, cache, method, user_id):
+        value = cache.get(user_id)
+        if value is not MISSING:
+            return value
+
+        version = self.data_version
+        value = await self.run(method, user_id)
+        # Если за время чтения прошла запись, результат мог устареть - не кэшируем
+        if version == self.data_version:
+            if cache is self._counters:
+                # Новый список заменяет закэшированный (например, после параллельного
+                # чтения): владельцы удаленных с тех пор счетчиков больше не нужны
+                previous = cache.pop(user_id)
+                if previous is not MISSING:
+                    self._forget_counters(user_id, previous)
+                for counter in value:
+                    self._counter_owners[counter[0]] = user_id
+            cache.put(user_id, value)
+        return value
+
+    async def get_user(self, user_id):
+        return await self._read_through(self._users, "get_user", user_id)
+
+    async def get_counters(self, user_id):
+        return await self._read_through(self._counters, "get_counters", user_id)
+
+    async def health_check(self) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.pool.health_check)
+
+    async def submit_reading(self, counter_id: int, value: int) -> Tuple[bool, Optional[int]]:
+        if self._readings_writer is None:
+            return await self.run("submit_reading", counter_id, value)
+        return await self._readings_writer.submit(counter_id, value)
+
+    async def add_reading(self, counter_id: int, value: int) -> bool:
+        saved, _ = await self.submit_reading(counter_id, value)
+        return saved
+
+    def stats(self) -> dict:
+        stats = self.pool.stats()
+        if self._readings_writer is not None:
+            stats["group_commit_batches"] = self._readings_writer.batches
+            stats["group_commit_readings"] = self._readings_writer.submitted
+            stats["group_commit_queue"] = self._readings_writer.queue_size()
+        for name, cache in (("users", self._users), ("counters", self._counters)):
+            stats[f"cache_{name}_entries"] = len(cache)
+            stats[f"cache_{name}_hits"] = cache.hits
+            stats[f"cache_{name}_misses"] = cache.misses
+        return stats
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not callable(getattr(Database, name, None)):
+            raise AttributeError(name)
+
+        async def method(*args, **kwargs):
+            return await self.run(name, *args, **kwargs)
+
+        method.__name__ = name
+        return method
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+
+@functools.lru_cache(maxsize=None)
+def _signature(method):
+    return inspect.signature(getattr(Database, method))
+
+
+def _bind_arguments(method, args, kwargs) -> dict:
+    """Аргументы вызова метода Database по именам"""
+    return _signature(method).bind(None, *args, **kwargs).arguments
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_db() -> AsyncDatabase:
+    """Возвращает общий для всего процесса AsyncDatabase над DATABASE_NAME"""
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = AsyncDatabase(ConnectionPool(DATABASE_NAME))
+        return _db
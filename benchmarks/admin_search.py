@@ -0,0 +1,78 @@
+"""
+Время поиска мешканцев и истории показаний в зависимости от размера базы.
+
+Запуск из корня проекта:
+    python -m benchmarks.admin_search --users 10000 100000
+
+Для каждого размера базы печатает p50/p99 search_users (номер рахунку,
+прізвище, адреса, перша й наступна сторінки) и get_reading_history.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.handler_latency import fill_database, percentile
+from database import Database
+
+SURNAMES = ["Шевченко", "Коваленко", "Бондаренко", "Ткаченко", "Кравченко", "Олійник", "Мельник", "Бойко"]
+STREETS = ["Хрещатик", "Шевченка", "Франка", "Лесі Українки", "Соборна", "Садова"]
+
+
+def personalize(db, users):
+    """Реальные по виду ПІБ и адреса вместо "User N": от них зависит FTS"""
+    db.cursor.executemany(
+        "UPDATE users SET full_name = ?, address = ? WHERE user_id = ?",
+        ((f"{random.choice(SURNAMES)} Іван {uid}", f"вул. {random.choice(STREETS)}, {uid % 200 + 1}", uid)
+         for uid in range(1, users + 1))
+    )
+    db.conn.commit()
+
+
+def measure(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "bench.db")
+            with contextlib.redirect_stdout(io.StringIO()):
+                fill_database(db_name, users, readings_per_counter=12)
+            db = Database(db_name)
+            personalize(db, users)
+
+            def next_page(query):
+                page, _ = db.search_users(query, limit=10)
+                db.search_users(query, after=page[-1]["id"], limit=10)
+
+            cases = {
+                "рахунок (точний)": lambda: db.search_users(str(100000 + random.randint(1, users)), limit=10),
+                "прізвище (префікс)": lambda: db.search_users(random.choice(SURNAMES)[:4], limit=10),
+                "прізвище + номер": lambda: db.search_users(f"Шевч {random.randint(1, users)}", limit=10),
+                "адреса, 2 сторінки": lambda: next_page(f"{random.choice(STREETS)} 1"),
+                "історія показань": lambda: db.get_reading_history(random.randint(1, users), limit=15),
+            }
+            print(f"{users} мешканців:")
+            for title, fn in cases.items():
+                latencies = measure(fn, args.repeats)
+                print(f"  {title:>20}: p50={percentile(latencies, 50) * 1000:.2f}мс "
+                      f"p99={percentile(latencies, 99) * 1000:.2f}мс")
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Влияние журнала действий на задержку обработчика.
+
+Запуск из корня проекта:
+    python -m benchmarks.audit --users 2000 --requests 3000
+
+"Обработчик" передачи показаний (get_last_reading + add_reading) без
+журнала, с буферизованным AuditLog и с записью в logs прямо в
+обработчике (одна транзакция на действие). Печатает p50/p99.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import logging
+import os
+import random
+import tempfile
+import time
+
+from async_database import AsyncDatabase, ConnectionPool
+from benchmarks.handler_latency import fill_database, percentile
+from utils.audit import AuditLog, READING_SUBMITTED
+
+
+class InlineAudit:
+    """Запись в журнал прямо в обработчике, без буфера"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def record(self, user_id, action, **details):
+        await self.db.write_audit_events([(user_id, action, str(details), time.strftime("%Y-%m-%d %H:%M:%S"))])
+
+
+async def run(db, audit, users, requests, interval):
+    values = itertools.count(1000)
+    latencies = []
+
+    async def handler(arrived):
+        user_id = random.randint(1, users)
+        counter_id = user_id * 2
+        await db.get_last_reading(counter_id)
+        value = next(values)
+        if await db.add_reading(counter_id, value):
+            if isinstance(audit, InlineAudit):
+                await audit.record(user_id, READING_SUBMITTED, counter_id=counter_id, value=value)
+            elif audit is not None:
+                audit.record(user_id, READING_SUBMITTED, counter_id=counter_id, value=value)
+        latencies.append(time.perf_counter() - arrived)
+
+    handlers = []
+    next_arrival = time.perf_counter()
+    for _ in range(requests):
+        handlers.append(asyncio.create_task(handler(next_arrival)))
+        next_arrival += interval
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+    await asyncio.gather(*handlers)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--interval-ms", type=float, default=2.0, help="інтервал між запитами")
+    args = parser.parse_args()
+    # Отклоненные (не возрастающие) показания в замере не важны
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            fill_database(db_name, args.users, readings_per_counter=1)
+        db = AsyncDatabase(ConnectionPool(db_name))
+
+        variants = [
+            ("без журналу", None),
+            ("AuditLog (буфер)", AuditLog(db, flush_interval=1.0)),
+            ("запис в обробнику", InlineAudit(db)),
+        ]
+        for title, audit in variants:
+            latencies = await run(db, audit, args.users, args.requests, args.interval_ms / 1000)
+            if isinstance(audit, AuditLog):
+                await audit.close()
+            print(f"{title:>18}: p50={percentile(latencies, 50) * 1000:.2f}мс "
+                  f"p99={percentile(latencies, 99) * 1000:.2f}мс")
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Синтетическая база "города" для бенчмарков: мешканцы с ПІБ, адресами и
+телефонами от Faker (uk_UA), по нескольку счетчиков и помесячные показания
+за несколько лет.
+
+Запуск из корня проекта (файл можно потом передать в --db бенчмарков):
+    python -m benchmarks.city city.db --users 30000 --years 3
+
+Генерация детерминирована (--seed): одна и та же команда в том же месяце
+дает одну и ту же базу, поэтому результаты разных коммитов сравнимы.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from faker import Faker
+
+from database import Database
+from migrations import rebuild_reading_summary
+
+# Сколько счетчиков у мешканца и с какой вероятностью
+METERS_WEIGHTS = {1: 0.25, 2: 0.45, 3: 0.2, 4: 0.1}
+
+# Расход воды на счетчик в месяц, м³
+MONTHLY_USAGE = (1, 9)
+
+# Пачка строк на один executemany
+BATCH = 10000
+
+# Telegram id мешканца uid (uid с 1) и название его i-го счетчика (i с 1)
+USER_ID_BASE = 100000000
+COUNTER_ALIAS = "Лічильник-{}"
+
+
+def _months(years: int, until: datetime):
+    """(год, месяц) за последние years лет по месяц until включительно"""
+    year, month = until.year, until.month
+    result = []
+    for _ in range(years * 12):
+        result.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return result[::-1]
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_city(db_name: str, users: int, years: int = 3, seed: int = 1, until: datetime = None) -> dict:
+    """
+    Заполняет пустую базу db_name показаниями за years лет по until
+    (по умолчанию прошлый месяц). Показания передаются с 20 по 28 число
+    каждого месяца; около 5% мешканцев пропускают месяц. Возвращает
+    количество созданных строк
+    """
+    rng = random.Random(seed)
+    fake = Faker("uk_UA")
+    fake.seed_instance(seed)
+    # По прошлый месяц: показания текущего месяца еще не переданы
+    months = _months(years, until or datetime.now().replace(day=1) - timedelta(days=1))
+
+    db = Database(db_name)
+    db.cursor.executemany(
+        "INSERT INTO users (user_id, full_name, phone_number, address, water_meters_count, account_number) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((USER_ID_BASE + uid, fake.name(), fake.phone_number(), f"{fake.city()}, {fake.street_address()}",
+          rng.choices(list(METERS_WEIGHTS), weights=list(METERS_WEIGHTS.values()))[0], f"{1000000 + uid}")
+         for uid in range(1, users + 1))
+    )
+    meters = db.cursor.execute("SELECT user_id, water_meters_count FROM users ORDER BY id").fetchall()
+    db.cursor.executemany(
+        "INSERT INTO counters (user_id, alias) VALUES (?, ?)",
+        ((user_id, COUNTER_ALIAS.format(i)) for user_id, count in meters for i in range(1, count + 1))
+    )
+    counters = [row[0] for row in db.cursor.execute("SELECT id FROM counters ORDER BY id").fetchall()]
+
+    def readings():
+        for counter_id in counters:
+            value = rng.randint(0, 500)
+            for year, month in months:
+                if rng.random() < 0.05:
+                    continue
+                value += rng.randint(*MONTHLY_USAGE)
+                moment = datetime(year, month, rng.randint(20, 28), rng.randint(7, 22), rng.randint(0, 59))
+                yield counter_id, value, moment.strftime("%Y-%m-%d %H:%M:%S")
+
+    count = 0
+    for batch in _batches(readings()):
+        db.cursor.executemany("INSERT INTO readings (counter_id, value, created_at) VALUES (?, ?, ?)", batch)
+        count += len(batch)
+    # Показания вставлены напрямую, минуя add_reading, поэтому сводку пересчитываем
+    rebuild_reading_summary(db.conn)
+    db.conn.commit()
+    db.close()
+    return {"users": users, "counters": len(counters), "readings": count}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетична база мешканців для бенчмарків")
+    parser.add_argument("database")
+    parser.add_argument("--users", type=int, default=30000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    created = generate_city(args.database, args.users, args.years, args.seed)
+    print(f"{created} за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,97 @@
+"""
+Стоимость маршрутизации одного обновления в зависимости от числа кнопок.
+
+Запуск из корня проекта:
+    python -m benchmarks.dispatch --buttons 10 50 200
+
+Для каждого числа кнопок через Dispatcher.feed_update (бот на заглушке
+сессии, обработчики пустые) меряются:
+    lambda - по обработчику с фильтром lambda message: message.text == ... на
+             кнопку, как было; нажимается последняя зарегистрированная кнопка;
+    index  - те же кнопки в ButtonIndex.
+И отдельно - обновление админ-бота, когда перед админ-роутером стоит
+пользовательский с N кнопками, без bind_to_bot и с ним.
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+
+from benchmarks.suite import FakeSession
+from utils.dispatch import ButtonIndex, bind_to_bot
+
+
+async def noop(message):
+    pass
+
+
+def lambda_router(texts):
+    router = Router()
+    for text in texts:
+        router.message(lambda message, text=text: message.text == text)(noop)
+    return router
+
+
+def index_router(texts):
+    router = Router()
+    buttons = ButtonIndex(router)
+    buttons(*texts)(noop)
+    return router
+
+
+def make_update(bot, update_id, text, chat_id=1):
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        },
+    }, context={"bot": bot})
+
+
+async def per_update_us(dp, bot, text, repeats):
+    updates = [make_update(bot, i, text) for i in range(repeats)]
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--buttons", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeats", type=int, default=5000)
+    args = parser.parse_args()
+
+    user_bot = Bot("1001:user", session=FakeSession())
+    admin_bot = Bot("1002:admin", session=FakeSession())
+
+    print(f"{'кнопок':>7} {'lambda, мкс':>12} {'index, мкс':>11} {'адмін без bind, мкс':>20} {'адмін з bind, мкс':>18}")
+    for count in args.buttons:
+        texts = [f"Кнопка {i}" for i in range(count)]
+        row = []
+        for build in (lambda_router, index_router):
+            dp = Dispatcher()
+            dp.include_router(build(texts))
+            row.append(await per_update_us(dp, user_bot, texts[-1], args.repeats))
+
+        # Обновление админ-бота проходит пользовательский роутер с lambda-кнопками
+        for bind in (False, True):
+            user_router, admin_router = lambda_router(texts), Router()
+            admin_router.message()(noop)
+            if bind:
+                bind_to_bot(user_router, user_bot)
+                bind_to_bot(admin_router, admin_bot)
+            dp = Dispatcher()
+            dp.include_router(user_router)
+            dp.include_router(admin_router)
+            row.append(await per_update_us(dp, admin_bot, "/start", args.repeats))
+
+        print(f"{count:>7} {row[0]:>12.1f} {row[1]:>11.1f} {row[2]:>20.1f} {row[3]:>18.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Скорость и пиковая память выгрузки отчета в Excel.
+
+Запуск из корня проекта:
+    python -m benchmarks.export --users 100000
+
+Каждый вариант запускается в отдельном процессе, чтобы ru_maxrss
+показывал пиковую память именно этого варианта:
+    legacy - как было: список словарей -> pandas DataFrame -> openpyxl,
+             затем второй проход по всем ячейкам для ширины колонок;
+    stream - Database.export_readings_report (курсор порциями -> write_only).
+"""
+import argparse
+import contextlib
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.handler_latency import fill_database
+from database import Database
+from utils.export import report_columns, user_row
+
+
+def legacy_export(db):
+    data = db.get_readings_report()
+    max_counters = max(user.get('water_meters_count', 0) for user in data)
+    columns = report_columns(max_counters)
+    df = pd.DataFrame([user_row(user, max_counters) for user in data], columns=columns)
+
+    filename = 'legacy_report.xlsx'
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Report', index=False)
+        worksheet = writer.sheets['Report']
+        for col in worksheet.columns:
+            max_length = max(len(str(cell.value)) for cell in col)
+            worksheet.column_dimensions[col[0].column_letter].width = (max_length + 2) * 1.2
+    return filename, len(data)
+
+
+def run_variant(mode, db_name):
+    db = Database(db_name)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "legacy":
+            filename, users = legacy_export(db)
+        else:
+            filename, users = db.export_readings_report()
+    elapsed = time.perf_counter() - started
+    os.remove(filename)
+
+    # ru_maxrss в Linux - в КиБ
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:>6}: {users} рахунків за {elapsed:.2f} с = {users / elapsed:.0f} рядків/с, "
+          f"пік RSS {peak_mb:.0f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--mode", choices=("legacy", "stream"))
+    parser.add_argument("--db")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_variant(args.mode, args.db)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            fill_database(db_name, args.users, readings_per_counter=3)
+        # Файлы отчетов пишутся во временный каталог, модули берутся из корня проекта
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, "PYTHONPATH": root}
+        for mode in ("legacy", "stream"):
+            subprocess.run([sys.executable, "-m", "benchmarks.export", "--mode", mode, "--db", db_name],
+                           check=True, cwd=tmp, env=env)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Локальная заглушка Bot API для нагрузочных тестов приема обновлений.
+
+Заглушка отвечает на методы Bot API, которые вызывают боты, запоминает
+адреса вебхуков из setWebhook и воспроизводит на них записанные
+обновления (файл JSONL, по одному Update в строке: его пишет бот при
+заданном UPDATES_RECORD_FILE или --generate).
+
+1. Запустить заглушку (она ждет setWebhook от бота):
+    python -m benchmarks.fake_telegram --updates updates.jsonl --rate 200
+2. Запустить бота против нее:
+    TELEGRAM_API_URL=http://127.0.0.1:8081 WEBHOOK_URL=http://127.0.0.1:8080 \\
+    BOT_TOKEN=1:user ADMIN_TOKEN=2:admin python main.py
+
+Печатает пропускную способность и p50/p99 ответа вебхука, а также
+количество сообщений, которые бот отправил в ответ.
+
+Синтетические обновления (без записи реального трафика) - диалоги
+мешканцев базы из benchmarks.city (те же --users): передача показаний,
+редактирование адреса и счетчиков, меню:
+    python -m benchmarks.city city.db --users 500
+    python -m benchmarks.fake_telegram --generate 5000 --users 500 --updates updates.jsonl
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from aiohttp import web, ClientSession
+
+from benchmarks.city import COUNTER_ALIAS, USER_ID_BASE
+from benchmarks.handler_latency import percentile
+from buttons import Buttons
+
+# Показания синтетических диалогов: заведомо больше любых показаний benchmarks.city
+FIRST_READING = 10 ** 6
+
+
+def generated_conversations(user_id: int, reading: int):
+    """Диалоги для синтетических обновлений: (вес, тексты сообщений по порядку)"""
+    counter = COUNTER_ALIAS.format(1)
+    return [
+        (5, [Buttons.SUBMIT_READINGS, counter, str(reading)]),
+        (1, [Buttons.EDIT_PROFILE, Buttons.ADDRESS, f"вул. Тестова, {user_id % 1000}"]),
+        (1, [Buttons.EDIT_COUNTERS, counter, Buttons.BACK]),
+        (1, [Buttons.ABOUT]),
+        (1, ["/start"]),
+    ]
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.webhooks = {}
+        self.calls = {}
+        self._message_ids = itertools.count(1)
+        self.webhook_ready = asyncio.Event()
+
+    def _message(self, chat_id, text=None, **extra):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+            **extra,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"].lower()
+        params = dict(await request.post()) if request.can_read_body else {}
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getme":
+            bot_id = int(token.split(":")[0])
+            result = {"id": bot_id, "is_bot": True, "first_name": f"bot{bot_id}", "username": f"bot{bot_id}"}
+        elif method == "setwebhook":
+            self.webhooks[token] = (params["url"], params.get("secret_token", ""))
+            self.webhook_ready.set()
+            result = True
+        elif method == "getupdates":
+            # Обновления приходят только через вебхук
+            await asyncio.sleep(1)
+            result = []
+        elif method in ("sendmessage", "editmessagetext"):
+            result = self._message(params.get("chat_id", 0), params.get("text"))
+        elif method == "senddocument":
+            result = self._message(params.get("chat_id", 0),
+                                   document={"file_id": "fake", "file_unique_id": "fake"})
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+def generate_texts(count, users):
+    """
+    (user_id, текст) для count обновлений. Одновременно идут диалоги
+    разных мешканцев, сообщения одного мешканца - в порядке его диалога
+    """
+    readings = {}
+    active = {}
+    for _ in range(count):
+        user_id = USER_ID_BASE + random.randint(1, users)
+        if not active.get(user_id):
+            readings[user_id] = readings.get(user_id, FIRST_READING) + random.randint(1, 9)
+            weights, conversations = zip(*generated_conversations(user_id, readings[user_id]))
+            active[user_id] = list(random.choices(conversations, weights=weights)[0])
+        yield user_id, active[user_id].pop(0)
+
+
+def generate_updates(count, users):
+    for update_id, (user_id, text) in enumerate(generate_texts(count, users), start=1):
+        yield {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+                "text": text,
+            },
+        }
+
+
+async def replay(url, secret, updates, rate, concurrency):
+    """Отправляет обновления на вебхук с заданной частотой; возвращает задержки ответов"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+    async with ClientSession() as session:
+        async def post(update):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        print(f"[ERROR] Вебхук відповів {response.status}")
+                latencies.append(time.perf_counter() - started)
+
+        tasks = []
+        for update in updates:
+            tasks.append(asyncio.create_task(post(update)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+    return latencies
+
+
+async def main(args):
+    with open(args.updates, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    telegram = FakeTelegram()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", telegram.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    print(f"Заглушка Bot API на http://127.0.0.1:{args.port}, чекаю setWebhook...")
+
+    await telegram.webhook_ready.wait()
+    # Даем боту установить вебхуки для обоих ботов
+    await asyncio.sleep(1)
+    url, secret = telegram.webhooks.get(args.token) or next(iter(telegram.webhooks.values()))
+
+    started = time.perf_counter()
+    latencies = await replay(url, secret, updates, args.rate, args.concurrency)
+    elapsed = time.perf_counter() - started
+    # Ответы бота могут отправляться уже после ответа вебхука
+    await asyncio.sleep(args.drain)
+
+    print(f"Оновлень: {len(latencies)} за {elapsed:.1f} с ({len(latencies) / elapsed:.0f}/с)")
+    print(f"Відповідь вебхука: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} мс")
+    print(f"Виклики Bot API: {telegram.calls}")
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка Bot API і відтворення оновлень")
+    parser.add_argument("--updates", default="updates.jsonl", help="файл з оновленнями (JSONL)")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="", help="токен бота, на чий вебхук відтворювати")
+    parser.add_argument("--rate", type=float, default=100, help="оновлень на секунду")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--drain", type=float, default=2.0, help="скільки секунд чекати відповідей бота")
+    parser.add_argument("--generate", type=int, help="згенерувати стільки оновлень у --updates і вийти")
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.generate:
+        with open(args.updates, "w", encoding="utf-8") as f:
+            for update in generate_updates(args.generate, args.users):
+                f.write(json.dumps(update, ensure_ascii=False) + "\n")
+        print(f"Записано {args.generate} оновлень у {args.updates}")
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,78 @@
+"""
+Стоимость одного перехода состояния FSM.
+
+Запуск из корня проекта:
+    python -m benchmarks.fsm_storage --users 2000 --transitions 20000
+
+Переход - то, что делает типичный шаг диалога: get_state, update_data,
+set_state и get_data. Сравниваются MemoryStorage aiogram, SQLiteStorage
+с отложенной записью и SQLiteStorage с записью при каждом изменении.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from async_database import AsyncDatabase, ConnectionPool
+from benchmarks.handler_latency import percentile
+from utils.fsm_storage import SQLiteStorage
+
+STATES = ["Registration:full_name", "Registration:phone_number", "Registration:address", None]
+
+
+async def run_transitions(storage, users, transitions, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def transition(step):
+        user_id = random.randint(1, users)
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        async with semaphore:
+            started = time.perf_counter()
+            await storage.get_state(key)
+            await storage.update_data(key, {"full_name": f"Користувач {user_id}", "step": step})
+            await storage.set_state(key, STATES[step % len(STATES)])
+            await storage.get_data(key)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(transition(step) for step in range(transitions)))
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    return elapsed, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--transitions", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = AsyncDatabase(ConnectionPool(os.path.join(tmp, "bench.db")))
+
+        variants = [
+            ("MemoryStorage", MemoryStorage()),
+            ("SQLite write-behind", SQLiteStorage(db)),
+            ("SQLite write-through", SQLiteStorage(db, flush_interval=0)),
+        ]
+        for title, storage in variants:
+            elapsed, latencies = await run_transitions(storage, args.users, args.transitions, args.concurrency)
+            flushes = getattr(storage, "flushes", "-")
+            print(f"{title:>21}: {args.transitions / elapsed:8.0f} переходів/с, "
+                  f"p50={percentile(latencies, 50) * 1e6:.0f}мкс p99={percentile(latencies, 99) * 1e6:.0f}мкс "
+                  f"транзакцій={flushes}")
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
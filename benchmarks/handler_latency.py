@@ -0,0 +1,112 @@
+"""
+Задержка обработчиков, пока параллельно строится большой отчет.
+
+Запуск из корня проекта:
+    python -m benchmarks.handler_latency --users 20000
+
+Сравнивает синхронный Database (запросы прямо в цикле событий) и
+AsyncDatabase (запросы в пуле потоков) и печатает p50/p99 времени
+"обработчика": get_user + get_counters + get_last_reading.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from async_database import AsyncDatabase, ConnectionPool
+from database import Database
+from migrations import rebuild_reading_summary
+
+
+def fill_database(db_name, users, readings_per_counter=12):
+    db = Database(db_name)
+    db.cursor.executemany(
+        "INSERT INTO users (user_id, full_name, phone_number, address, water_meters_count, account_number) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        ((uid, f"User {uid}", "+380000000000", f"вул. Тестова, {uid}", 2, str(100000 + uid))
+         for uid in range(1, users + 1))
+    )
+    db.cursor.executemany(
+        "INSERT INTO counters (user_id, alias) VALUES (?, ?)",
+        ((uid, f"Лічильник-{i}") for uid in range(1, users + 1) for i in (1, 2))
+    )
+    db.cursor.executemany(
+        "INSERT INTO readings (counter_id, value, created_at) VALUES (?, ?, ?)",
+        ((cid, month * 10, f"2024-{month:02d}-15 12:00:00")
+         for cid in range(1, users * 2 + 1) for month in range(1, readings_per_counter + 1))
+    )
+    # Показания вставлены напрямую, минуя add_reading, поэтому сводку пересчитываем
+    rebuild_reading_summary(db.conn)
+    db.conn.commit()
+    db.close()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def measure(db, users, duration):
+    """Гоняет отчеты в фоне и меряет время коротких запросов обработчика"""
+    latencies = []
+    stop = asyncio.Event()
+
+    async def call(method, *args):
+        result = getattr(db, method)(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def reports():
+        while not stop.is_set():
+            await call("get_readings_report", "01.01.2024", "31.12.2024")
+            await asyncio.sleep(0)
+
+    async def handler(arrived):
+        user_id = random.randint(1, users)
+        await call("get_user", user_id)
+        counters = await call("get_counters", user_id)
+        await call("get_last_reading", counters[0][0])
+        latencies.append(time.perf_counter() - arrived)
+
+    async def updates():
+        # Сообщения приходят равномерно; задержка считается от момента прихода,
+        # поэтому время, пока цикл событий занят отчетом, тоже учитывается
+        handlers = []
+        next_arrival = time.perf_counter()
+        while not stop.is_set():
+            handlers.append(asyncio.create_task(handler(next_arrival)))
+            next_arrival += 0.005
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        await asyncio.gather(*handlers)
+
+    tasks = [asyncio.create_task(reports()), asyncio.create_task(updates())]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = os.path.join(tmp, "bench.db")
+        fill_database(db_name, args.users)
+
+        for title, db in (("sync Database", Database(db_name)), ("AsyncDatabase", AsyncDatabase(ConnectionPool(db_name)))):
+            latencies = await measure(db, args.users, args.duration)
+            db.close()
+            print(f"{title:>14}: calls={len(latencies)} "
+                  f"p50={statistics.median(latencies) * 1000:.2f}ms "
+                  f"p99={percentile(latencies, 99) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
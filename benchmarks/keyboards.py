@@ -0,0 +1,110 @@
+"""
+Что стоит клавиатура в ответе бота: создание разметки и ее сериализация
+в форму запроса к Bot API.
+
+Запуск из корня проекта:
+    python -m benchmarks.keyboards --repeats 20000
+
+Для нескольких клавиатур сравниваются:
+    build  - как было: разметка создается заново и сериализуется
+             AiohttpSession при каждом ответе;
+    intern - общая разметка из keyboards и KeyboardSession, которая берет
+             готовый JSON.
+Время - на один ответ (SendMessage до FormData, без сети), память - пик
+выделенной tracemalloc памяти на один ответ. Перед замером проверяется,
+что поля формы в обоих вариантах совпадают.
+"""
+import argparse
+import time
+import tracemalloc
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+import keyboards
+from buttons import Buttons
+from handlers.admin_handlers import create_calendar_keyboard
+
+ALIASES = ("Кухня", "Ванна", "Туалет")
+
+
+def build_main_menu():
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text=Buttons.SUBMIT_READINGS)],
+            [KeyboardButton(text=Buttons.EDIT_PROFILE)],
+            [KeyboardButton(text=Buttons.ABOUT)],
+        ],
+        resize_keyboard=True
+    )
+
+
+def build_counters():
+    return ReplyKeyboardMarkup(
+        keyboard=[*[[KeyboardButton(text=alias)] for alias in ALIASES], [KeyboardButton(text=Buttons.BACK)]],
+        resize_keyboard=True
+    )
+
+
+# название -> (создание как было, общая клавиатура)
+CASES = {
+    "main_menu": (build_main_menu, keyboards.get_main_menu),
+    "counters": (build_counters, lambda: keyboards.get_counters_keyboard(ALIASES)),
+    "calendar": (create_calendar_keyboard.__wrapped__, lambda: create_calendar_keyboard(2025, 3)),
+}
+
+
+def reply(session, bot, get_keyboard, args=()):
+    method = SendMessage(chat_id=1, text="Оберіть лічильник:", reply_markup=get_keyboard(*args))
+    return session.build_form_data(bot, method)
+
+
+def form_fields(form) -> dict:
+    return {options["name"]: value for options, _, value in form._fields}
+
+
+def per_reply_us(session, bot, get_keyboard, args, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        reply(session, bot, get_keyboard, args)
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def per_reply_kb(session, bot, get_keyboard, args, repeats=200):
+    tracemalloc.start()
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        reply(session, bot, get_keyboard, args)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=20000)
+    args = parser.parse_args()
+
+    plain, interned = AiohttpSession(), keyboards.KeyboardSession()
+    bot = Bot("1001:bench", session=plain)
+
+    print(f"{'клавіатура':>10} {'build, мкс':>11} {'intern, мкс':>12} {'build, КБ':>10} {'intern, КБ':>11}")
+    for name, (build, shared) in CASES.items():
+        build_args = (2025, 3) if name == "calendar" else ()
+        assert form_fields(reply(interned, bot, shared)) == form_fields(reply(plain, bot, build, build_args)), name
+
+        row = [
+            per_reply_us(plain, bot, build, build_args, args.repeats),
+            per_reply_us(interned, bot, shared, (), args.repeats),
+            per_reply_kb(plain, bot, build, build_args),
+            per_reply_kb(interned, bot, shared, ()),
+        ]
+        print(f"{name:>10} {row[0]:>11.1f} {row[1]:>12.1f} {row[2]:>10.1f} {row[3]:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
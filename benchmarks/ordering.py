@@ -0,0 +1,86 @@
+"""
+Параллельная обработка обновлений с очередью на каждый чат.
+
+Запуск из корня проекта:
+    python -m benchmarks.ordering --chats 200 --taps 5 --limits 8 32 128
+
+Каждый чат присылает --taps обновлений подряд, все обновления запускаются
+задачами, как при polling. Обработчик ждет в среднем --io-ms (запросы к Bot API и
+базе) и записывает номер обновления. Для каждого варианта печатается
+время, число обновлений в секунду и сколько раз обновления одного чата
+обработались не в том порядке или одновременно:
+    без очереди - как было, все задачи сразу;
+    limit=N     - ChatSequencer с N одновременными обработчиками.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from aiogram import Bot, Dispatcher, Router
+
+from benchmarks.dispatch import make_update
+from benchmarks.suite import FakeSession
+from utils.ordering import setup_ordering
+
+
+def build(limit, io_seconds):
+    rng = random.Random(1)
+    seen = defaultdict(list)
+    running = set()
+    overlaps = 0
+
+    async def handler(message):
+        nonlocal overlaps
+        chat = message.chat.id
+        if chat in running:
+            overlaps += 1
+        running.add(chat)
+        await asyncio.sleep(rng.uniform(0, 2 * io_seconds))
+        running.discard(chat)
+        seen[chat].append(message.message_id)
+
+    router = Router()
+    router.message()(handler)
+    dp = Dispatcher()
+    dp.include_router(router)
+    if limit:
+        setup_ordering(dp, limit)
+    return dp, seen, lambda: overlaps
+
+
+async def run(bot, limit, chats, taps, io_seconds):
+    dp, seen, overlaps = build(limit, io_seconds)
+    updates = []
+    for tap in range(taps):
+        for chat in range(1, chats + 1):
+            updates.append(make_update(bot, tap * chats + chat, f"{tap}", chat_id=chat))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+    elapsed = time.perf_counter() - started
+    reordered = sum(ids != sorted(ids) for ids in seen.values())
+    return elapsed, len(updates) / elapsed, reordered, overlaps()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--taps", type=int, default=5)
+    parser.add_argument("--io-ms", type=float, default=20)
+    parser.add_argument("--limits", type=int, nargs="+", default=[8, 32, 128])
+    args = parser.parse_args()
+
+    bot = Bot("1001:user", session=FakeSession())
+    print(f"{'варіант':>12} {'час, с':>7} {'оновлень/с':>11} {'не по черзі':>12} {'одночасно':>10}")
+    # Прогрев: первые обновления платят за импорты и создание моделей
+    await run(bot, 0, 10, 1, 0)
+    for limit in [0, *args.limits]:
+        elapsed, rate, reordered, overlaps = await run(bot, limit, args.chats, args.taps, args.io_ms / 1000)
+        name = f"limit={limit}" if limit else "без черги"
+        print(f"{name:>12} {elapsed:>7.2f} {rate:>11.0f} {reordered:>12} {overlaps:>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
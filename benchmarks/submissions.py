@@ -0,0 +1,63 @@
+"""
+Пропускная способность передачи показаний в пиковый день.
+
+Запуск из корня проекта:
+    python -m benchmarks.submissions --counters 500 --concurrency 200
+
+"До": журнал DELETE, synchronous=FULL и отдельный commit на каждое
+показание. "После": WAL, synchronous=NORMAL и групповая фиксация.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from async_database import AsyncDatabase, ConnectionPool
+from benchmarks.handler_latency import fill_database
+
+BEFORE_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+async def submit_all(db, counters, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit(counter_id):
+        async with semaphore:
+            return await db.add_reading(counter_id, 1000)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(submit(counter_id) for counter_id in range(1, counters + 1)))
+    return time.perf_counter() - started, results.count(True)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counters", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    variants = (
+        ("до", dict(pragmas=BEFORE_PRAGMAS), 0),
+        ("після", dict(), 5),
+    )
+    for title, pool_options, group_commit_ms in variants:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "bench.db")
+            fill_database(db_name, args.counters // 2, readings_per_counter=1)
+            db = AsyncDatabase(ConnectionPool(db_name, **pool_options), group_commit_ms=group_commit_ms)
+
+            # Глушим построчный вывод add_reading, чтобы он не влиял на замер
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, saved = await submit_all(db, args.counters, args.concurrency)
+            stats = db.stats()
+            db.close()
+
+        print(f"{title:>5}: {saved}/{args.counters} показань за {elapsed:.2f} с "
+              f"= {saved / elapsed:.0f} показань/с, пачок: {stats.get('group_commit_batches', saved)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Передача показания: проверка и запись одним вызовом против чтения и записи.
+
+Запуск из корня проекта:
+    python -m benchmarks.submit_reading --counters 2000 --duplicates 3 --concurrency 200
+
+На каждый счетчик одновременно приходят --duplicates одинаковых показаний
+(двойное нажатие, повтор после таймаута). Варианты:
+    read+write - как было в process_reading: get_last_reading, проверка в
+                 обработчике, затем add_reading; ответ "збережено" не зависел
+                 от результата add_reading;
+    submit     - один вызов submit_reading.
+Печатаются время, обращения к пулу соединений (чтения и записи), сколько
+показаний записано и сколько раз обработчик ответил бы "збережено", хотя
+показание не записано.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from async_database import AsyncDatabase, ConnectionPool
+from benchmarks.handler_latency import fill_database
+
+
+async def read_write(db, counter_id, value):
+    last_reading = await db.get_last_reading(counter_id)
+    if last_reading is not None and value <= last_reading:
+        return False, False
+    saved = await db.add_reading(counter_id, value)
+    # Обработчик сообщал об успехе после прохождения проверки
+    return saved, True
+
+
+async def submit(db, counter_id, value):
+    saved, _ = await db.submit_reading(counter_id, value)
+    return saved, saved
+
+
+async def run(flow, db_name, args):
+    db = AsyncDatabase(ConnectionPool(db_name))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(counter_id):
+        async with semaphore:
+            return await flow(db, counter_id, 10 ** 6)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(counter_id) for counter_id in range(1, args.counters + 1)
+                                     for _ in range(args.duplicates)))
+    elapsed = time.perf_counter() - started
+    stats = db.stats()
+    db.close()
+    return {
+        "time": elapsed,
+        "reads": stats["reads"],
+        "writes": stats["writes"],
+        "saved": sum(saved for saved, _ in results),
+        "false_success": sum(reported and not saved for saved, reported in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counters", type=int, default=2000)
+    parser.add_argument("--duplicates", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(f"{'варіант':>10} {'час, с':>7} {'читань':>7} {'записів':>8} {'записано':>9} {'хибних успіхів':>15}")
+    for name, flow in (("read+write", read_write), ("submit", submit)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_name = os.path.join(tmp, "bench.db")
+            fill_database(db_name, args.counters // 2, readings_per_counter=1)
+            row = asyncio.run(run(flow, db_name, args))
+        print(f"{name:>10} {row['time']:>7.2f} {row['reads']:>7} {row['writes']:>8} {row['saved']:>9} "
+              f"{row['false_success']:>15}")
+
+
+if __name__ == "__main__":
+    main()
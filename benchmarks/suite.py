@@ -0,0 +1,355 @@
+"""
+Набор бенчмарков горячих путей базы и обработчиков с результатами в JSON.
+
+Запуск из корня проекта:
+    python -m benchmarks.suite --users 30000 --output bench.json
+    python -m benchmarks.suite --users 30000 --output bench-new.json --compare bench.json
+
+Заполняет временную базу генератором benchmarks.city (или берет готовую
+из --db; она будет изменена) и меряет:
+    lookups         - p50/p99 get_counters и get_last_reading (Database);
+    add_reading     - пропускная способность AsyncDatabase.add_reading
+                      при --concurrency одновременных показаниях;
+    report          - время и пиковая память get_readings_report за прошлый месяц;
+    export_to_excel - то же для get_readings_report + export_to_excel;
+    export_stream   - то же для export_readings_report;
+    handlers        - обработчики aiogram целиком (Dispatcher.feed_update) с
+                      ботом на заглушке сессии: "передати показники" ->
+                      лічильник -> значення для --sessions мешканцев.
+Каждый шаг идет в отдельном процессе, чтобы ru_maxrss был пиковой
+памятью именно этого шага. С --compare печатает изменение каждой метрики.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, GetMe, SendMessage
+from aiogram.types import Chat, Message, Update, User
+
+from async_database import AsyncDatabase, ConnectionPool
+from benchmarks.handler_latency import percentile
+from database import Database
+
+STEPS = ("lookups", "add_reading", "report", "export_to_excel", "export_stream", "handlers")
+
+
+def _latency(values) -> dict:
+    return {
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+    }
+
+
+def _memory_mb(field: str):
+    """Поле VmHWM (пик) или VmRSS (сейчас) из /proc/self/status, если оно есть"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss переживает exec и включал бы память родителя (генератора базы),
+    # поэтому в Linux берем пик этого процесса из VmHWM
+    peak = _memory_mb("VmHWM")
+    if peak is None:
+        # ru_maxrss в Linux - килобайты
+        peak = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return peak
+
+
+def _last_month():
+    end = datetime.now().replace(day=1) - timedelta(days=1)
+    return end.replace(day=1).strftime("%d.%m.%Y"), end.strftime("%d.%m.%Y")
+
+
+def _user_ids(db_name) -> list:
+    with contextlib.closing(sqlite3.connect(db_name)) as conn:
+        return [row[0] for row in conn.execute("SELECT user_id FROM users")]
+
+
+def step_lookups(db_name, args) -> dict:
+    db = Database(db_name)
+    user_ids = _user_ids(db_name)
+    rng = random.Random(args.seed)
+    counters_latency, reading_latency = [], []
+    for _ in range(args.lookups):
+        started = time.perf_counter()
+        counters = db.get_counters(rng.choice(user_ids))
+        counters_latency.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        db.get_last_reading(counters[0][0])
+        reading_latency.append(time.perf_counter() - started)
+    db.close()
+    return {"get_counters": _latency(counters_latency), "get_last_reading": _latency(reading_latency)}
+
+
+async def _add_readings(db_name, args) -> dict:
+    db = AsyncDatabase(ConnectionPool(db_name))
+    with contextlib.closing(sqlite3.connect(db_name)) as conn:
+        counters = [row[0] for row in conn.execute("SELECT id FROM counters ORDER BY random() LIMIT ?",
+                                                    (args.readings,))]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def submit(counter_id):
+        async with semaphore:
+            started = time.perf_counter()
+            # Заведомо больше любого сгенерированного показания
+            await db.add_reading(counter_id, 10 ** 9)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(counter_id) for counter_id in counters))
+    elapsed = time.perf_counter() - started
+    db.close()
+    return {"readings_per_s": round(len(counters) / elapsed, 1), **_latency(latencies)}
+
+
+def step_add_reading(db_name, args) -> dict:
+    return asyncio.run(_add_readings(db_name, args))
+
+
+def step_report(db_name, args) -> dict:
+    db = Database(db_name)
+    started = time.perf_counter()
+    users = len(db.get_readings_report(*_last_month()))
+    return {"seconds": round(time.perf_counter() - started, 3), "users": users, "peak_rss_mb": _peak_rss_mb()}
+
+
+def step_export_to_excel(db_name, args) -> dict:
+    db = Database(db_name)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # export_to_excel пишет файл в текущий каталог
+        os.chdir(tmp)
+        try:
+            started = time.perf_counter()
+            data = db.get_readings_report(*_last_month())
+            db.export_to_excel(data)
+            seconds = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+    return {"seconds": round(seconds, 3), "users": len(data), "peak_rss_mb": _peak_rss_mb()}
+
+
+def step_export_stream(db_name, args) -> dict:
+    db = Database(db_name)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        _, users = db.export_readings_report(*_last_month(), filename=os.path.join(tmp, "report.xlsx"))
+        seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 3), "users": users, "peak_rss_mb": _peak_rss_mb()}
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия бота без сети: на sendMessage/editMessageText отвечает
+    сообщением, на getMe - ботом, на остальное - True, и считает вызовы Bot API
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(message_id=next(self._message_ids), date=datetime.now(),
+                           chat=Chat(id=method.chat_id or 0, type="private"), text=method.text)
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="bench")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def _drive_handlers(args) -> dict:
+    # Обработчики берут базу из DATABASE_NAME при импорте, поэтому импортируются
+    # только в процессе шага, где DATABASE_NAME указывает на базу бенчмарка
+    from buttons import Buttons
+    from async_database import get_db
+    from config import DATABASE_NAME
+    from handlers.user_handlers import router
+    from utils.audit import get_audit
+    from utils.fsm_storage import create_fsm_storage
+
+    db = get_db()
+    session = FakeSession()
+    bot = Bot("1000:bench", session=session)
+    dp = Dispatcher(storage=create_fsm_storage(db))
+    dp.include_router(router)
+
+    user_ids = _user_ids(DATABASE_NAME)
+    rng = random.Random(args.seed)
+    residents = rng.sample(user_ids, min(args.sessions, len(user_ids)))
+    update_ids = itertools.count(1)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def send(user_id, text):
+        update = Update.model_validate({
+            "update_id": next(update_ids),
+            "message": {
+                "message_id": 1, "date": int(time.time()), "text": text,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            },
+        }, context={"bot": bot})
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+
+    async def conversation(user_id):
+        async with semaphore:
+            counters = await db.get_counters(user_id)
+            await send(user_id, Buttons.SUBMIT_READINGS)
+            await send(user_id, counters[0][2])
+            await send(user_id, str(10 ** 9))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(user_id) for user_id in residents))
+    elapsed = time.perf_counter() - started
+    await dp.storage.close()
+    await get_audit().close()
+    db.close()
+    return {
+        "updates_per_s": round(len(latencies) / elapsed, 1),
+        **_latency(latencies),
+        "bot_api_calls": sum(session.calls.values()),
+    }
+
+
+def step_handlers(db_name, args) -> dict:
+    logging.disable(logging.WARNING)
+    return asyncio.run(_drive_handlers(args))
+
+
+def run_step(step, db_name, args) -> dict:
+    """Запускает шаг в отдельном процессе и возвращает его результат"""
+    command = [
+        sys.executable, "-m", "benchmarks.suite", "--step", step, "--db", db_name,
+        "--seed", str(args.seed), "--lookups", str(args.lookups), "--readings", str(args.readings),
+        "--concurrency", str(args.concurrency), "--sessions", str(args.sessions),
+    ]
+    env = {**os.environ, "DATABASE_NAME": db_name, "AUDIT_ENABLED": "1"}
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(results: dict, prefix="") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(old: dict, new: dict):
+    """Печатает изменение каждой метрики относительно прошлого запуска"""
+    before, after = _flatten(old["results"]), _flatten(new["results"])
+    print(f"\nПорівняння з {old['meta']['commit']} ({old['meta']['date']}):")
+    for name, value in after.items():
+        if name not in before:
+            continue
+        change = (value - before[name]) / before[name] * 100 if before[name] else 0.0
+        print(f"  {name:>40}: {before[name]:>12} -> {value:<12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки бази та обробників")
+    parser.add_argument("--users", type=int, default=30000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="готова база (буде змінена); інакше генерується тимчасова")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS))
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=1000, help="мешканців у тесті обробників")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="попередній файл результатів")
+    parser.add_argument("--step", choices=STEPS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.step:
+        # Память процесса до шага (интерпретатор и импорты), чтобы пик шага было с чем сравнить
+        start_rss = _memory_mb("VmRSS")
+        result = globals()[f"step_{args.step}"](args.db, args)
+        if "peak_rss_mb" in result and start_rss is not None:
+            result["start_rss_mb"] = start_rss
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = args.db
+        meta = {}
+        if db_name is None:
+            from benchmarks.city import generate_city
+            db_name = os.path.join(tmp, "city.db")
+            started = time.perf_counter()
+            meta["city"] = generate_city(db_name, args.users, args.years, args.seed)
+            print(f"База: {meta['city']} за {time.perf_counter() - started:.1f} с")
+
+        results = {}
+        for step in args.steps:
+            results[step] = run_step(step, db_name, args)
+            print(f"{step:>16}: {results[step]}")
+
+    report = {
+        "meta": {
+            **meta,
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "args": {key: value for key, value in vars(args).items() if key not in ("step", "output", "compare")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результати: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Лимит частоты запросов под флудом.
+
+Запуск из корня проекта:
+    python -m benchmarks.throttling --honest 5000 --abusers 20 --flood 2000
+
+Честные мешканцы проходят диалог передачи показаний (кнопка, счетчик,
+число), несколько "скриптов" жмут кнопку передачи показаний --flood раз
+подряд. Обработчики - заглушки с именами настоящих, каждый вызов считается
+запросом к базе. Сравниваются вариант без лимита и с Throttler (лимиты из
+config): сколько обработчиков выполнено для честных и для флуда, сколько
+честных запросов отклонено, сколько ответов "зачекайте" отправлено и
+сколько баков осталось в памяти при --max-users.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from aiogram import Bot, Dispatcher, Router
+
+from benchmarks.dispatch import make_update
+from benchmarks.suite import FakeSession
+from buttons import Buttons
+from config import THROTTLE_LIMITS
+from utils.dispatch import ButtonIndex
+from utils.throttling import Throttler, setup_throttling
+
+HONEST_IDS = 1
+ABUSER_IDS = 10 ** 9
+
+
+# Вызовы обработчиков: честных (False) и флуда (True)
+CALLS = Counter()
+
+
+async def start_submit_readings(message):
+    CALLS[message.chat.id >= ABUSER_IDS] += 1
+
+
+async def process_reading(message):
+    CALLS[message.chat.id >= ABUSER_IDS] += 1
+
+
+def benchmark_limits() -> str:
+    """Лимиты из config для заглушек этого модуля: обработчики ключуются полным именем"""
+    return THROTTLE_LIMITS.replace("handlers.user_handlers.", f"{__name__}.")
+
+
+def build(throttler):
+    CALLS.clear()
+    router = Router()
+    buttons = ButtonIndex(router)
+    buttons(Buttons.SUBMIT_READINGS)(start_submit_readings)
+    router.message()(process_reading)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    if throttler:
+        setup_throttling(dp, throttler)
+    return dp, CALLS
+
+
+async def run(throttler, args):
+    session = FakeSession()
+    bot = Bot("1001:user", session=session)
+    dp, calls = build(throttler)
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def honest(chat_id):
+        for text in (Buttons.SUBMIT_READINGS, "Кухня", "123"):
+            await dp.feed_update(bot, make_update(bot, next(update_ids), text, chat_id=chat_id))
+
+    async def abuser(chat_id):
+        for _ in range(args.flood):
+            await dp.feed_update(bot, make_update(bot, next(update_ids), Buttons.SUBMIT_READINGS, chat_id=chat_id))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(honest(HONEST_IDS + i) for i in range(args.honest)),
+        *(abuser(ABUSER_IDS + i) for i in range(args.abusers)),
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "time": elapsed,
+        "honest": calls[False],
+        "flood": calls[True],
+        "rejected": args.honest * 3 - calls[False],
+        "replies": sum(session.calls.values()),
+        "buckets": throttler.stats()["default_users"] if throttler else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--honest", type=int, default=5000)
+    parser.add_argument("--abusers", type=int, default=20)
+    parser.add_argument("--flood", type=int, default=2000)
+    parser.add_argument("--max-users", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'варіант':>10} {'час, с':>7} {'чесні':>7} {'флуд':>7} {'відхилено чесних':>17} "
+          f"{'відповідей':>11} {'баків':>6}")
+    throttler = Throttler(limits=benchmark_limits(), max_users=args.max_users)
+    for name, throttler in (("без ліміту", None), ("throttler", throttler)):
+        row = await run(throttler, args)
+        print(f"{name:>10} {row['time']:>7.2f} {row['honest']:>7} {row['flood']:>7} {row['rejected']:>17} "
+              f"{row['replies']:>11} {row['buckets']:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
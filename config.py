@@ -6,4 +6,100 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
\ No newline at end of file
+DATABASE_NAME = os.getenv("DATABASE_NAME", "meter_bot.db")
+
+# Количество соединений для чтения в общем пуле (писатель всегда один)
+DB_READ_CONNECTIONS = int(os.getenv("DB_READ_CONNECTIONS", 4))
+# Сколько секунд ждать свободное соединение из пула
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Сколько обновлений разных чатов обрабатывается одновременно (обновления одного чата - по очереди)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", 64))
+
+# Ограничение частоты запросов пользователя ("N/S" - N запросов за S секунд):
+# общее на все обработчики и отдельное для дорогих обработчиков (по модулю и имени функции)
+THROTTLE_DEFAULT = os.getenv("THROTTLE_DEFAULT", "20/10")
+THROTTLE_LIMITS = os.getenv(
+    "THROTTLE_LIMITS",
+    "handlers.user_handlers.start_submit_readings=10/60,"
+    "handlers.user_handlers.process_counter_selection=20/60,"
+    "handlers.user_handlers.process_reading=20/60,"
+    "handlers.user_handlers.start_edit_counters=10/60,"
+    "handlers.user_handlers.process_edit_counter_selection=20/60"
+)
+# Сколько пользователей помнить (давно неактивные вытесняются)
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", 50000))
+
+# PRAGMA для каждого соединения с базой
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+# Отрицательное значение - размер в КиБ (по умолчанию около 20 МБ)
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", -20000))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 256 * 1024 * 1024))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", 5000))
+
+# Групповая фиксация показаний: сколько миллисекунд собирать пачку (0 - выключено)
+DB_GROUP_COMMIT_MS = float(os.getenv("DB_GROUP_COMMIT_MS", 5))
+DB_GROUP_COMMIT_MAX = int(os.getenv("DB_GROUP_COMMIT_MAX", 500))
+
+# Формирование отчетов: сколько отчетов строится одновременно и сколько может ждать в очереди
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 1))
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", 4))
+
+# Кэш готовых отчетов: сколько периодов хранить и сколько секунд
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 32))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", 3600))
+
+# Кэш профилей и счетчиков пользователей в памяти процесса
+CACHE_MAX_USERS = int(os.getenv("CACHE_MAX_USERS", 10000))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+
+# Рассылки: общий лимит Telegram около 30 сообщений в секунду на бота
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", 5))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 10))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 5))
+
+# Прием обновлений: если задан WEBHOOK_URL (публичный адрес сервера, например
+# https://bot.example.com), оба бота работают через вебхук на том же
+# HTTP-сервере, что и /health; иначе - long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (по умолчанию случайный при каждом запуске)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEB_PORT = int(os.getenv("PORT", 8080))
+# Адрес Bot API (например, локальной заглушки из benchmarks/fake_telegram.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+# Файл, в который записываются все входящие обновления (для воспроизведения под нагрузкой)
+UPDATES_RECORD_FILE = os.getenv("UPDATES_RECORD_FILE")
+
+# Хранилище состояний диалогов: "sqlite" (в файле базы, переживает перезапуск) или "memory"
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+# Через сколько секунд без изменений незаконченный диалог забывается
+FSM_TTL = int(os.getenv("FSM_TTL", 2 * 24 * 3600))
+# Как часто (сек) изменения состояний сбрасываются в базу (0 - сразу при каждом изменении)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", 0.5))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))
+
+# Логирование: общий уровень, уровни отдельных модулей ("database=WARNING,handlers=DEBUG"),
+# формат ("json" или "text") и выборка отладочных записей (пишется каждая N-я запись одного вида)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "aiogram.event=WARNING")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_DEBUG_SAMPLE = int(os.getenv("LOG_DEBUG_SAMPLE", 100))
+
+# Журнал действий пользователей (таблица logs): пишется пачками в фоне
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "1") == "1"
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))
+# Сколько записей может ждать в памяти; при переполнении отбрасываются самые старые
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", 10000))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", 365))
+
+# Напоминания о показаниях: часовой пояс, за сколько дней до конца месяца
+# (несколько волн; 0 - последний день месяца) и в котором часу
+TIMEZONE = os.getenv("TIMEZONE", "Europe/Kyiv")
+REMINDER_WAVES = tuple(int(days) for days in os.getenv("REMINDER_WAVES", "5,2,0").split(","))
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", 10))
+# Сколько секунд после назначенного времени пропущенное напоминание еще отправляется
+REMINDER_MISFIRE_GRACE = int(os.getenv("REMINDER_MISFIRE_GRACE", 2 * 24 * 3600))
+# Сколько получателей напоминания читать из базы за раз
+REMINDER_PAGE_SIZE = int(os.getenv("REMINDER_PAGE_SIZE", 500))
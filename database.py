@@ -1,59 +1,178 @@
+import logging
+import os
+import re
 import sqlite3
 from datetime import datetime
-from typing import List, Dict, Any
+from zoneinfo import ZoneInfo
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import pandas as pd
-import traceback
+
+from config import DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_BUSY_TIMEOUT, TIMEZONE
+from migrations import apply_migrations
+from utils.export import BASE_COLUMNS, report_columns, write_report
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": DB_JOURNAL_MODE,
+    "synchronous": DB_SYNCHRONOUS,
+    "cache_size": DB_CACHE_SIZE,
+    "mmap_size": DB_MMAP_SIZE,
+    "busy_timeout": DB_BUSY_TIMEOUT,
+}
+
+# Время показаний - по часовому поясу мешканцев, как у напоминаний, а не
+# по часам сервера: по нему показание попадает в месяц readings_monthly
+TZ = ZoneInfo(TIMEZONE)
+
+GET_COUNTERS_QUERY = "SELECT * FROM counters WHERE user_id = ? ORDER BY id"
+
+GET_LAST_READING_QUERY = "SELECT last_reading FROM counters WHERE id = ? AND last_reading_at IS NOT NULL"
+
+# Проверка и обновление сводки одним оператором: строка меняется, только если
+# новое показание больше последнего. У счетчика без показаний last_reading = 0,
+# поэтому, как и прежде в add_reading, первое показание должно быть больше 0.
+# Правые части SET видят старую строку, RETURNING - новую, поэтому прежнее
+# последнее показание возвращается из previous_reading (NULL для первого
+# показания счетчика: previous_reading_at заполняется только вместе с last_reading_at)
+SUBMIT_READING_QUERY = """
+    UPDATE counters SET
+        previous_reading = CASE WHEN last_reading_at IS NULL THEN previous_reading ELSE last_reading END,
+        previous_reading_at = CASE WHEN last_reading_at IS NULL THEN previous_reading_at ELSE last_reading_at END,
+        last_reading = :value,
+        last_reading_at = :now
+    WHERE id = :counter_id AND COALESCE(last_reading, 0) < :value
+    RETURNING CASE WHEN previous_reading_at IS NOT NULL THEN previous_reading END
+"""
+
+# Последнее и предпоследнее показания каждого счетчика за период.
+# Если последнее показание счетчика попадает в период, оба значения берутся
+# из сводки в counters; иначе (период в прошлом) два показания ищутся
+# по индексу readings(counter_id, created_at). Время отчета растет
+# с количеством счетчиков, а не со всей историей показаний
+READINGS_REPORT_QUERY = """
+WITH LatestReadings AS (
+    SELECT
+        c.id AS counter_id,
+        c.last_reading AS value,
+        c.last_reading_at AS created_at,
+        CASE WHEN c.previous_reading_at >= :start THEN c.previous_reading END AS prev_value,
+        CASE WHEN c.previous_reading_at >= :start THEN c.previous_reading_at END AS prev_date
+    FROM counters c
+    WHERE c.last_reading_at BETWEEN :start AND :end
+    UNION ALL
+    SELECT
+        c.id,
+        r.value,
+        r.created_at,
+        p.value,
+        p.created_at
+    FROM counters c
+    INNER JOIN readings r ON r.id = (
+        SELECT id FROM readings
+        WHERE counter_id = c.id AND created_at BETWEEN :start AND :end
+        ORDER BY created_at DESC LIMIT 1
+    )
+    LEFT JOIN readings p ON p.id = (
+        SELECT id FROM readings
+        WHERE counter_id = c.id AND created_at >= :start AND created_at < r.created_at
+        ORDER BY created_at DESC LIMIT 1
+    )
+    WHERE c.last_reading_at > :end
+)
+SELECT 
+    u.user_id,
+    u.account_number,
+    u.full_name,
+    u.phone_number,
+    u.address,
+    u.water_meters_count,
+    c.id AS counter_id,
+    c.alias,
+    lr.value AS current_reading,
+    lr.created_at AS current_date,
+    lr.prev_value,
+    lr.prev_date
+FROM users u
+INNER JOIN counters c ON c.user_id = u.user_id
+INNER JOIN LatestReadings lr ON c.id = lr.counter_id
+ORDER BY u.account_number, u.user_id, c.alias
+"""
+
+# Сколько строк отчета забирать из курсора за раз
+REPORT_CHUNK_SIZE = 1000
+
+# Поиск мешканцев для админов: префикс номера рахунку (idx_users_account)
+# или начала слов ПІБ/адреси (users_fts). Совпадения собираются из двух
+# индексов отдельно (с OR SQLite перебирал бы всю таблицу), страницы - по id
+# (keyset): {op} и {order} задают направление от :cursor
+SEARCH_USERS_QUERY = """
+SELECT id, user_id, full_name, address, account_number FROM users
+WHERE id IN (
+        SELECT id FROM users WHERE account_number >= :query AND account_number < :query_end
+        UNION ALL
+        SELECT rowid FROM users_fts WHERE users_fts MATCH :match
+    )
+    AND id {op} :cursor
+ORDER BY id {order}
+LIMIT :limit
+"""
+
+# История показаний всех счетчиков мешканца, новые сверху. Страницы - по
+# (created_at, id) показания :cursor; по индексу readings(counter_id, created_at)
+READING_HISTORY_QUERY = """
+SELECT r.id, c.alias, r.value, r.created_at FROM readings r
+INNER JOIN counters c ON c.id = r.counter_id
+WHERE c.user_id = :user_id
+    AND (:cursor IS NULL OR (r.created_at, r.id) {op} (SELECT created_at, id FROM readings WHERE id = :cursor))
+ORDER BY r.created_at {order}, r.id {order}
+LIMIT :limit
+"""
+
+# Пользователи, у которых хотя бы по одному счетчику нет показаний за месяц
+# :month (YYYY-MM). Проверка по первичному ключу readings_monthly, без
+# просмотра самих показаний
+USERS_MISSING_READINGS_QUERY = """
+SELECT DISTINCT c.user_id FROM counters c
+WHERE NOT EXISTS (
+    SELECT 1 FROM readings_monthly m WHERE m.counter_id = c.id AND m.month = :month
+)
+"""
+
+# Очередная страница получателей рассылки, которым она еще не доставлена;
+# с :month - только те, кто до сих пор не передал показания за месяц.
+# Проверка связана с каждой строкой страницы (EXISTS по idx_counters_user_id),
+# а не строит список всех должников заново для каждой страницы
+BROADCAST_RECIPIENTS_QUERY = """
+SELECT d.user_id FROM broadcast_deliveries d
+WHERE d.campaign = :campaign
+    AND d.user_id > :after
+    AND d.status NOT IN ('sent', 'blocked', 'invalid')
+    AND (:month IS NULL OR EXISTS (
+        SELECT 1 FROM counters c
+        WHERE c.user_id = d.user_id AND NOT EXISTS (
+            SELECT 1 FROM readings_monthly m WHERE m.counter_id = c.id AND m.month = :month
+        )
+    ))
+ORDER BY d.user_id
+LIMIT :limit
+"""
 
 
 class Database:
-    def __init__(self, db_name="meter_bot.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
-        self._create_tables()
+    # Поля профиля, которые пользователь может менять сам
+    EDITABLE_USER_FIELDS = ("full_name", "address", "water_meters_count", "account_number")
 
-    def _create_tables(self):
-        self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL UNIQUE,
-                    full_name TEXT NOT NULL,
-                    phone_number TEXT NOT NULL,
-                    address TEXT NOT NULL,
-                    water_meters_count INTEGER NOT NULL,
-                    account_number TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS counters (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                alias TEXT NOT NULL,
-                last_reading INTEGER DEFAULT 0,
-                previous_reading INTEGER DEFAULT 0,  
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS readings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                counter_id INTEGER NOT NULL,
-                value INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (counter_id) REFERENCES counters (id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
+    def __init__(self, db_name="meter_bot.db", check_same_thread=True, pragmas=None):
+        self.conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
+        self.cursor = self.conn.cursor()
+        self._configure(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        apply_migrations(self.conn)
 
-        self.conn.commit()
+    def _configure(self, pragmas):
+        """Применяет PRAGMA к соединению (journal_mode первым, до любых запросов)"""
+        for name, value in pragmas.items():
+            self.cursor.execute(f"PRAGMA {name} = {value}")
 
     def add_user(self, user_id, full_name, phone_number, address, water_meters_count, account_number):
         self.cursor.execute("""
@@ -62,82 +181,159 @@ class Database:
         """, (user_id, full_name, phone_number, address, water_meters_count, account_number))
         self.conn.commit()
 
+    def register_user(self, user_id, full_name, phone_number, address, water_meters_count, account_number):
+        """
+        Регистрирует пользователя вместе со всеми его счетчиками одной
+        транзакцией: либо пользователь создан со всеми счетчиками, либо ничего
+        """
+        try:
+            self.cursor.execute("BEGIN TRANSACTION")
+            self.cursor.execute("""
+                INSERT INTO users (user_id, full_name, phone_number, address, water_meters_count, account_number)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, full_name, phone_number, address, water_meters_count, account_number))
+            self.cursor.executemany(
+                "INSERT INTO counters (user_id, alias) VALUES (?, ?)",
+                [(user_id, f"Лічильник-{i}") for i in range(1, water_meters_count + 1)]
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
     def get_user(self, user_id):
         self.cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
         return self.cursor.fetchone()
 
     def get_counters(self, user_id):
-        self.cursor.execute("SELECT * FROM counters WHERE user_id = ? ORDER BY id", (user_id,))
+        self.cursor.execute(GET_COUNTERS_QUERY, (user_id,))
         return self.cursor.fetchall()
 
     def get_last_reading(self, counter_id):
-        self.cursor.execute("SELECT value FROM readings WHERE counter_id = ? ORDER BY created_at DESC LIMIT 1",
-                            (counter_id,))
+        self.cursor.execute(GET_LAST_READING_QUERY, (counter_id,))
         result = self.cursor.fetchone()
         return result[0] if result else None
 
-    def add_reading(self, counter_id: int, value: int) -> bool:
+    def _write_reading(self, counter_id: int, value: int) -> Tuple[bool, Optional[int]]:
         """
-        Добавляет новые показания счетчика в базу данных
+        Проверяет и записывает показания внутри уже открытой транзакции,
+        ничего не фиксируя. Возвращает (записано ли, предыдущее показание):
+        при записи - последнее показание до нее (None, если это первое),
+        при отказе - текущее показание, которое новое не превысило
+        (0, если показаний еще не было)
+        """
+        current_datetime = datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+        # Проверка и обновление сводки в counters - один оператор, поэтому
+        # одновременные показания одного счетчика проверяются по очереди
+        self.cursor.execute(SUBMIT_READING_QUERY, {"counter_id": counter_id, "value": value, "now": current_datetime})
+        row = self.cursor.fetchone()
+        if row is None:
+            # Ничего не записано: счетчика нет или показание не больше текущего
+            self.cursor.execute("SELECT COALESCE(last_reading, 0) FROM counters WHERE id = ?", (counter_id,))
+            current = self.cursor.fetchone()
+            if current is None:
+                raise ValueError(f"Счетчик {counter_id} не найден")
+            return False, current[0]
+
+        # Добавляем запись в таблицу показаний
+        self.cursor.execute(
+            "INSERT INTO readings (counter_id, value, created_at) VALUES (?, ?, ?)",
+            (counter_id, value, current_datetime)
+        )
+
+        # И помесячный итог
+        self.cursor.execute("""
+            INSERT INTO readings_monthly (counter_id, month, readings_count, last_value, last_date)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (counter_id, month) DO UPDATE SET
+                readings_count = readings_count + 1,
+                last_value = excluded.last_value,
+                last_date = excluded.last_date
+        """, (counter_id, current_datetime[:7], value, current_datetime))
+
+        return True, row[0]
+
+    def submit_reading(self, counter_id: int, value: int) -> Tuple[bool, Optional[int]]:
+        """
+        Проверяет и записывает показания счетчика одной транзакцией
         Args:
             counter_id: ID счетчика
             value: текущие показания
         Returns:
-            bool: True если успешно, False если ошибка
+            (записано ли, предыдущее показание): при записи - показание до
+            нее (None для первого), при отказе - текущее показание, которое
+            новое не превысило; (False, None) - счетчика нет или ошибка базы
         """
         try:
-            current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # Получаем текущие показания счетчика
-            self.cursor.execute("SELECT last_reading FROM counters WHERE id = ?", (counter_id,))
-            last_reading_result = self.cursor.fetchone()
-            last_reading = last_reading_result[0] if last_reading_result else None
-
-            # Проверяем что новые показания больше предыдущих
-            if last_reading is not None and value <= last_reading:
-                raise ValueError(f"Новые показания ({value}) должны быть больше предыдущих ({last_reading})")
-
             # Начинаем транзакцию
             self.cursor.execute("BEGIN TRANSACTION")
 
-            # Добавляем запись в таблицу показаний
-            self.cursor.execute(
-                "INSERT INTO readings (counter_id, value, created_at) VALUES (?, ?, ?)",
-                (counter_id, value, current_datetime)
-            )
-
-            # Обновляем показания в таблице counters:
-            if last_reading is None:
-                # Первое показание - только обновляем last_reading
-                self.cursor.execute(
-                    "UPDATE counters SET last_reading = ? WHERE id = ?",
-                    (value, counter_id)
-                )
-            else:
-                # Последующие показания - перемещаем last_reading в previous_reading
-                self.cursor.execute(
-                    "UPDATE counters SET previous_reading = last_reading, last_reading = ? WHERE id = ?",
-                    (value, counter_id)
-                )
+            saved, previous = self._write_reading(counter_id, value)
 
             # Фиксируем изменения
             self.conn.commit()
 
-            print(f"[SUCCESS] Добавлены показания: счетчик {counter_id}, значение {value}, дата {current_datetime}")
-            return True
+            if saved:
+                logger.debug("Показання збережено", extra={"counter_id": counter_id, "value": value})
+            else:
+                logger.info("Показання не більші за поточні", extra={"counter_id": counter_id, "value": value})
+            return saved, previous
 
         except sqlite3.Error as e:
             self.conn.rollback()
-            print(f"[ERROR] Ошибка SQLite при добавлении показаний: {e}")
-            return False
+            logger.error("Помилка SQLite при збереженні показань: %s", e, extra={"counter_id": counter_id})
+            return False, None
         except ValueError as e:
             self.conn.rollback()
-            print(f"[ERROR] Ошибка валидации: {e}")
-            return False
-        except Exception as e:
+            logger.warning("Показання не пройшли перевірку: %s", e, extra={"counter_id": counter_id})
+            return False, None
+        except Exception:
             self.conn.rollback()
-            print(f"[ERROR] Неожиданная ошибка: {e}")
-            return False
+            logger.exception("Неочікувана помилка при збереженні показань", extra={"counter_id": counter_id})
+            return False, None
+
+    def add_reading(self, counter_id: int, value: int) -> bool:
+        """
+        Добавляет новые показания счетчика в базу данных
+        Returns:
+            bool: True если успешно, False если показания не больше текущих или ошибка
+        """
+        saved, _ = self.submit_reading(counter_id, value)
+        return saved
+
+    def add_readings_batch(self, readings: List[tuple]) -> List[Tuple[bool, Optional[int]]]:
+        """
+        Записывает пачку показаний одной транзакцией (один fsync на всю пачку).
+        Каждое показание пишется под своим SAVEPOINT, поэтому ошибка в одном
+        не отменяет остальные; показания одного счетчика проверяются по
+        порядку пачки
+        Args:
+            readings: список пар (counter_id, value)
+        Returns:
+            список результатов в том же порядке, как от submit_reading
+        """
+        results = []
+        try:
+            self.cursor.execute("BEGIN TRANSACTION")
+            for counter_id, value in readings:
+                self.cursor.execute("SAVEPOINT reading")
+                try:
+                    results.append(self._write_reading(counter_id, value))
+                except (sqlite3.Error, ValueError) as e:
+                    self.cursor.execute("ROLLBACK TO reading")
+                    logger.warning("Показання не збережено: %s", e, extra={"counter_id": counter_id})
+                    results.append((False, None))
+                self.cursor.execute("RELEASE reading")
+            self.conn.commit()
+            logger.debug("Записано пачку показань",
+                         extra={"saved": sum(saved for saved, _ in results), "total": len(results)})
+            return results
+
+        except Exception:
+            self.conn.rollback()
+            logger.exception("Помилка при записі пачки показань", extra={"total": len(readings)})
+            return [(False, None)] * len(readings)
 
     def get_all_users(self):
         self.cursor.execute("SELECT * FROM users")
@@ -147,6 +343,50 @@ class Database:
         self.cursor.execute("INSERT INTO counters (user_id, alias) VALUES (?, ?)", (user_id, alias))
         self.conn.commit()
 
+    def update_user_field(self, user_id, field, value):
+        """Обновляет одно поле профиля пользователя"""
+        if field not in self.EDITABLE_USER_FIELDS:
+            raise ValueError(f"Поле {field} не можна редагувати")
+        self.cursor.execute(f"UPDATE users SET {field} = ? WHERE user_id = ?", (value, user_id))
+        self.conn.commit()
+
+    def rename_counter(self, counter_id, alias):
+        self.cursor.execute("UPDATE counters SET alias = ? WHERE id = ?", (alias, counter_id))
+        self.conn.commit()
+
+    def delete_counter(self, counter_id):
+        self.cursor.execute("DELETE FROM counters WHERE id = ?", (counter_id,))
+        self.conn.commit()
+
+    def set_meters_count(self, user_id, new_count):
+        """
+        Меняет количество счетчиков пользователя одной транзакцией:
+        добавляет недостающие или удаляет лишние (начиная с последнего).
+        Сверяется с фактическим числом строк в counters
+        """
+        try:
+            self.cursor.execute("BEGIN TRANSACTION")
+            self.cursor.execute("UPDATE users SET water_meters_count = ? WHERE user_id = ?", (new_count, user_id))
+
+            self.cursor.execute("SELECT COUNT(*) FROM counters WHERE user_id = ?", (user_id,))
+            current_count = self.cursor.fetchone()[0]
+            if new_count > current_count:
+                self.cursor.executemany(
+                    "INSERT INTO counters (user_id, alias) VALUES (?, ?)",
+                    [(user_id, f"Лічильник-{i}") for i in range(current_count + 1, new_count + 1)]
+                )
+            elif new_count < current_count:
+                self.cursor.execute("""
+                    DELETE FROM counters WHERE id IN (
+                        SELECT id FROM counters WHERE user_id = ? ORDER BY id LIMIT -1 OFFSET ?
+                    )
+                """, (user_id, new_count))
+
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
     def _convert_date_format(self, date_str: str) -> str:
         """
         Конвертирует дату из формата ДД.ММ.ГГГГ в ISO формат YYYY-MM-DD
@@ -174,86 +414,55 @@ class Database:
             except ValueError:
                 raise ValueError(f"Неверный формат даты: {date_only}. Ожидается ДД.ММ.ГГГГ или YYYY-MM-DD")
 
-    def get_readings_report(self, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
+    def _report_period(self, start_date: str = None, end_date: str = None):
+        """Границы периода отчета в ISO формате для BETWEEN"""
+        # Конвертируем даты в ISO формат
+        if start_date:
+            start_iso = self._convert_date_format(start_date)
+        else:
+            start_iso = "1970-01-01"
+
+        if end_date:
+            end_iso = self._convert_date_format(end_date) + " 23:59:59"
+        else:
+            end_iso = "2100-12-31 23:59:59"
+
+        logger.debug("Період звіту", extra={"start": start_iso, "end": end_iso})
+        return start_iso, end_iso
+
+    def _iter_readings_report(self, start_date: str = None, end_date: str = None,
+                              chunk_size: int = REPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
         """
-        Получает отчет по показаниям за указанный период
+        Потоково отдает отчет по показаниям: строки читаются из курсора
+        порциями по chunk_size и группируются по пользователям на лету
+        (запрос отсортирован так, что строки одного пользователя идут подряд)
         Args:
             start_date: Начальная дата в формате ДД.ММ.ГГГГ или YYYY-MM-DD (опционально)
             end_date: Конечная дата в формате ДД.ММ.ГГГГ или YYYY-MM-DD (опционально)
+            chunk_size: сколько строк забирать из курсора за раз
         Returns:
-            Список словарей с данными по пользователям и их счетчикам
+            Итератор словарей с данными по пользователю и его счетчикам
         """
-        try:
-            # Конвертируем даты в ISO формат
-            if start_date:
-                start_iso = self._convert_date_format(start_date)
-            else:
-                start_iso = "1970-01-01"
+        start_iso, end_iso = self._report_period(start_date, end_date)
 
-            if end_date:
-                end_iso = self._convert_date_format(end_date) + " 23:59:59"
-            else:
-                end_iso = "2100-12-31 23:59:59"
-
-            # Отладочная информация
-            print(f"Исходные даты: {start_date} - {end_date}")
-            print(f"Преобразованные даты: {start_iso} - {end_iso}")
-
-            # Запрос для получения последнего и предпоследнего показаний
-            query = """
-            WITH RankedReadings AS (
-                SELECT 
-                    r.counter_id,
-                    r.value,
-                    r.created_at,
-                    ROW_NUMBER() OVER (PARTITION BY r.counter_id ORDER BY r.created_at DESC) AS rn,
-                    LAG(r.value) OVER (PARTITION BY r.counter_id ORDER BY r.created_at) AS prev_value,
-                    LAG(r.created_at) OVER (PARTITION BY r.counter_id ORDER BY r.created_at) AS prev_date
-                FROM readings r
-                WHERE r.created_at BETWEEN ? AND ?
-            )
-            SELECT 
-                u.user_id,
-                u.account_number,
-                u.full_name,
-                u.phone_number,
-                u.address,
-                u.water_meters_count,
-                c.id AS counter_id,
-                c.alias,
-                rr.value AS current_reading,
-                rr.created_at AS current_date,
-                rr.prev_value,
-                rr.prev_date
-            FROM users u
-            INNER JOIN counters c ON c.user_id = u.user_id
-            INNER JOIN RankedReadings rr ON c.id = rr.counter_id
-            WHERE rr.rn = 1
-            ORDER BY u.account_number, c.alias
-            """
-
-            # Выполнение запроса
-            self.cursor.execute(query, (start_iso, end_iso))
-            rows = self.cursor.fetchall()
-            print(f"Количество найденных строк после выполнения запроса: {len(rows)}")
-
-            # Для отладки выведем первую строку результата
-            if rows:
-                print(f"Первая строка результата: {rows[0]}")
-
-            # Структура для хранения результатов
-            result = []
+        # Отдельный курсор: генератор может читаться долго
+        cursor = self.conn.cursor()
+        cursor.execute(READINGS_REPORT_QUERY, {"start": start_iso, "end": end_iso})
 
-            # Словарь для группировки по пользователям
-            users_dict = {}
+        user = None
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
 
-            # Обработка результатов
             for row in rows:
                 user_id, account_number, full_name, phone_number, address, water_meters_count, counter_id, alias, current_reading, current_date, prev_value, prev_date = row
 
-                # Если пользователя еще нет в словаре, добавляем его
-                if user_id not in users_dict:
-                    users_dict[user_id] = {
+                # Начались строки следующего пользователя
+                if user is None or user["user_id"] != user_id:
+                    if user is not None:
+                        yield user
+                    user = {
                         "user_id": user_id,
                         "account_number": account_number,
                         "full_name": full_name,
@@ -264,7 +473,7 @@ class Database:
                     }
 
                 # Добавляем данные счетчика
-                users_dict[user_id]["counters"].append({
+                user["counters"].append({
                     "alias": alias,
                     "readings": [{
                         "value": current_reading,
@@ -274,16 +483,25 @@ class Database:
                     }]
                 })
 
-            # Преобразуем словарь в список
-            for user_id, user_data in users_dict.items():
-                result.append(user_data)
+        if user is not None:
+            yield user
 
-            print(f"Результат успешно сформирован, количество пользователей: {len(result)}")
+    def get_readings_report(self, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
+        """
+        Получает отчет по показаниям за указанный период
+        Args:
+            start_date: Начальная дата в формате ДД.ММ.ГГГГ или YYYY-MM-DD (опционально)
+            end_date: Конечная дата в формате ДД.ММ.ГГГГ или YYYY-MM-DD (опционально)
+        Returns:
+            Список словарей с данными по пользователям и их счетчикам
+        """
+        try:
+            result = list(self._iter_readings_report(start_date, end_date))
+            logger.info("Звіт сформовано", extra={"users": len(result)})
             return result
 
-        except Exception as e:
-            print(f"Ошибка при получении отчета: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Помилка при отриманні звіту")
             return []
 
     def format_report_for_message(self, report_data: List[Dict[str, Any]]) -> str:
@@ -360,9 +578,8 @@ class Database:
 
             return "\n\n" + "\n\n---\n\n".join(result)
 
-        except Exception as e:
-            print(f"Ошибка при генерации отчета: {e}")
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Помилка при форматуванні звіту")
             return "Ошибка при форматировании отчета"
 
     def check_data(self):
@@ -392,96 +609,61 @@ class Database:
             if not isinstance(data, list):
                 raise ValueError("Data must be a list of dictionaries")
 
-            # Создаем базовые колонки
-            columns = [
-                'Особовий рахунок',
-                'ПІБ',
-                'Адреса',
-                'Телефон'
-            ]
-
             # Определяем максимальное количество счетчиков
             max_counters = max(user.get('water_meters_count', 0) for user in data)
 
-            # Добавляем колонки для каждого счетчика
-            for i in range(1, max_counters + 1):
-                columns.extend([
-                    f'Лічильник-{i} поточні',
-                    f'Лічильник-{i} дата',
-                    f'Лічильник-{i} попередні',
-                    f'Лічильник-{i} дата попередніх'
-                ])
-
-            # Подготовка данных для Excel
-            excel_data = []
+            longest = {}
             for user in data:
-                row = {
-                    'Особовий рахунок': user['account_number'],
-                    'ПІБ': user['full_name'],
-                    'Адреса': user['address'],
-                    'Телефон': user['phone_number']
-                }
-
-                # Получаем список счетчиков пользователя
-                user_counters = {c['alias']: c for c in user['counters']}
-
-                # Добавляем данные счетчиков
-                for i in range(max_counters):
-                    counter_num = i + 1
-                    counter_alias = f'Лічильник-{counter_num}'
-                    counter = user_counters.get(counter_alias)
-
-                    if counter and counter['readings'] and len(counter['readings']) > 0:
-                        reading = counter['readings'][0]
-                        row.update({
-                            f'Лічильник-{counter_num} поточні': reading['value'],
-                            f'Лічильник-{counter_num} дата': reading['date'],
-                            f'Лічильник-{counter_num} попередні': reading['prev_value'],
-                            f'Лічильник-{counter_num} дата попередніх': reading['prev_date']
-                        })
-                    else:
-                        row.update({
-                            f'Лічильник-{counter_num} поточні': None,
-                            f'Лічильник-{counter_num} дата': None,
-                            f'Лічильник-{counter_num} попередні': None,
-                            f'Лічильник-{counter_num} дата попередніх': None
-                        })
-
-                excel_data.append(row)
-
-            # Создаем DataFrame
-            df = pd.DataFrame(excel_data, columns=columns)
-
-            # Генерация имени файла
-            current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f'readings_report_{current_time}.xlsx'
-
-            # Сохранение в Excel
-            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Report', index=False)
-
-                # Форматирование Excel файла
-                worksheet = writer.sheets['Report']
-
-                # Настройка ширины колонок
-                for col in worksheet.columns:
-                    max_length = 0
-                    column = col[0].column_letter
-                    for cell in col:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = (max_length + 2) * 1.2
-                    worksheet.column_dimensions[column].width = adjusted_width
+                for column, key in zip(BASE_COLUMNS, ('account_number', 'full_name', 'address', 'phone_number')):
+                    longest[column] = max(longest.get(column, 0), len(str(user[key])))
+            longest.update(self._counter_columns_longest(max_counters))
 
+            filename, _ = write_report(data, max_counters, longest)
             return filename
 
-        except Exception as e:
-            print(f"Error exporting to Excel: {e}")
+        except Exception:
+            logger.exception("Помилка експорту в Excel")
             raise
 
+    def _counter_columns_longest(self, max_counters: int) -> Dict[str, int]:
+        # Даты хранятся строками вида YYYY-MM-DD HH:MM:SS
+        columns = report_columns(max_counters)[len(BASE_COLUMNS):]
+        return {column: 19 for column in columns if column.endswith('дата') or column.endswith('попередніх')}
+
+    def export_readings_report(self, start_date: str = None, end_date: str = None,
+                               chunk_size: int = REPORT_CHUNK_SIZE, filename: str = None, progress=None):
+        """
+        Строит xlsx отчет за период потоково: строки идут из курсора прямо
+        в файл, память не растет с количеством лицевых счетов
+        Args:
+            filename: имя файла (по умолчанию readings_report_<время>.xlsx)
+            progress: необязательный callback(stage, count), см. utils.export.write_report
+        Returns:
+            (имя файла, количество пользователей) или (None, 0), если данных нет
+        """
+        # Раскладка колонок считается одним агрегатом по users до начала записи
+        self.cursor.execute("""
+            SELECT
+                COALESCE(MAX(water_meters_count), 0),
+                COALESCE(MAX(LENGTH(account_number)), 0),
+                COALESCE(MAX(LENGTH(full_name)), 0),
+                COALESCE(MAX(LENGTH(address)), 0),
+                COALESCE(MAX(LENGTH(phone_number)), 0)
+            FROM users
+        """)
+        max_counters, *lengths = self.cursor.fetchone()
+        longest = dict(zip(BASE_COLUMNS, lengths))
+        longest.update(self._counter_columns_longest(max_counters))
+
+        users = self._iter_readings_report(start_date, end_date, chunk_size)
+        filename, count = write_report(users, max_counters, longest, filename, progress)
+        logger.info("Звіт сформовано", extra={"file": filename, "users": count})
+
+        if count == 0:
+            os.remove(filename)
+            return None, 0
+        return filename, count
+
     def get_user_statistics(self):
         # Статистика по користувачах
         query = """
@@ -521,7 +703,7 @@ class Database:
             WHERE counter_id = ?
             ORDER BY reading_date DESC 
             LIMIT 1
-        """, (counter_id))
+        """, (counter_id,))
         result = self.cursor.fetchone()
         return result[0] if result else None
 
@@ -531,7 +713,7 @@ class Database:
             SELECT * FROM monthly_readings 
             WHERE counter_id = ?
             ORDER BY reading_date DESC
-        """, (counter_id))
+        """, (counter_id,))
         columns = [col[0] for col in self.cursor.description]
         return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
 
@@ -545,5 +727,196 @@ class Database:
         """, (counter_id, current_month))
         return self.cursor.fetchone() is not None
 
+    def start_broadcast(self, campaign: str, text: str):
+        """
+        Регистрирует рассылку (если ее еще нет).
+        Возвращает дату завершения или None, если рассылка не закончена
+        """
+        self.cursor.execute("INSERT OR IGNORE INTO broadcasts (campaign, text) VALUES (?, ?)", (campaign, text))
+        self.conn.commit()
+        self.cursor.execute("SELECT finished_at FROM broadcasts WHERE campaign = ?", (campaign,))
+        return self.cursor.fetchone()[0]
+
+    def plan_broadcast(self, campaign: str, text: str, month: str = None) -> int:
+        """
+        Регистрирует рассылку и фиксирует список получателей при первом вызове
+        одной транзакцией: всех пользователей или, если передан month (YYYY-MM),
+        только тех, кто не передал показания хотя бы по одному счетчику.
+        Повторные вызовы (например, после перезапуска) список не меняют:
+        кто получит рассылку, решается один раз. Возвращает число получателей
+        """
+        audience = USERS_MISSING_READINGS_QUERY if month else "SELECT user_id FROM users"
+        try:
+            self.cursor.execute("BEGIN TRANSACTION")
+            self.cursor.execute("INSERT OR IGNORE INTO broadcasts (campaign, text) VALUES (?, ?)", (campaign, text))
+            if self.cursor.rowcount:
+                self.cursor.execute(f"""
+                    INSERT INTO broadcast_deliveries (campaign, user_id, status, attempts)
+                    SELECT :campaign, user_id, 'pending', 0 FROM ({audience})
+                """, {"campaign": campaign, "month": month})
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.cursor.execute("SELECT COUNT(*) FROM broadcast_deliveries WHERE campaign = ?", (campaign,))
+        return self.cursor.fetchone()[0]
+
+    def get_broadcast_recipients(self, campaign: str, month: str = None, after: int = 0,
+                                 limit: int = 500) -> List[int]:
+        """
+        Страница user_id получателей, которым рассылка еще не доставлена, по
+        возрастанию user_id начиная после after. С month пропускаются те, кто
+        уже передал показания за месяц (в том числе после начала рассылки)
+        """
+        self.cursor.execute(BROADCAST_RECIPIENTS_QUERY, {
+            "campaign": campaign, "month": month, "after": after, "limit": limit,
+        })
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def record_broadcast_results(self, campaign: str, results: List[tuple]) -> None:
+        """Сохраняет пачку результатов доставки [(user_id, status, attempts), ...] одной транзакцией"""
+        self.cursor.executemany("""
+            INSERT INTO broadcast_deliveries (campaign, user_id, status, attempts)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (campaign, user_id) DO UPDATE SET
+                status = excluded.status,
+                attempts = broadcast_deliveries.attempts + excluded.attempts,
+                updated_at = CURRENT_TIMESTAMP
+        """, [(campaign, user_id, status, attempts) for user_id, status, attempts in results])
+        self.conn.commit()
+
+    def finish_broadcast(self, campaign: str) -> None:
+        self.cursor.execute(
+            "UPDATE broadcasts SET finished_at = CURRENT_TIMESTAMP WHERE campaign = ?", (campaign,)
+        )
+        self.conn.commit()
+
+    def load_fsm_state(self, key: str, min_updated_at: float):
+        """Состояние и данные FSM (JSON) по ключу, если они обновлялись не раньше min_updated_at"""
+        self.cursor.execute(
+            "SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?", (key, min_updated_at)
+        )
+        return self.cursor.fetchone()
+
+    def save_fsm_states(self, rows: List[tuple]) -> None:
+        """
+        Сохраняет пачку состояний FSM [(key, state, data, updated_at), ...] одной транзакцией.
+        Пустые записи (нет ни состояния, ни данных) удаляются
+        """
+        self.cursor.execute("BEGIN TRANSACTION")
+        try:
+            self.cursor.executemany("""
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """, [row for row in rows if row[1] is not None or row[2] is not None])
+            self.cursor.executemany(
+                "DELETE FROM fsm_states WHERE key = ?",
+                [(row[0],) for row in rows if row[1] is None and row[2] is None]
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def purge_fsm_states(self, older_than: float) -> int:
+        """Удаляет состояния FSM, не обновлявшиеся с older_than; возвращает количество"""
+        self.cursor.execute("DELETE FROM fsm_states WHERE updated_at < ?", (older_than,))
+        self.conn.commit()
+        return self.cursor.rowcount
+
+    def write_audit_events(self, events: List[tuple]) -> None:
+        """Записывает пачку действий [(user_id, action, details JSON, created_at), ...] одной транзакцией"""
+        self.cursor.executemany(
+            "INSERT INTO logs (user_id, action, details, created_at) VALUES (?, ?, ?, ?)", events
+        )
+        self.conn.commit()
+
+    def purge_audit_events(self, older_than: str, batch_size: int = 10000) -> int:
+        """
+        Удаляет записи журнала старше older_than (YYYY-MM-DD HH:MM:SS)
+        пачками, чтобы не держать долгую блокировку записи. Возвращает количество
+        """
+        deleted = 0
+        while True:
+            self.cursor.execute("""
+                DELETE FROM logs WHERE id IN (
+                    SELECT id FROM logs WHERE created_at < ? ORDER BY created_at LIMIT ?
+                )
+            """, (older_than, batch_size))
+            self.conn.commit()
+            deleted += self.cursor.rowcount
+            if self.cursor.rowcount < batch_size:
+                return deleted
+
+    def get_audit_events(self, user_id: int = None, action: str = None, since: str = None,
+                         until: str = None, before_id: int = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Журнал действий для админов, новые сверху. Следующая страница -
+        before_id = id последней записи предыдущей
+        """
+        conditions, params = [], []
+        for condition, value in (("user_id = ?", user_id), ("action = ?", action), ("created_at >= ?", since),
+                                 ("created_at < ?", until), ("id < ?", before_id)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        self.cursor.execute(f"""
+            SELECT id, user_id, action, details, created_at FROM logs
+            {where}
+            ORDER BY id DESC
+            LIMIT ?
+        """, (*params, limit))
+        columns = [col[0] for col in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def _page(self, query: str, params: dict, ascending: bool, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Одна страница keyset-выборки: query с {op}/{order} для направления.
+        Возвращает строки в порядке выдачи и есть ли еще строки в этом направлении
+        """
+        op, order = (">", "ASC") if ascending else ("<", "DESC")
+        self.cursor.execute(query.format(op=op, order=order), {**params, "limit": limit + 1})
+        columns = [col[0] for col in self.cursor.description]
+        rows = [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+        return rows[:limit], len(rows) > limit
+
+    def search_users(self, query: str, after: int = 0, before: int = None,
+                     limit: int = 10) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Ищет мешканцев по началу номера рахунку или по началу слов ПІБ и адреси.
+        Результаты по возрастанию id: следующая страница - after = id последнего,
+        предыдущая - before = id первого. Возвращает (страница, есть ли еще
+        результаты в направлении листания)
+        """
+        query = query.strip()
+        words = re.findall(r"\w+", query)
+        if not words:
+            return [], False
+        params = {
+            "query": query,
+            "query_end": query + "\U0010ffff",
+            # Каждое слово - префикс: "шевч тарас" находит "Шевченко Тарас"
+            "match": " ".join(f'"{word}"*' for word in words),
+        }
+        if before is not None:
+            rows, more = self._page(SEARCH_USERS_QUERY, {**params, "cursor": before}, False, limit)
+            return rows[::-1], more
+        return self._page(SEARCH_USERS_QUERY, {**params, "cursor": after}, True, limit)
+
+    def get_reading_history(self, user_id: int, older_than: int = None, newer_than: int = None,
+                            limit: int = 10) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Показания всех счетчиков мешканца, новые сверху. Следующая (более старая)
+        страница - older_than = id последнего показания, предыдущая -
+        newer_than = id первого. Возвращает (страница, есть ли еще показания
+        в направлении листания)
+        """
+        if newer_than is not None:
+            rows, more = self._page(READING_HISTORY_QUERY, {"user_id": user_id, "cursor": newer_than}, True, limit)
+            return rows[::-1], more
+        return self._page(READING_HISTORY_QUERY, {"user_id": user_id, "cursor": older_than}, False, limit)
+
     def close(self):
         self.conn.close()
\ No newline at end of file
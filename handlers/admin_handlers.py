@@ -2,25 +2,50 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, \
+    InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database import Database
-from config import ADMIN_PASSWORD, DATABASE_NAME
-import traceback
-import os
+from async_database import get_db
+from utils.report_cache import ReportCache
+from utils.report_jobs import ReportJobs, ReportQueueFull
+from utils.dispatch import ButtonIndex
+from keyboards import intern
+from config import ADMIN_PASSWORD
+import functools
+import html
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Список авторизованных админов
 authorized_admins = set()
 
-db = Database(DATABASE_NAME)
+db = get_db()
+report_jobs = ReportJobs(db)
+report_cache = ReportCache()
+
+# Формат отчета в ключе кэша
+REPORT_FORMAT = "xlsx"
+
+# Сколько мешканцев и показаний показывать на одной странице поиска и истории
+SEARCH_PAGE_SIZE = 10
+HISTORY_PAGE_SIZE = 15
+
+# Сколько месяцев календаря держать готовыми клавиатурами
+CALENDAR_CACHE = 48
+
+SEARCH_BUTTON = "🔎 Пошук мешканця"
 
 class AdminStates(StatesGroup):
     waiting_for_password = State()
     waiting_for_start_date = State()
     waiting_for_end_date = State()
+    waiting_for_search_query = State()
 
 router = Router()
+# Кнопки меню: поиск обработчика по тексту, раньше обработчиков состояний
+buttons = ButtonIndex(router)
 
 # Украинские названия месяцев
 MONTHS_UA = {
@@ -29,28 +54,32 @@ MONTHS_UA = {
     9: "Вересень", 10: "Жовтень", 11: "Листопад", 12: "Грудень"
 }
 
+# Главное меню админа
+ADMIN_MENU = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📊 Сформувати звіт за період")],
+        [KeyboardButton(text=SEARCH_BUTTON)]
+    ],
+    resize_keyboard=True
+))
+
+# Клавиатура с кнопкой 'Назад'
+BACK_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🔙 Назад")]
+    ],
+    resize_keyboard=True
+))
+
 def get_admin_menu():
-    """Создает главное меню админа"""
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 Сформувати звіт за період")]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return ADMIN_MENU
 
 def get_back_keyboard():
-    """Создает клавиатуру с кнопкой 'Назад'"""
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔙 Назад")]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return BACK_KEYBOARD
 
+@functools.lru_cache(maxsize=CALENDAR_CACHE)
 def create_calendar_keyboard(year: int, month: int):
-    """Создает инлайн-клавиатуру календаря"""
+    """Инлайн-клавиатура календаря; месяц строится один раз и дальше берется из кэша"""
     builder = InlineKeyboardBuilder()
 
     # Заголовок с месяцем и годом
@@ -111,6 +140,58 @@ def create_calendar_keyboard(year: int, month: int):
             week_buttons.append(InlineKeyboardButton(text=" ", callback_data="ignore"))
         builder.row(*week_buttons)
 
+    return intern(builder.as_markup())
+
+def create_pager_row(prefix: str, first_id: int, last_id: int, has_prev: bool, has_next: bool):
+    """
+    Кнопки "назад/вперед" для keyset-страниц: в callback_data - граница
+    текущей страницы, от которой считается соседняя
+    """
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}_prev_{first_id}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}_next_{last_id}"))
+    return buttons
+
+def create_search_keyboard(users: list, has_prev: bool, has_next: bool):
+    """Инлайн-клавиатура результатов поиска: история показаний каждого мешканца и листание"""
+    builder = InlineKeyboardBuilder()
+    for user in users:
+        builder.row(
+            InlineKeyboardButton(
+                text=f"📈 {user['account_number']} · {user['full_name']}",
+                callback_data=f"history_{user['user_id']}_start_0"
+            )
+        )
+    pager = create_pager_row("search", users[0]["id"], users[-1]["id"], has_prev, has_next)
+    if pager:
+        builder.row(*pager)
+    return builder.as_markup()
+
+def format_search_results(query: str, users: list) -> str:
+    # Сообщения уходят с parse_mode=HTML, а имена и адреса вводят сами мешканцы
+    lines = [
+        f"• {html.escape(user['full_name'])}\n   {html.escape(user['address'])}, "
+        f"рах. {html.escape(str(user['account_number']))}"
+        for user in users
+    ]
+    return f"🔎 Результати пошуку «{html.escape(query)}»:\n\n" + "\n".join(lines)
+
+def format_history_header(user) -> str:
+    return f"📈 Показники: {html.escape(user[2])}, рах. {html.escape(str(user[6]))}\n\n"
+
+def format_history(user, readings: list) -> str:
+    return format_history_header(user) + "\n".join(
+        f"{reading['created_at']} · {html.escape(reading['alias'])}: {reading['value']}" for reading in readings
+    )
+
+def create_history_keyboard(user_id: int, readings: list, has_prev: bool, has_next: bool):
+    """Листание истории показаний: вперед - более старые показания"""
+    builder = InlineKeyboardBuilder()
+    pager = create_pager_row(f"history_{user_id}", readings[0]["id"], readings[-1]["id"], has_prev, has_next)
+    if pager:
+        builder.row(*pager)
     return builder.as_markup()
 
 @router.message(Command("start"))
@@ -150,7 +231,7 @@ async def check_password(message: types.Message, state: FSMContext):
             reply_markup=ReplyKeyboardRemove()
         )
 
-@router.message(F.text == "📊 Сформувати звіт за період")
+@buttons("📊 Сформувати звіт за період")
 async def start_report_generation(message: types.Message, state: FSMContext):
     """Начало формирования отчета"""
     user_id = message.from_user.id
@@ -240,6 +321,117 @@ async def select_date(callback: types.CallbackQuery, state: FSMContext):
 
     await callback.answer()
 
+@buttons(SEARCH_BUTTON)
+async def start_search(message: types.Message, state: FSMContext):
+    """Начало поиска мешканца"""
+    if message.from_user.id not in authorized_admins:
+        await message.answer("❌ Ви не авторизовані. Введіть команду /start")
+        return
+
+    await message.answer(
+        "🔎 Введіть номер рахунку, прізвище або адресу (можна початок слова):",
+        reply_markup=get_back_keyboard()
+    )
+    await state.set_state(AdminStates.waiting_for_search_query)
+
+@router.message(Command("search"))
+async def search_command(message: types.Message, state: FSMContext):
+    """Поиск мешканца одной командой: /search <запит>"""
+    if message.from_user.id not in authorized_admins:
+        await message.answer("❌ Ви не авторизовані. Введіть команду /start")
+        return
+
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await start_search(message, state)
+        return
+    await show_search_results(message, state, query)
+
+@router.message(AdminStates.waiting_for_search_query, F.text, ~F.text.startswith("/"))
+async def search_query_entered(message: types.Message, state: FSMContext):
+    await show_search_results(message, state, message.text.strip())
+
+async def show_search_results(message: types.Message, state: FSMContext, query: str):
+    """Первая страница результатов; запрос сохраняется для листания"""
+    users, has_next = await db.search_users(query, limit=SEARCH_PAGE_SIZE)
+    if not users:
+        await message.answer("📋 Нічого не знайдено. Спробуйте інший запит:", reply_markup=get_back_keyboard())
+        return
+
+    # Текст запроса может не поместиться в callback_data (64 байта), поэтому хранится в состоянии
+    await state.set_state(None)
+    await state.update_data(search_query=query)
+    await message.answer(
+        format_search_results(query, users),
+        reply_markup=create_search_keyboard(users, False, has_next)
+    )
+
+@router.callback_query(F.data.startswith("search_"))
+async def search_page(callback: types.CallbackQuery, state: FSMContext):
+    """Соседняя страница результатов поиска"""
+    if callback.from_user.id not in authorized_admins:
+        await callback.answer("❌ Ви не авторизовані", show_alert=True)
+        return
+
+    _, direction, boundary = callback.data.split("_")
+    query = (await state.get_data()).get("search_query")
+    if query is None:
+        await callback.answer("Пошук застарів, почніть новий", show_alert=True)
+        return
+
+    if direction == "next":
+        users, has_next = await db.search_users(query, after=int(boundary), limit=SEARCH_PAGE_SIZE)
+        has_prev = True
+    else:
+        users, has_prev = await db.search_users(query, before=int(boundary), limit=SEARCH_PAGE_SIZE)
+        has_next = True
+
+    if users:
+        await callback.message.edit_text(
+            format_search_results(query, users),
+            reply_markup=create_search_keyboard(users, has_prev, has_next)
+        )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("history_"))
+async def reading_history(callback: types.CallbackQuery):
+    """История показаний мешканца: history_<user_id>_<start|next|prev>_<id показания>"""
+    if callback.from_user.id not in authorized_admins:
+        await callback.answer("❌ Ви не авторизовані", show_alert=True)
+        return
+
+    _, user_id, direction, boundary = callback.data.split("_")
+    user_id, boundary = int(user_id), int(boundary)
+
+    if direction == "start":
+        readings, has_next = await db.get_reading_history(user_id, limit=HISTORY_PAGE_SIZE)
+        has_prev = False
+    elif direction == "next":
+        readings, has_next = await db.get_reading_history(user_id, older_than=boundary, limit=HISTORY_PAGE_SIZE)
+        has_prev = True
+    else:
+        readings, has_prev = await db.get_reading_history(user_id, newer_than=boundary, limit=HISTORY_PAGE_SIZE)
+        has_next = True
+
+    user = await db.get_user(user_id)
+    if user is None:
+        await callback.answer("Мешканця не знайдено", show_alert=True)
+        return
+    if not readings:
+        if direction == "start":
+            await callback.message.answer(format_history_header(user) + "📋 Показників ще немає.")
+        await callback.answer()
+        return
+
+    text = format_history(user, readings)
+    keyboard = create_history_keyboard(user_id, readings, has_prev, has_next)
+    if direction == "start":
+        # История - отдельным сообщением, чтобы результаты поиска остались на экране
+        await callback.message.answer(text, reply_markup=keyboard)
+    else:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
 @router.callback_query(F.data == "ignore")
 async def ignore_callback(callback: types.CallbackQuery):
     """Игнорирование нажатий на неактивные кнопки календаря"""
@@ -248,39 +440,48 @@ async def ignore_callback(callback: types.CallbackQuery):
 async def generate_report(message: types.Message, start_date: str, end_date: str, state: FSMContext):
     """Генерация отчета за указанный период"""
     try:
-        await message.answer("⏳ Формую звіт, будь ласка, зачекайте...")
+        caption = f"📊 Звіт за період з {start_date} по {end_date}\n"
+
+        # Отчет за этот период уже отправляли и данные с тех пор не менялись
+        cached = report_cache.get(start_date, end_date, REPORT_FORMAT, db.data_version)
+        if cached is not None:
+            file_id, users_count = cached
+            if file_id is None:
+                await message.answer("📋 За вказаний період дані відсутні.", reply_markup=get_admin_menu())
+            else:
+                await message.answer_document(file_id, caption=caption + f"Кількість записів: {users_count}")
+                await message.answer("✅ Звіт успішно сформовано!", reply_markup=get_admin_menu())
+            return
 
-        # Получаем данные из базы
-        report_data = db.get_readings_report(start_date, end_date)
+        progress_message = await message.answer("⏳ Формую звіт, будь ласка, зачекайте...")
 
-        if not report_data:
-            await message.answer(
-                "📋 За вказаний період дані відсутні.",
-                reply_markup=get_admin_menu()
-            )
-            await state.clear()
+        # Отчет строится в отдельном потоке; повторный запрос за тот же период
+        # присоединяется к уже запущенному
+        try:
+            job = report_jobs.submit(start_date, end_date, progress_message)
+        except ReportQueueFull:
+            await progress_message.edit_text("⏳ Зараз формується забагато звітів. Спробуйте за хвилину.")
+            await message.answer("🏠 Головне меню:", reply_markup=get_admin_menu())
             return
 
-        # Генерируем Excel файл
-        filename = db.export_to_excel(report_data)
-
         try:
-            # Отправляем файл пользователю
-            file = FSInputFile(filename)
-            await message.answer_document(
-                file,
-                caption=f"📊 Звіт за період з {start_date} по {end_date}\n"
-                        f"Кількість записів: {len(report_data)}"
-            )
-            print(f"[SUCCESS] Отчет {filename} успешно отправлен в Telegram")
+            filename, users_count = await job.wait()
+
+            if not filename:
+                report_cache.put(start_date, end_date, REPORT_FORMAT, job.data_version, None, 0)
+                await progress_message.edit_text("📋 За вказаний період дані відсутні.")
+                await message.answer("🏠 Головне меню:", reply_markup=get_admin_menu())
+                return
+
+            # Отправляем файл пользователю; если его уже загрузил другой
+            # админ из этого же задания, повторно не загружаем
+            await progress_message.edit_text("📤 Надсилаю файл...")
+            await job.send_document(message, caption + f"Кількість записів: {users_count}")
+            report_cache.put(start_date, end_date, REPORT_FORMAT, job.data_version, job.file_id, users_count)
+            logger.info("Звіт надіслано", extra={"file": filename, "users": users_count})
         finally:
-            # Удаляем временный файл после отправки или в случае ошибки
-            if os.path.exists(filename):
-                try:
-                    os.remove(filename)
-                    print(f"[SUCCESS] Файл {filename} успешно удален с сервера")
-                except Exception as e:
-                    print(f"[ERROR] Ошибка при удалении файла {filename}: {str(e)}")
+            # Последний получатель удаляет временный файл
+            job.release()
 
         await message.answer(
             "✅ Звіт успішно сформовано!",
@@ -288,8 +489,7 @@ async def generate_report(message: types.Message, start_date: str, end_date: str
         )
 
     except Exception as e:
-        print(f"[ERROR] Помилка при генерації звіту: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Помилка при генерації звіту", extra={"start": start_date, "end": end_date})
         await message.answer(
             "❌ Сталася помилка при формуванні звіту. Спробуйте ще раз.",
             reply_markup=get_admin_menu()
@@ -297,7 +497,39 @@ async def generate_report(message: types.Message, start_date: str, end_date: str
     finally:
         await state.clear()
 
-@router.message(F.text == "🔙 Назад")
+# Сколько записей журнала показывать за раз
+AUDIT_PAGE_SIZE = 20
+
+@router.message(Command("audit"))
+async def show_audit(message: types.Message):
+    """
+    Журнал действий пользователей: /audit [user_id] [action].
+    Последние записи, новые сверху
+    """
+    if message.from_user.id not in authorized_admins:
+        await message.answer("❌ Ви не авторизовані. Введіть команду /start")
+        return
+
+    args = message.text.split()[1:]
+    if args and not args[0].isdigit():
+        await message.answer("Використання: /audit [user_id] [дія]")
+        return
+    user_id = int(args[0]) if args else None
+    action = args[1] if len(args) > 1 else None
+
+    events = await db.get_audit_events(user_id=user_id, action=action, limit=AUDIT_PAGE_SIZE)
+    if not events:
+        await message.answer("📋 Записів у журналі немає.", reply_markup=get_admin_menu())
+        return
+
+    lines = [
+        f"{event['created_at']} · {event['user_id']} · {event['action']}"
+        + (f" {event['details']}" if event['details'] else "")
+        for event in events
+    ]
+    await message.answer("📜 Журнал дій:\n\n" + "\n".join(lines), reply_markup=get_admin_menu())
+
+@buttons("🔙 Назад")
 async def back_to_menu(message: types.Message, state: FSMContext):
     """Возврат в главное меню"""
     await message.answer(
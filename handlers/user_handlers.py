@@ -1,20 +1,30 @@
 # handlers/user_handlers.py
+import logging
+
 from aiogram import Router, types
 from aiogram import F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import ReplyKeyboardRemove
 
-from database import Database
+from async_database import get_db
+from utils import audit as actions
+from utils.audit import get_audit
+from utils.dispatch import ButtonIndex
 from keyboards import get_main_menu, get_edit_profile_keyboard, get_back_button_keyboard, \
     get_edit_counter_menu, get_edit_counters_menu, get_consent_keyboard, get_about_developer_keyboard, \
-    get_phone_keyboard
+    get_phone_keyboard, get_counters_keyboard
 from texts import Texts
 from buttons import Buttons, InlineButtons
 
+logger = logging.getLogger(__name__)
+
 router = Router()
-db = Database()
+# Кнопки меню: поиск обработчика по тексту, раньше обработчиков состояний
+buttons = ButtonIndex(router)
+db = get_db()
+audit = get_audit()
 
 class Registration(StatesGroup):
     waiting_for_account_number = State()  # 1. Номер особового рахунку
@@ -49,11 +59,9 @@ class EditCounters(StatesGroup):
 
 @router.message(Command(commands=["start"]))
 async def start(message: types.Message, state: FSMContext):
-    print("Команда /start получена (user_handlers)")
     user_id = message.from_user.id
-    user = db.get_user(user_id)
-
-    print(user)
+    user = await db.get_user(user_id)
+    logger.debug("Команда /start", extra={"user_id": user_id, "registered": user is not None})
 
     if not user:
         await message.answer(Texts.START, reply_markup=ReplyKeyboardRemove())
@@ -77,7 +85,7 @@ async def process_account_number(message: types.Message, state: FSMContext):
 
 @router.message(Registration.waiting_for_name)
 async def process_name(message: types.Message, state: FSMContext):
-    print(f"Получено ПІБ: {message.text}")
+    logger.debug("Отримано ПІБ", extra={"user_id": message.from_user.id})
     await state.update_data(full_name=message.text)
     await message.answer(Texts.ADDRESS, reply_markup=ReplyKeyboardRemove())
     await state.set_state(Registration.waiting_for_address)
@@ -85,7 +93,7 @@ async def process_name(message: types.Message, state: FSMContext):
 
 @router.message(Registration.waiting_for_address)
 async def process_address(message: types.Message, state: FSMContext):
-    print(f"Получен адрес: {message.text}")
+    logger.debug("Отримано адресу", extra={"user_id": message.from_user.id})
     await state.update_data(address=message.text)
 
     await message.answer(
@@ -125,7 +133,7 @@ async def process_phone(message: types.Message, state: FSMContext):
         )
         return
 
-    print(f"Получено номер телефону: {phone}")
+    logger.debug("Отримано номер телефону", extra={"user_id": message.from_user.id})
     await state.update_data(phone_number=phone)
     await message.answer(Texts.METERS_COUNT, reply_markup=ReplyKeyboardRemove())
     await state.set_state(Registration.waiting_for_meters_count)
@@ -161,7 +169,8 @@ async def process_meters_count(message: types.Message, state: FSMContext):
 async def process_personal_data_consent(message: types.Message, state: FSMContext):
     if message.text == Buttons.CONSENT_YES:
         user_data = await state.get_data()
-        db.add_user(
+        # Пользователь и все его счетчики создаются одной транзакцией
+        await db.register_user(
             user_id=message.from_user.id,
             full_name=user_data["full_name"],
             phone_number=user_data["phone_number"],
@@ -169,10 +178,7 @@ async def process_personal_data_consent(message: types.Message, state: FSMContex
             water_meters_count=user_data["water_meters_count"],
             account_number=user_data["account_number"]
         )
-
-        user_id = message.from_user.id
-        for i in range(1, user_data["water_meters_count"] + 1):
-            db.add_counter(user_id, f"Лічильник-{i}")
+        audit.record(message.from_user.id, actions.REGISTERED, meters=user_data["water_meters_count"])
 
         await message.answer(Texts.REGISTRATION_COMPLETE, reply_markup=get_main_menu())
         await state.clear()
@@ -191,40 +197,33 @@ async def process_personal_data_consent(message: types.Message, state: FSMContex
         )
 @router.message(Command("add_counter"))
 async def add_counter(message: types.Message, state: FSMContext):
-    print("Команда /add_counter получена")
+    logger.debug("Команда /add_counter", extra={"user_id": message.from_user.id})
     await message.answer(Texts.COUNTER_ALIAS)
     await state.set_state(AddCounter.waiting_for_alias)
 
 @router.message(AddCounter.waiting_for_alias)
 async def process_alias(message: types.Message, state: FSMContext):
-    print(f"Получен алиас счетчика: {message.text}")
+    logger.debug("Отримано назву лічильника", extra={"user_id": message.from_user.id})
     user_id = message.from_user.id
     alias = message.text
 
-    db.cursor.execute("INSERT INTO counters (user_id, alias) VALUES (?, ?)", (user_id, alias))
-    db.conn.commit()
+    await db.add_counter(user_id, alias)
+    audit.record(user_id, actions.COUNTER_ADDED)
 
     await message.answer(Texts.COUNTER_ADDED.format(alias=alias), reply_markup=get_main_menu())
     await state.clear()
 
-@router.message(lambda message: message.text == Buttons.SUBMIT_READINGS)
+@buttons(Buttons.SUBMIT_READINGS)
 async def start_submit_readings(message: types.Message, state: FSMContext):
     # Получаем список счетчиков пользователя
     user_id = message.from_user.id
-    counters = db.get_counters(user_id)
+    counters = await db.get_counters(user_id)
 
     if not counters:
         await message.answer("У вас немає зареєстрованих лічильників.")
         return
 
-    # Формируем клавиатуру с выбором счетчика
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            *[[KeyboardButton(text=counter[2])] for counter in counters],  # counter[2] — это alias
-            [KeyboardButton(text=Buttons.BACK)]  # Добавляем кнопку "Назад"
-        ],
-        resize_keyboard=True
-    )
+    keyboard = get_counters_keyboard(tuple(counter[2] for counter in counters))  # counter[2] — это alias
     await message.answer("Оберіть лічильник:", reply_markup=keyboard)
     await state.set_state(SubmitReadings.waiting_for_counter)
 
@@ -236,19 +235,18 @@ async def process_counter_selection(message: types.Message, state: FSMContext):
         return
 
     user_id = message.from_user.id
-    counters = db.get_counters(user_id)
+    counters = await db.get_counters(user_id)
     selected_counter = next((counter for counter in counters if counter[2] == message.text), None)
 
     if not selected_counter:
         await message.answer("Лічильник не знайдено. Спробуйте ще раз.")
         return
 
-    # Получаем последнее показание для выбранного счетчика
-    last_reading = db.get_last_reading(selected_counter[0])
+    # Последнее показание берем из строки счетчика: [3] - last_reading, [5] - last_reading_at
+    last_reading = selected_counter[3] if selected_counter[5] is not None else None
 
     # Сохраняем выбранный счетчик в состоянии
     await state.update_data(counter_id=selected_counter[0], counter_alias=selected_counter[2])
-    await state.update_data(counter_id=selected_counter[0], counter_alias=selected_counter[2])
     await message.answer(
         f"Поточне значення лічильника '{selected_counter[2]}': {last_reading if last_reading else 'немає даних'}\n\n"
         f"Введіть нові показники:",
@@ -270,21 +268,24 @@ async def process_reading(message: types.Message, state: FSMContext):
     counter_alias = data["counter_alias"]
     reading_value = int(message.text)
 
-    # Получаем последние показания для этого счетчика
-    last_reading = db.get_last_reading(counter_id)
-
-    # Проверяем, что новое показание больше предыдущего
-    if last_reading is not None and reading_value <= last_reading:
-        await message.answer(
-            f"Помилка: нові показники ({reading_value}) повинні бути більшими за попередні ({last_reading}).",
-            reply_markup=get_main_menu()
-        )
-        await state.clear()
-        return
-
     try:
-        # Сохраняем новые показания
-        db.add_reading(counter_id, reading_value)
+        # Проверка и запись - одна транзакция: из двух одновременных показаний
+        # одного счетчика второе проверяется уже по первому
+        saved, last_reading = await db.submit_reading(counter_id, reading_value)
+
+        if not saved and last_reading is not None:
+            await message.answer(
+                f"Помилка: нові показники ({reading_value}) повинні бути більшими за попередні ({last_reading}).",
+                reply_markup=get_main_menu()
+            )
+            return
+        if not saved:
+            await message.answer(
+                "Сталася помилка при збереженні показників. Спробуйте ще раз.",
+                reply_markup=get_main_menu()
+            )
+            return
+        audit.record(message.from_user.id, actions.READING_SUBMITTED, counter_id=counter_id, value=reading_value)
 
         # Формируем сообщение с результатами
         response = (
@@ -296,7 +297,7 @@ async def process_reading(message: types.Message, state: FSMContext):
 
         await message.answer(response, reply_markup=get_main_menu())
     except Exception as e:
-        print(f"Error saving reading: {e}")
+        logger.exception("Помилка збереження показників", extra={"counter_id": counter_id})
         await message.answer(
             "Сталася помилка при збереженні показників. Спробуйте ще раз.",
             reply_markup=get_main_menu()
@@ -304,35 +305,17 @@ async def process_reading(message: types.Message, state: FSMContext):
     finally:
         await state.clear()
 
-@router.message(lambda message: message.text == Buttons.ADD_COUNTER)
+@buttons(Buttons.ADD_COUNTER)
 async def start_add_counter(message: types.Message, state: FSMContext):
-    print("Кнопка 'Додати лічильник' нажата")
+    logger.debug("Кнопка 'Додати лічильник'", extra={"user_id": message.from_user.id})
     await message.answer(Texts.COUNTER_ALIAS)
     await state.set_state(AddCounter.waiting_for_alias)
 
 
-@router.message(lambda message: message.text == Buttons.SUBMIT_READINGS)
-async def start_submit_readings(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-    counters = db.get_counters(user_id)
-
-    if not counters:
-        await message.answer("У вас немає зареєстрованих лічильників.")
-        return
-
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    for counter in counters:
-        keyboard.add(KeyboardButton(text=counter[2]))  # counter[2] - это alias
-
-    keyboard.add(KeyboardButton(text=Buttons.BACK))
-
-    await message.answer("Оберіть лічильник:", reply_markup=keyboard)
-    await state.set_state(SubmitReadings.waiting_for_counter)
-
-@router.message(lambda message: message.text == Buttons.EDIT_PROFILE)
+@buttons(Buttons.EDIT_PROFILE)
 async def start_edit_profile(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
 
     if not user:
         await message.answer("Спочатку зареєструйтесь за допомогою команди /start.")
@@ -341,19 +324,19 @@ async def start_edit_profile(message: types.Message, state: FSMContext):
     await message.answer("Оберіть поле для редагування:", reply_markup=get_edit_profile_keyboard())
     return
 
-@router.message(lambda message: message.text == Buttons.FULL_NAME)
+@buttons(Buttons.FULL_NAME)
 async def start_edit_full_name(message: types.Message, state: FSMContext):
     await message.answer("Введіть ПІБ валсника рахунку!\n\nНаприклад: Шевченко Тарас Григорович", reply_markup=get_back_button_keyboard())
     await state.set_state(EditProfile.waiting_for_new_full_name)
     return
 
-@router.message(lambda message: message.text == Buttons.ADDRESS)
+@buttons(Buttons.ADDRESS)
 async def start_edit_address(message: types.Message, state: FSMContext):
     await message.answer("Введіть Нову адрессу валсника рахунку!\n\nНаприклад: вул. Центральна, 1, кв 1)", reply_markup=get_back_button_keyboard())
     await state.set_state(EditProfile.waiting_for_new_address)
     return
 
-@router.message(lambda message: message.text == Buttons.ACCOUNT_NUMBER)
+@buttons(Buttons.ACCOUNT_NUMBER)
 async def start_edit_account_number(message: types.Message, state: FSMContext):
     await message.answer("Введіть Новий номер особистого рахунку!", reply_markup=get_back_button_keyboard())
     await state.set_state(EditProfile.waiting_for_new_account_number)
@@ -377,7 +360,7 @@ async def process_field_selection(message: types.Message, state: FSMContext):
         return
 
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
 
     # Получаем текущее значение выбранного поля
     if field == Buttons.FULL_NAME:
@@ -411,18 +394,19 @@ async def process_new_value(message: types.Message, state: FSMContext):
 
     # Обновляем данные в базе данных
     if field == Buttons.FULL_NAME:
-        db.cursor.execute("UPDATE users SET full_name = ? WHERE user_id = ?", (new_value, user_id))
+        await db.update_user_field(user_id, "full_name", new_value)
     elif field == Buttons.ADDRESS:
-        db.cursor.execute("UPDATE users SET address = ? WHERE user_id = ?", (new_value, user_id))
+        await db.update_user_field(user_id, "address", new_value)
     elif field == Buttons.COUNT_OF_METERS:
         if not new_value.isdigit():
             await message.answer("Кількість лічильників повинна бути числом.")
             return
-        db.cursor.execute("UPDATE users SET water_meters_count = ? WHERE user_id = ?", (int(new_value), user_id))
+        await db.update_user_field(user_id, "water_meters_count", int(new_value))
     elif field == Buttons.ACCOUNT_NUMBER:
-        db.cursor.execute("UPDATE users SET account_number = ? WHERE user_id = ?", (new_value, user_id))
+        await db.update_user_field(user_id, "account_number", new_value)
+    # Новое значение в журнал не пишем: только какое поле менялось
+    audit.record(user_id, actions.PROFILE_EDITED, field=field)
 
-    db.conn.commit()
     await message.answer(f"Поле '{field}' успішно оновлено!", reply_markup=get_main_menu())
     await state.clear()
 
@@ -434,8 +418,8 @@ async def process_edit_new_full_name(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     new_full_name = message.text
 
-    db.cursor.execute("UPDATE users SET full_name = ? WHERE user_id = ?", (new_full_name, user_id))
-    db.conn.commit()
+    await db.update_user_field(user_id, "full_name", new_full_name)
+    audit.record(user_id, actions.PROFILE_EDITED, field="full_name")
 
     await message.answer(f"'ПІБ' успішно оновлено!", reply_markup=get_main_menu())
     await state.clear()
@@ -447,8 +431,8 @@ async def process_edit_new_address(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     new_address = message.text
 
-    db.cursor.execute("UPDATE users SET address = ? WHERE user_id = ?", (new_address, user_id))
-    db.conn.commit()
+    await db.update_user_field(user_id, "address", new_address)
+    audit.record(user_id, actions.PROFILE_EDITED, field="address")
 
     await message.answer(f"Адреса успішно оновлена!", reply_markup=get_main_menu())
     await state.clear()
@@ -464,44 +448,35 @@ async def process_edit_new_account_number(message: types.Message, state: FSMCont
         return
 
     user_id = message.from_user.id
-    db.cursor.execute(
-        "UPDATE users SET account_number = ? WHERE user_id = ?",
-        (message.text, user_id)
-    )
-    db.conn.commit()
+    await db.update_user_field(user_id, "account_number", message.text)
+    audit.record(user_id, actions.PROFILE_EDITED, field="account_number")
 
     await message.answer(f"Номер особистого рахунку успішно оновлений!", reply_markup=get_main_menu())
     await state.clear()
 
 
-@router.message(lambda message: message.text == Buttons.EDIT_COUNTERS)
+@buttons(Buttons.EDIT_COUNTERS)
 async def start_edit_counters(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    counters = db.get_counters(user_id)
+    counters = await db.get_counters(user_id)
 
     if not counters:
         await message.answer("У вас немає зареєстрованих лічильників.", reply_markup=get_main_menu())
         return
 
-    # Формируем клавиатуру с выбором счетчика
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=counter[2])] for counter in counters],  # counter[2] — это alias
-        resize_keyboard=True
-    )
-    keyboard.keyboard.append([KeyboardButton(text=Buttons.BACK)])  # Добавляем кнопку "Назад"
-
+    keyboard = get_counters_keyboard(tuple(counter[2] for counter in counters))  # counter[2] — это alias
     await message.answer("Оберіть лічильник для редагування:", reply_markup=keyboard)
     await state.set_state(EditCounters.waiting_for_counter_selection)
 
 @router.message(EditCounters.waiting_for_counter_selection)
-async def process_counter_selection(message: types.Message, state: FSMContext):
+async def process_edit_counter_selection(message: types.Message, state: FSMContext):
     if message.text == Buttons.BACK:
         await message.answer("Головне меню:", reply_markup=get_main_menu())
         await state.clear()
         return
 
     user_id = message.from_user.id
-    counters = db.get_counters(user_id)
+    counters = await db.get_counters(user_id)
     selected_counter = next((counter for counter in counters if counter[2] == message.text), None)
 
     if not selected_counter:
@@ -527,8 +502,8 @@ async def process_counter_action(message: types.Message, state: FSMContext):
         await message.answer(f"Введіть нову назву для лічильника '{counter_alias}':", reply_markup=types.ReplyKeyboardRemove())
         await state.set_state(EditCounters.waiting_for_new_name)
     elif message.text == Buttons.DELETE_COUNTER:
-        db.cursor.execute("DELETE FROM counters WHERE id = ?", (counter_id,))
-        db.conn.commit()
+        await db.delete_counter(counter_id)
+        audit.record(message.from_user.id, actions.COUNTER_DELETED, counter_id=counter_id)
         await message.answer(f"Лічильник '{counter_alias}' успішно видалено!", reply_markup=get_main_menu())
         await state.clear()
 
@@ -538,12 +513,12 @@ async def process_new_name(message: types.Message, state: FSMContext):
     data = await state.get_data()
     counter_id = data["counter_id"]
 
-    db.cursor.execute("UPDATE counters SET alias = ? WHERE id = ?", (new_name, counter_id))
-    db.conn.commit()
+    await db.rename_counter(counter_id, new_name)
+    audit.record(message.from_user.id, actions.COUNTER_RENAMED, counter_id=counter_id)
     await message.answer(f"Назву лічильника успішно оновлено на '{new_name}'!", reply_markup=get_main_menu())
     await state.clear()
 
-@router.message(lambda message: message.text == Buttons.ABOUT)
+@buttons(Buttons.ABOUT)
 async def show_about_us(message: types.Message):
     # Створюємо інлайн-клавіатуру з кнопкою про розробника
     await message.answer(Texts.ABOUT_US, reply_markup=get_main_menu())
@@ -554,7 +529,7 @@ async def show_about_us(message: types.Message):
         reply_markup=get_about_developer_keyboard()
     )
 
-@router.callback_query(lambda c: c.data == "show_developer_info")
+@router.callback_query(F.data == "show_developer_info")
 async def show_developer_info(callback: types.CallbackQuery):
 
     # Видаляємо попередню інлайн-клавіатуру
@@ -593,12 +568,12 @@ async def process_phone(message: types.Message, state: FSMContext):
         )
         return
 
-    print(f"Получено номер телефону: {phone}")
+    logger.debug("Отримано номер телефону", extra={"user_id": message.from_user.id})
     await state.update_data(phone_number=phone)
 
     await message.answer(Texts.ADDRESS, reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(Registration.waiting_for_address)
-@router.message(lambda message: message.text == Buttons.COUNT_OF_METERS)
+@buttons(Buttons.COUNT_OF_METERS)
 async def start_edit_count_of_meters(message: types.Message, state: FSMContext):
     await message.answer("Введіть нову кількість лічильників:", reply_markup=get_back_button_keyboard())
     await state.set_state(EditProfile.waiting_for_new_count_of_meters)
@@ -623,25 +598,14 @@ async def process_edit_count_of_meters(message: types.Message, state: FSMContext
         return
 
     user_id = message.from_user.id
-    current_count = db.get_user(user_id)[5]  # Получаем текущее количество счетчиков
 
     # Обновляем количество счетчиков в базе данных
-    db.cursor.execute("UPDATE users SET water_meters_count = ? WHERE user_id = ?", (new_count, user_id))
-
-    if new_count > current_count:
-        # Добавляем новые счетчики
-        for i in range(current_count + 1, new_count + 1):
-            db.add_counter(user_id, f"Лічильник-{i}")
-    elif new_count < current_count:
-        # Удаляем лишние счетчики (начиная с последнего)
-        counters = db.get_counters(user_id)
-        for counter in counters[new_count:]:
-            db.cursor.execute("DELETE FROM counters WHERE id = ?", (counter[0],))
-
-    db.conn.commit()
+    await db.set_meters_count(user_id, new_count)
+    audit.record(user_id, actions.METERS_COUNT_CHANGED, meters=new_count)
+
     await message.answer(f"Кількість лічильників успішно оновлено на {new_count}!", reply_markup=get_main_menu())
     await state.clear()
-@router.message(lambda message: message.text == Buttons.GO_HOME)
+@buttons(Buttons.GO_HOME)
 async def go_to_main_menu(message: types.Message, state: FSMContext):
     await message.answer("Головна:", reply_markup=get_main_menu())
     await state.clear()
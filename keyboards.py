@@ -1,143 +1,240 @@
+"""
+Клавиатуры ботов.
+
+Статические клавиатуры создаются один раз при импорте, функции get_*
+возвращают общие экземпляры; клавиатуры с параметрами запоминаются по
+своим параметрам. Все они регистрируются через intern: KeyboardSession
+сериализует такую клавиатуру в JSON при первой отправке и дальше берет
+готовую строку. Поэтому общие клавиатуры нельзя изменять после создания -
+для другого набора кнопок нужна новая клавиатура.
+"""
+import functools
+import weakref
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiohttp import FormData
+
 from buttons import Buttons, InlineButtons, AdminButtons
 
+# Сколько разных наборов счетчиков держать готовыми клавиатурами
+COUNTER_KEYBOARDS_CACHE = 4096
 
-def get_start_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=Buttons.START_BOT)]
+# id(клавиатура) -> JSON (None, пока клавиатуру ни разу не отправляли)
+_interned: Dict[int, Optional[str]] = {}
+
+
+def intern(markup):
+    """Регистрирует общую клавиатуру: ее JSON считается один раз"""
+    key = id(markup)
+    if key not in _interned:
+        _interned[key] = None
+        # Вытесненная из кэша клавиатура удаляется, и ее id может достаться другому объекту
+        weakref.finalize(markup, _interned.pop, key, None)
+    return markup
+
+
+class KeyboardSession(AiohttpSession):
+    """Сессия Bot API, которая не сериализует общие клавиатуры заново при каждом ответе"""
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        key = id(markup)
+        if key not in _interned:
+            return super().build_form_data(bot, method)
+
+        serialized = _interned[key]
+        if serialized is None:
+            serialized = _interned[key] = self.prepare_value(markup, bot=bot, files={})
+
+        form = FormData(quote_fields=False)
+        files = {}
+        for name, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                form.add_field(name, value)
+        form.add_field("reply_markup", serialized)
+        for name, value in files.items():
+            form.add_field(name, value.read(bot), filename=value.filename or name)
+        return form
+
+
+START_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=Buttons.START_BOT)]
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=True
+))
+
+MAIN_MENU = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=Buttons.SUBMIT_READINGS)],
+        [KeyboardButton(text=Buttons.EDIT_PROFILE)],
+        [KeyboardButton(text=Buttons.ABOUT)],
+    ],
+    resize_keyboard=True
+))
+
+EDIT_COUNTERS_MENU = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=Buttons.ADD_COUNTER)],
+        [KeyboardButton(text=Buttons.EDIT_COUNTER)],
+        [KeyboardButton(text=Buttons.BACK)]
+    ],
+    resize_keyboard=True
+))
+
+EDIT_COUNTER_MENU = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=Buttons.EDIT_COUNTER_NAME)],
+        [KeyboardButton(text=Buttons.DELETE_COUNTER)],
+        [KeyboardButton(text=Buttons.BACK)]
+    ],
+    resize_keyboard=True
+))
+
+EDIT_PROFILE_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=Buttons.FULL_NAME)],
+        [KeyboardButton(text=Buttons.ADDRESS)],
+        [KeyboardButton(text=Buttons.COUNT_OF_METERS)],
+        [KeyboardButton(text=Buttons.ACCOUNT_NUMBER)],
+        [KeyboardButton(text=Buttons.GO_HOME)]
+    ],
+    resize_keyboard=True
+))
+
+BACK_BUTTON_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=Buttons.BACK)]],
+    resize_keyboard=True
+))
+
+CONSENT_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text=Buttons.CONSENT_YES),
+            KeyboardButton(text=Buttons.CONSENT_NO)
+        ]
+    ],
+    resize_keyboard=True
+))
+
+ABOUT_DEVELOPER_KEYBOARD = intern(InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(
+        text=InlineButtons.ABOUT_DEVELOPER,
+        callback_data="show_developer_info"
+    )]
+]))
+
+PHONE_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(
+            text=Buttons.SHARE_PHONE,
+            request_contact=True
+        )]
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=True
+))
+
+ADMIN_LOGIN_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=AdminButtons.LOGIN)]],
+    resize_keyboard=True
+))
+
+ADMIN_MAIN_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=AdminButtons.READINGS_REPORT)]],
+    resize_keyboard=True
+))
+
+DATE_RANGE_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text=AdminButtons.CURRENT_MONTH),
+            # KeyboardButton(text=AdminButtons.PREV_MONTH)
         ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-    return keyboard
+        # [KeyboardButton(text=AdminButtons.CUSTOM_PERIOD)]
+        [KeyboardButton(text=AdminButtons.BACK)]
+    ],
+    resize_keyboard=True
+))
+
+DATE_RANGE_SELECTION_KEYBOARD = intern(ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text=AdminButtons.SELECT_DATE_RANGE)],
+        [KeyboardButton(text=AdminButtons.BACK)]
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Оберіть дію..."
+))
+
+
+def get_start_keyboard():
+    return START_KEYBOARD
 
 def get_main_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=Buttons.SUBMIT_READINGS)],
-            [KeyboardButton(text=Buttons.EDIT_PROFILE)],
-            [KeyboardButton(text=Buttons.ABOUT)],
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return MAIN_MENU
 
 def get_edit_counters_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=Buttons.ADD_COUNTER)],
-            [KeyboardButton(text=Buttons.EDIT_COUNTER)],
-            [KeyboardButton(text=Buttons.BACK)]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return EDIT_COUNTERS_MENU
 
 def get_edit_counter_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=Buttons.EDIT_COUNTER_NAME)],
-            [KeyboardButton(text=Buttons.DELETE_COUNTER)],
-            [KeyboardButton(text=Buttons.BACK)]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return EDIT_COUNTER_MENU
 
 def get_edit_profile_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=Buttons.FULL_NAME)],
-            [KeyboardButton(text=Buttons.ADDRESS)],
-            [KeyboardButton(text=Buttons.COUNT_OF_METERS)],
-            [KeyboardButton(text=Buttons.ACCOUNT_NUMBER)],
-            [KeyboardButton(text=Buttons.GO_HOME)]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return EDIT_PROFILE_KEYBOARD
 
 def get_back_button_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=Buttons.BACK)]],
-        resize_keyboard=True
-    )
-    return keyboard
+    return BACK_BUTTON_KEYBOARD
 
 def get_consent_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text=Buttons.CONSENT_YES),
-                KeyboardButton(text=Buttons.CONSENT_NO)
-            ]
-        ],
-        resize_keyboard=True
-    )
-    return keyboard
+    return CONSENT_KEYBOARD
 
 def get_about_developer_keyboard():
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text=InlineButtons.ABOUT_DEVELOPER,
-            callback_data="show_developer_info"
-        )]
-    ])
-    return keyboard
+    return ABOUT_DEVELOPER_KEYBOARD
 
 def get_phone_keyboard():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(
-                text=Buttons.SHARE_PHONE,
-                request_contact=True
-            )]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-    return keyboard
+    return PHONE_KEYBOARD
 
 def get_admin_login_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=AdminButtons.LOGIN)]],
-        resize_keyboard=True
-    )
+    return ADMIN_LOGIN_KEYBOARD
 
 def get_admin_main_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=AdminButtons.READINGS_REPORT)]],
-        resize_keyboard=True
-    )
+    return ADMIN_MAIN_KEYBOARD
 
 def get_date_range_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text=AdminButtons.CURRENT_MONTH),
-                # KeyboardButton(text=AdminButtons.PREV_MONTH)
-            ],
-            # [KeyboardButton(text=AdminButtons.CUSTOM_PERIOD)]
-            [KeyboardButton(text=AdminButtons.BACK)]
-        ],
-        resize_keyboard=True
-    )
+    return DATE_RANGE_KEYBOARD
+
 def get_date_range_selection_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text=AdminButtons.SELECT_DATE_RANGE)],
-            [KeyboardButton(text=AdminButtons.BACK)]
-        ],
-        resize_keyboard=True,
-        input_field_placeholder="Оберіть дію..."
-    )
+    return DATE_RANGE_SELECTION_KEYBOARD
+
+@functools.lru_cache(maxsize=None)
 def get_confirmation_keyboard(yes_text="Так", no_text="Ні"):
-    return ReplyKeyboardMarkup(
+    return intern(ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text=yes_text)],
             [KeyboardButton(text=no_text)]
         ],
         resize_keyboard=True,
         one_time_keyboard=True
-    )
\ No newline at end of file
+    ))
+
+@functools.lru_cache(maxsize=COUNTER_KEYBOARDS_CACHE)
+def get_counters_keyboard(aliases: Tuple[str, ...]):
+    """
+    Выбор счетчика и кнопка "Назад". Ключ - сами названия счетчиков по
+    порядку: добавление, переименование или удаление счетчика дает новый
+    ключ, поэтому сбрасывать кэш при записи не нужно, а у мешканцев с
+    одинаковыми названиями клавиатура общая
+    """
+    return intern(ReplyKeyboardMarkup(
+        keyboard=[
+            *[[KeyboardButton(text=alias)] for alias in aliases],
+            [KeyboardButton(text=Buttons.BACK)]
+        ],
+        resize_keyboard=True
+    ))
@@ -1,62 +1,162 @@
 import asyncio
+import logging
+import secrets
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties  # Импортируем DefaultBotProperties
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 from handlers.user_handlers import router as user_router
-from handlers.admin_handlers import router as admin_router
-from config import BOT_TOKEN, ADMIN_TOKEN, DATABASE_NAME
+from handlers.admin_handlers import router as admin_router, report_jobs, report_cache
+from config import BOT_TOKEN, ADMIN_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_PORT, \
+    TELEGRAM_API_URL, UPDATES_RECORD_FILE, TIMEZONE
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, timedelta
-from database import Database
-from utils.reminders import send_reminders
-from aiohttp import web
+from async_database import get_db
+from utils.reminders import schedule_reminders
+from utils.fsm_storage import create_fsm_storage
+from utils.metrics import REGISTRY, setup_metrics
+from utils.log import setup_logging, shutdown_logging
+from utils.audit import get_audit
+from utils.dispatch import bind_to_bot
+from utils.ordering import setup_ordering
+from utils.throttling import setup_throttling
+from utils.recorder import UpdateRecorder
+from keyboards import KeyboardSession
+from aiohttp import web, ClientError
 
-db = Database(DATABASE_NAME)
+logger = logging.getLogger(__name__)
+
+db = get_db()
 
 # HTTP-эндпоинт для health check
 async def health_check(request):
-    print(f"[HEALTH CHECK] Received request at {datetime.now()}")
+    if not await db.health_check():
+        return web.Response(status=503, text="DATABASE UNAVAILABLE")
     return web.Response(text="OK")
 
-async def start_web_server():
+# Метрики в формате Prometheus
+async def metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+def create_app():
     app = web.Application()
     app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+def register_gauges(storage, sequencer, throttler):
+    """Значения, которые снимаются в момент запроса /metrics: пул, кэши и очереди"""
+    REGISTRY.gauges("db", db.stats)
+    REGISTRY.gauges("report_jobs", report_jobs.stats)
+    REGISTRY.gauges("report_cache", report_cache.stats)
+    REGISTRY.gauges("audit", get_audit().stats)
+    REGISTRY.gauges("updates", sequencer.stats)
+    REGISTRY.gauges("throttling", throttler.stats)
+    if hasattr(storage, "stats"):
+        REGISTRY.gauges("fsm", storage.stats)
+
+async def start_web_server(app):
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)  # Render использует порт 8080
+    site = web.TCPSite(runner, '0.0.0.0', WEB_PORT)  # Render использует порт 8080
     await site.start()
-    print("HTTP-сервер запущен на порту 8080")
+    logger.info("HTTP-сервер запущено", extra={"port": WEB_PORT})
+    return runner
+
+def create_bot(token):
+    # Другой адрес Bot API - например, локальная заглушка для нагрузочных тестов
+    session = KeyboardSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL \
+        else KeyboardSession()
+    return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+def mount_webhooks(app, dp, bots, secret):
+    """Регистрирует обработчики вебхуков (по пути на каждого бота) до запуска сервера"""
+    for name, bot in bots.items():
+        SimpleRequestHandler(dp, bot, secret_token=secret).register(app, path=f"{WEBHOOK_PATH}/{name}")
+
+async def set_webhooks(dp, bots, secret) -> bool:
+    """Сообщает Telegram адреса вебхуков; False - если не получилось хотя бы для одного бота"""
+    try:
+        for name, bot in bots.items():
+            await bot.set_webhook(
+                f"{WEBHOOK_URL}{WEBHOOK_PATH}/{name}",
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        return True
+    except (TelegramAPIError, ClientError, asyncio.TimeoutError) as e:
+        logger.error("Не вдалося встановити вебхук: %s", e)
+        return False
 
 async def main():
     # Инициализация обоих ботов с DefaultBotProperties
-    user_bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    admin_bot = Bot(token=ADMIN_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
+    user_bot = create_bot(BOT_TOKEN)
+    admin_bot = create_bot(ADMIN_TOKEN)
+    bots = {"user": user_bot, "admin": admin_bot}
+    # Состояния диалогов хранятся в базе и переживают перезапуск
+    dp = Dispatcher(storage=create_fsm_storage(db))
+    # Обновления одного чата - по очереди, разных чатов - параллельно
+    sequencer = setup_ordering(dp)
 
-    # Регистрируем роутеры
+    # Регистрируем роутеры: каждый получает обновления только своего бота
+    bind_to_bot(user_router, user_bot)
+    bind_to_bot(admin_router, admin_bot)
     dp.include_router(user_router)
     dp.include_router(admin_router)
+    # Запись обновлений для воспроизведения (benchmarks/fake_telegram.py)
+    recorder = UpdateRecorder(UPDATES_RECORD_FILE) if UPDATES_RECORD_FILE else None
+    if recorder:
+        dp.update.outer_middleware(recorder)
+    # Лимит частоты запросов одного пользователя; до метрик, чтобы отклоненные не попадали во время обработчиков
+    throttler = setup_throttling(dp)
+    # Время обработчиков, запросов к Bot API и количество обновлений для /metrics
+    setup_metrics(dp, bots.values())
+    register_gauges(dp.storage, sequencer, throttler)
 
     # Инициализируем планировщик
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        send_reminders,
-        "interval",
-        days=1,
-        args=(user_bot,),
-        next_run_time=datetime.now() + timedelta(seconds=10)
-    )
+    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+    schedule_reminders(scheduler, user_bot)
     scheduler.start()
 
-    # Запускаем веб-сервер
-    asyncio.create_task(start_web_server())
+    # Вебхуки монтируются на тот же сервер, что и /health
+    app = create_app()
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    if WEBHOOK_URL:
+        mount_webhooks(app, dp, bots, secret)
+    runner = await start_web_server(app)
 
-    print("Бот запущен!")
-    # Запускаем оба бота в одном Dispatcher
-    await dp.start_polling(user_bot, admin_bot)
+    try:
+        if WEBHOOK_URL and await set_webhooks(dp, bots, secret):
+            logger.info("Бот запущено", extra={"mode": "webhook", "url": f"{WEBHOOK_URL}{WEBHOOK_PATH}"})
+            await asyncio.Event().wait()
+        else:
+            # Пока у бота установлен вебхук, getUpdates не работает
+            for bot in bots.values():
+                try:
+                    await bot.delete_webhook()
+                except (TelegramAPIError, ClientError, asyncio.TimeoutError) as e:
+                    logger.error("Не вдалося видалити вебхук: %s", e)
+            logger.info("Бот запущено", extra={"mode": "polling"})
+            # Запускаем оба бота в одном Dispatcher
+            await dp.start_polling(user_bot, admin_bot)
+    finally:
+        await runner.cleanup()
+        # Новые волны напоминаний не запускаем; прерванная рассылка продолжится
+        # после перезапуска (результаты доставки уже в базе)
+        scheduler.shutdown(wait=False)
+        logger.info("Планувальник нагадувань зупинено")
+        # Сохраняем еще не записанные переходы состояний и журнал действий
+        await dp.storage.close()
+        await get_audit().close()
+        if recorder:
+            recorder.close()
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("Бот ВИМКНЕНО")
+        logger.info("Бот ВИМКНЕНО")
+    finally:
+        shutdown_logging()
@@ -0,0 +1,403 @@
+"""
+Версионированные миграции схемы.
+
+Текущая версия схемы хранится в PRAGMA user_version. При открытии базы
+apply_migrations применяет по порядку все миграции с номером больше
+текущего, каждую в своей транзакции вместе с обновлением версии.
+
+Проверка планов запросов (нужные индексы действительно используются):
+    python migrations.py [путь к базе] --check-plans
+Те же проверки на свежей схеме выполняет python -m pytest tests.
+
+Сводка показаний (counters.last_reading*, readings_monthly) ведется при
+каждой записи; сверить ее с сырой таблицей readings или пересчитать:
+    python migrations.py <путь к базе> --verify-summary
+    python migrations.py <путь к базе> --rebuild-summary
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def _create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            full_name TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            address TEXT NOT NULL,
+            water_meters_count INTEGER NOT NULL,
+            account_number TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            alias TEXT NOT NULL,
+            last_reading INTEGER DEFAULT 0,
+            previous_reading INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            counter_id INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (counter_id) REFERENCES counters (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+
+def _create_monthly_readings(conn):
+    # В старых базах таблица была создана с другими колонками (month, year, value),
+    # с которыми add_monthly_reading не работает - сохраняем ее под другим именем
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(monthly_readings)")}
+    if columns and "month_year" not in columns:
+        conn.execute("ALTER TABLE monthly_readings RENAME TO monthly_readings_legacy")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            counter_id INTEGER NOT NULL,
+            current_month_reading INTEGER NOT NULL,
+            previous_month_reading INTEGER,
+            month_year TEXT NOT NULL,
+            reading_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (counter_id) REFERENCES counters (id)
+        )
+    """)
+
+
+def _create_lookup_indexes(conn):
+    # get_counters: WHERE user_id = ? ORDER BY id (id уже есть в индексе как rowid)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_counters_user_id ON counters (user_id)")
+    # get_last_reading и отчет: покрывающий индекс, таблицу readings читать не нужно
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_readings_counter_created "
+        "ON readings (counter_id, created_at, value)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_monthly_readings_counter_date "
+        "ON monthly_readings (counter_id, reading_date)"
+    )
+
+
+# Помесячные итоги, посчитанные напрямую из readings
+_MONTHLY_FROM_READINGS = """
+    SELECT counter_id, month, readings_count, value, created_at FROM (
+        SELECT
+            counter_id,
+            substr(created_at, 1, 7) AS month,
+            value,
+            created_at,
+            COUNT(*) OVER (PARTITION BY counter_id, substr(created_at, 1, 7)) AS readings_count,
+            ROW_NUMBER() OVER (
+                PARTITION BY counter_id, substr(created_at, 1, 7)
+                ORDER BY created_at DESC, id DESC
+            ) AS rn
+        FROM readings
+    )
+    WHERE rn = 1
+"""
+
+
+def rebuild_reading_summary(conn):
+    """
+    Пересчитывает сводку показаний из сырой таблицы readings:
+    последнее/предпоследнее показание с датами в counters и
+    помесячные итоги в readings_monthly. Транзакцией управляет вызывающий
+    """
+    conn.execute("""
+        UPDATE counters SET
+            last_reading = COALESCE((
+                SELECT value FROM readings r WHERE r.counter_id = counters.id
+                ORDER BY created_at DESC, id DESC LIMIT 1), 0),
+            last_reading_at = (
+                SELECT created_at FROM readings r WHERE r.counter_id = counters.id
+                ORDER BY created_at DESC, id DESC LIMIT 1),
+            previous_reading = COALESCE((
+                SELECT value FROM readings r WHERE r.counter_id = counters.id
+                ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 1), 0),
+            previous_reading_at = (
+                SELECT created_at FROM readings r WHERE r.counter_id = counters.id
+                ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 1)
+    """)
+    conn.execute("DELETE FROM readings_monthly")
+    conn.execute(f"INSERT INTO readings_monthly {_MONTHLY_FROM_READINGS}")
+
+
+def verify_reading_summary(conn) -> list:
+    """
+    Сравнивает сводку с сырой таблицей readings.
+    Возвращает список расхождений (пустой - сводка точная)
+    """
+    problems = []
+    rows = conn.execute("""
+        SELECT c.id FROM counters c
+        WHERE c.last_reading_at IS NOT (
+                SELECT created_at FROM readings r WHERE r.counter_id = c.id
+                ORDER BY created_at DESC, id DESC LIMIT 1)
+           OR (c.last_reading_at IS NOT NULL AND c.last_reading IS NOT (
+                SELECT value FROM readings r WHERE r.counter_id = c.id
+                ORDER BY created_at DESC, id DESC LIMIT 1))
+           OR c.previous_reading_at IS NOT (
+                SELECT created_at FROM readings r WHERE r.counter_id = c.id
+                ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 1)
+           OR (c.previous_reading_at IS NOT NULL AND c.previous_reading IS NOT (
+                SELECT value FROM readings r WHERE r.counter_id = c.id
+                ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 1))
+    """).fetchall()
+    problems.extend(f"counters.id={row[0]}: остання/попередня показання не збігаються з readings" for row in rows)
+
+    rows = conn.execute(f"""
+        SELECT counter_id, month FROM (
+            SELECT * FROM ({_MONTHLY_FROM_READINGS})
+            EXCEPT
+            SELECT counter_id, month, readings_count, last_value, last_date FROM readings_monthly
+        )
+        UNION
+        SELECT counter_id, month FROM (
+            SELECT counter_id, month, readings_count, last_value, last_date FROM readings_monthly
+            EXCEPT
+            SELECT * FROM ({_MONTHLY_FROM_READINGS})
+        )
+    """).fetchall()
+    problems.extend(f"readings_monthly ({row[0]}, {row[1]}): не збігається з readings" for row in rows)
+    return problems
+
+
+def _add_reading_summary(conn):
+    # Даты последнего и предпоследнего показаний рядом с их значениями
+    conn.execute("ALTER TABLE counters ADD COLUMN last_reading_at TIMESTAMP")
+    conn.execute("ALTER TABLE counters ADD COLUMN previous_reading_at TIMESTAMP")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS readings_monthly (
+            counter_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            readings_count INTEGER NOT NULL,
+            last_value INTEGER NOT NULL,
+            last_date TIMESTAMP NOT NULL,
+            PRIMARY KEY (counter_id, month),
+            FOREIGN KEY (counter_id) REFERENCES counters (id)
+        ) WITHOUT ROWID
+    """)
+    rebuild_reading_summary(conn)
+
+
+def _create_broadcasts(conn):
+    # Рассылки и результат доставки каждому пользователю: после перезапуска
+    # рассылка продолжается с теми, кому сообщение еще не доставлено
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            campaign TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            campaign TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (campaign, user_id),
+            FOREIGN KEY (campaign) REFERENCES broadcasts (campaign)
+        ) WITHOUT ROWID
+    """)
+
+
+def _create_fsm_states(conn):
+    # Состояния диалогов (FSM): ключ aiogram, состояние и данные в компактном JSON
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)")
+
+
+def _extend_logs(conn):
+    # Журнал действий пользователей: подробности в JSON, выборки и очистка по времени
+    conn.execute("ALTER TABLE logs ADD COLUMN details TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_created ON logs (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_user_created ON logs (user_id, created_at)")
+
+
+def _create_user_search(conn):
+    # Поиск мешканцев для админов: по префиксу номера рахунку - обычный индекс,
+    # по словам ПІБ и адреси (в том числе по началу слова) - FTS5. Индекс FTS
+    # хранит только токены, а сами строки берет из users (content=users);
+    # триггеры поддерживают его при изменении профиля
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_account ON users (account_number)")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            full_name, address,
+            content='users', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, full_name, address) VALUES (new.id, new.full_name, new.address);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, address)
+            VALUES ('delete', old.id, old.full_name, old.address);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF full_name, address ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, address)
+            VALUES ('delete', old.id, old.full_name, old.address);
+            INSERT INTO users_fts (rowid, full_name, address) VALUES (new.id, new.full_name, new.address);
+        END
+    """)
+    conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+
+# (версия, описание, функция миграции); номера только растут, старые миграции не меняем
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "monthly_readings table", _create_monthly_readings),
+    (3, "lookup indexes", _create_lookup_indexes),
+    (4, "reading summary in counters and readings_monthly", _add_reading_summary),
+    (5, "broadcast progress", _create_broadcasts),
+    (6, "fsm states", _create_fsm_states),
+    (7, "audit details and indexes in logs", _extend_logs),
+    (8, "account index and full-text search over users", _create_user_search),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn) -> int:
+    """
+    Применяет недостающие миграции и возвращает итоговую версию схемы
+    """
+    version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Версию перечитываем под блокировкой: миграцию мог уже применить другой процесс
+            if get_schema_version(conn) >= number:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            logger.info("Застосовано міграцію %s: %s", number, description)
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_schema_version(conn)
+
+
+def check_query_plans(conn) -> list:
+    """
+    Проверяет, что горячие запросы используют индексы, а не полный
+    просмотр таблиц. Возвращает список найденных проблем (пустой - все в порядке).
+    """
+    from database import GET_COUNTERS_QUERY, GET_LAST_READING_QUERY, READINGS_REPORT_QUERY, \
+        SEARCH_USERS_QUERY, READING_HISTORY_QUERY, SUBMIT_READING_QUERY
+
+    period = {"start": "1970-01-01", "end": "2100-12-31"}
+    # (название, запрос, параметры, что должно быть в плане, таблицы, которые нельзя читать целиком)
+    checks = [
+        ("get_counters", GET_COUNTERS_QUERY, (1,), "idx_counters_user_id", ("counters", "c")),
+        ("get_last_reading", GET_LAST_READING_QUERY, (1,), "INTEGER PRIMARY KEY", ("counters", "c")),
+        ("submit_reading", SUBMIT_READING_QUERY, {"counter_id": 1, "value": 1, "now": "2025-01-01 00:00:00"},
+         "INTEGER PRIMARY KEY", ("counters",)),
+        ("get_readings_report", READINGS_REPORT_QUERY, period, "idx_readings_counter_created",
+         ("readings", "r", "p")),
+        ("search_users", SEARCH_USERS_QUERY.format(op=">", order="ASC"),
+         {"query": "1", "query_end": "1\U0010ffff", "match": '"1"*', "cursor": 0, "limit": 10},
+         "idx_users_account", ("users",)),
+        ("get_reading_history", READING_HISTORY_QUERY.format(op="<", order="DESC"),
+         {"user_id": 1, "cursor": 1, "limit": 10}, "idx_readings_counter_created", ("readings", "r", "c")),
+    ]
+
+    problems = []
+    for name, query, params, expected, tables in checks:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        if not any(expected in step for step in plan):
+            problems.append(f"{name}: не використовує {expected}: {plan}")
+        for step in plan:
+            # Полный просмотр таблицы (или ее псевдонима) без индекса
+            words = step.split()
+            if words[0] == "SCAN" and "INDEX" not in step and words[1] in tables:
+                problems.append(f"{name}: повний перегляд таблиці: {step}")
+        # История сортирует показания одного мешканца (всех его счетчиков) - их немного
+        if name not in ("get_readings_report", "get_reading_history") and any("TEMP B-TREE" in step for step in plan):
+            problems.append(f"{name}: додаткове сортування: {plan}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Міграції схеми бази")
+    parser.add_argument("database", nargs="?", default=":memory:")
+    parser.add_argument("--check-plans", action="store_true")
+    parser.add_argument("--verify-summary", action="store_true",
+                        help="звірити зведення показань з таблицею readings")
+    parser.add_argument("--rebuild-summary", action="store_true",
+                        help="перерахувати зведення показань з таблиці readings")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    connection = sqlite3.connect(args.database)
+    print(f"Версія схеми: {apply_migrations(connection)}")
+
+    if args.check_plans:
+        found = check_query_plans(connection)
+        for problem in found:
+            print(f"[ERROR] {problem}")
+        if found:
+            sys.exit(1)
+        print("Плани запитів у порядку")
+
+    if args.rebuild_summary:
+        connection.execute("BEGIN IMMEDIATE")
+        rebuild_reading_summary(connection)
+        connection.commit()
+        print("Зведення показань перераховано")
+
+    if args.verify_summary:
+        found = verify_reading_summary(connection)
+        for problem in found:
+            print(f"[ERROR] {problem}")
+        if found:
+            sys.exit(1)
+        print("Зведення показань збігається з readings")
@@ -0,0 +1,14 @@
+import os
+import shutil
+import tempfile
+
+# Модули обработчиков при импорте создают общий AsyncDatabase над DATABASE_NAME:
+# тесты не должны трогать рабочую базу
+_tmp = tempfile.mkdtemp(prefix="meter-bot-tests-")
+os.environ["DATABASE_NAME"] = os.path.join(_tmp, "test.db")
+# Границы месяцев в тестах - по киевскому времени
+os.environ["TIMEZONE"] = "Europe/Kyiv"
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
@@ -0,0 +1,23 @@
+"""Тексты админ-бота уходят с parse_mode=HTML: введенное мешканцами экранируется"""
+from handlers.admin_handlers import format_search_results, format_history, format_history_header
+
+RESIDENT = {"id": 1, "user_id": 10, "full_name": "<b>&", "address": "ТОВ <Оазис>", "account_number": "12&3"}
+# Строка get_user: full_name - [2], account_number - [6]
+USER_ROW = (1, 10, "<b>&", "380000000000", "ТОВ <Оазис>", 1, "12&3")
+
+
+def test_search_results_are_escaped():
+    text = format_search_results("<b>", [RESIDENT])
+    assert "«&lt;b&gt;»" in text
+    assert "• &lt;b&gt;&amp;" in text
+    assert "ТОВ &lt;Оазис&gt;, рах. 12&amp;3" in text
+    assert "<b>" not in text
+
+
+def test_history_is_escaped():
+    readings = [{"id": 1, "created_at": "2025-01-01 10:00:00", "alias": "Кухня <гаряча>", "value": 5}]
+    text = format_history(USER_ROW, readings)
+    assert text.startswith(format_history_header(USER_ROW))
+    assert "📈 Показники: &lt;b&gt;&amp;, рах. 12&amp;3" in text
+    assert "Кухня &lt;гаряча&gt;: 5" in text
+    assert "<" not in text
@@ -0,0 +1,106 @@
+"""Рассылка: повторный запуск не дублирует сообщения, ошибки Telegram обрабатываются"""
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from async_database import AsyncDatabase, ConnectionPool
+from database import Database
+from utils.broadcast import Broadcaster
+
+CAMPAIGN = "reminder-2025-02-0d"
+BLOCKED = 2
+RATE_LIMITED = 3
+
+
+class FakeBot:
+    """Бот без сети: BLOCKED заблокировал бота, на первое сообщение RATE_LIMITED Telegram отвечает 429"""
+
+    def __init__(self):
+        self.attempts = []
+
+    async def send_message(self, chat_id, text):
+        self.attempts.append((chat_id, time.monotonic()))
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id == BLOCKED:
+            raise TelegramForbiddenError(method, "Forbidden: bot was blocked by the user")
+        if chat_id == RATE_LIMITED and sum(user == chat_id for user, _ in self.attempts) == 1:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=1)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "broadcast.db")
+    db = Database(path)
+    for user_id in range(1, 6):
+        db.register_user(user_id, f"Мешканець {user_id}", "380000000000", "вул. Тестова, 1", 1, f"{user_id}")
+    db.plan_broadcast(CAMPAIGN, "Нагадування")
+    # До перезапуска первому мешканцу рассылка уже дошла
+    db.record_broadcast_results(CAMPAIGN, [(1, "sent", 1)])
+    db.conn.close()
+    return path
+
+
+async def recipients(db):
+    after = 0
+    while page := await db.get_broadcast_recipients(CAMPAIGN, after=after, limit=2):
+        for user_id in page:
+            yield user_id
+        after = page[-1]
+
+
+def deliveries(db_path) -> dict:
+    db = Database(db_path)
+    try:
+        rows = db.conn.execute(
+            "SELECT user_id, status, attempts FROM broadcast_deliveries WHERE campaign = ?", (CAMPAIGN,))
+        return {user_id: (status, attempts) for user_id, status, attempts in rows}
+    finally:
+        db.conn.close()
+
+
+def run_broadcast(db_path, bot):
+    async def run():
+        db = AsyncDatabase(ConnectionPool(db_path))
+        try:
+            return await Broadcaster(bot, db, CAMPAIGN, "Нагадування", rate=1000, burst=10,
+                                     concurrency=3).run(recipients(db))
+        finally:
+            db.close()
+
+    return asyncio.run(run())
+
+
+def test_resumed_broadcast_skips_delivered_and_records_errors(db_path):
+    bot = FakeBot()
+    stats = run_broadcast(db_path, bot)
+
+    assert 1 not in {user_id for user_id, _ in bot.attempts}
+    assert stats["sent"] == 3 and stats["blocked"] == 1 and stats["retries"] == 1
+    assert deliveries(db_path) == {
+        1: ("sent", 1),
+        BLOCKED: ("blocked", 1),
+        RATE_LIMITED: ("sent", 2),
+        4: ("sent", 1),
+        5: ("sent", 1),
+    }
+
+
+def test_retry_after_pauses_whole_broadcast(db_path):
+    bot = FakeBot()
+    run_broadcast(db_path, bot)
+
+    limited_at = next(at for user_id, at in bot.attempts if user_id == RATE_LIMITED)
+    later = [at for _, at in bot.attempts if at > limited_at]
+    assert later
+    # После 429 никто не получает сообщений раньше, чем через retry_after
+    assert min(later) - limited_at >= 0.9
+
+
+def test_finished_broadcast_is_not_sent_again(db_path):
+    run_broadcast(db_path, FakeBot())
+    bot = FakeBot()
+    run_broadcast(db_path, bot)
+    assert bot.attempts == []
@@ -0,0 +1,71 @@
+"""Состояния FSM переживают перезапуск бота, брошенные - удаляются"""
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from async_database import AsyncDatabase, ConnectionPool
+from database import Database
+from utils.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1001, chat_id=10, user_id=10)
+
+
+def stored_keys(db_path) -> list:
+    db = Database(db_path)
+    try:
+        return [row[0] for row in db.conn.execute("SELECT key FROM fsm_states ORDER BY key")]
+    finally:
+        db.conn.close()
+
+
+def test_state_survives_restart(tmp_path):
+    db_path = str(tmp_path / "fsm.db")
+
+    async def before_restart():
+        db = AsyncDatabase(ConnectionPool(db_path))
+        storage = SQLiteStorage(db, flush_interval=60)
+        await storage.set_state(KEY, "SubmitReadings:waiting_for_reading")
+        await storage.set_data(KEY, {"counter_id": 7, "counter_alias": "Кухня"})
+        # Отложенные изменения сохраняются при закрытии
+        await storage.close()
+        db.close()
+
+    async def after_restart():
+        db = AsyncDatabase(ConnectionPool(db_path))
+        storage = SQLiteStorage(db)
+        try:
+            return await storage.get_state(KEY), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+            db.close()
+
+    asyncio.run(before_restart())
+    state, data = asyncio.run(after_restart())
+    assert state == "SubmitReadings:waiting_for_reading"
+    assert data == {"counter_id": 7, "counter_alias": "Кухня"}
+
+
+def test_stale_states_are_purged(tmp_path):
+    db_path = str(tmp_path / "fsm.db")
+    ttl = 60
+
+    async def run():
+        db = AsyncDatabase(ConnectionPool(db_path))
+        storage = SQLiteStorage(db, ttl=ttl, flush_interval=0.01)
+        stale = StorageKey(bot_id=1001, chat_id=20, user_id=20)
+        await db.save_fsm_states([(storage.key_builder.build(stale), "Registration:waiting_for_name", None,
+                                   time.time() - 2 * ttl)])
+        try:
+            # Брошенное состояние не читается, даже пока оно еще в базе
+            assert await storage.get_state(stale) is None
+            await storage.set_state(KEY, "SubmitReadings:waiting_for_counter")
+            # Первая же периодическая запись удаляет устаревшие состояния
+            await asyncio.sleep(0.1)
+            return storage.key_builder.build(KEY)
+        finally:
+            await storage.close()
+            db.close()
+
+    fresh = asyncio.run(run())
+    assert stored_keys(db_path) == [fresh]
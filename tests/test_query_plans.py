@@ -0,0 +1,62 @@
+"""
+Планы горячих запросов на актуальной схеме: нужные индексы используются,
+полного просмотра таблиц нет.
+"""
+import pytest
+
+from database import Database, GET_COUNTERS_QUERY, GET_LAST_READING_QUERY, READINGS_REPORT_QUERY, \
+    SEARCH_USERS_QUERY, READING_HISTORY_QUERY, SUBMIT_READING_QUERY, BROADCAST_RECIPIENTS_QUERY
+from migrations import check_query_plans
+
+PERIOD = {"start": "1970-01-01", "end": "2100-12-31"}
+
+# (запрос, параметры, индекс, который должен быть в плане, таблицы, которые нельзя читать целиком)
+HOT_QUERIES = {
+    "get_counters": (GET_COUNTERS_QUERY, (1,), "idx_counters_user_id", ("counters", "c")),
+    "get_last_reading": (GET_LAST_READING_QUERY, (1,), "INTEGER PRIMARY KEY", ("counters", "c")),
+    "submit_reading": (SUBMIT_READING_QUERY, {"counter_id": 1, "value": 1, "now": "2025-01-01 00:00:00"},
+                       "INTEGER PRIMARY KEY", ("counters",)),
+    "get_readings_report": (READINGS_REPORT_QUERY, PERIOD, "idx_readings_counter_created",
+                            ("readings", "r", "p")),
+    "search_users": (SEARCH_USERS_QUERY.format(op=">", order="ASC"),
+                     {"query": "1", "query_end": "1\U0010ffff", "match": '"1"*', "cursor": 0, "limit": 10},
+                     "idx_users_account", ("users",)),
+    "get_reading_history": (READING_HISTORY_QUERY.format(op="<", order="DESC"),
+                            {"user_id": 1, "cursor": 1, "limit": 10}, "idx_readings_counter_created",
+                            ("readings", "r", "c")),
+    "get_broadcast_recipients": (BROADCAST_RECIPIENTS_QUERY,
+                                 {"campaign": "reminder", "month": "2025-01", "after": 0, "limit": 500},
+                                 "idx_counters_user_id", ("broadcast_deliveries", "d", "counters", "c")),
+}
+
+
+@pytest.fixture(scope="module")
+def conn():
+    db = Database(":memory:")
+    yield db.conn
+    db.conn.close()
+
+
+def query_plan(conn, query, params) -> list:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(conn, name):
+    query, params, index, tables = HOT_QUERIES[name]
+    plan = query_plan(conn, query, params)
+    assert any(index in step for step in plan), plan
+    scans = [step for step in plan if step.split()[0] == "SCAN" and "INDEX" not in step
+             and step.split()[1] in tables]
+    assert not scans, plan
+
+
+def test_broadcast_recipients_checks_months_by_key(conn):
+    query, params, _, _ = HOT_QUERIES["get_broadcast_recipients"]
+    plan = query_plan(conn, query, params)
+    assert any("SEARCH d USING PRIMARY KEY" in step for step in plan), plan
+    assert any("SEARCH m USING PRIMARY KEY" in step for step in plan), plan
+
+
+def test_check_query_plans_finds_no_problems(conn):
+    assert check_query_plans(conn) == []
@@ -0,0 +1,39 @@
+"""Месяц показания считается по часовому поясу мешканцев, а не по часам сервера"""
+from datetime import datetime, timezone
+
+import pytest
+
+import database
+from database import Database
+
+
+class ServerClock(datetime):
+    """Сервер в UTC: 31 января 22:30 - в Киеве уже 1 февраля 00:30"""
+
+    @classmethod
+    def now(cls, tz=None):
+        moment = datetime(2025, 1, 31, 22, 30, tzinfo=timezone.utc)
+        return moment.astimezone(tz) if tz else moment.replace(tzinfo=None)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "datetime", ServerClock)
+    db = Database(str(tmp_path / "readings.db"))
+    db.register_user(10, "Мешканець", "380000000000", "вул. Тестова, 1", 1, "1001")
+    yield db
+    db.conn.close()
+
+
+def test_reading_after_midnight_kyiv_counts_for_new_month(db):
+    counter_id = db.get_counters(10)[0][0]
+    assert db.plan_broadcast("reminder-2025-02-0d", "Нагадування", "2025-02") == 1
+
+    assert db.submit_reading(counter_id, 100) == (True, None)
+
+    month, last_date = db.conn.execute(
+        "SELECT month, last_date FROM readings_monthly WHERE counter_id = ?", (counter_id,)).fetchone()
+    assert month == "2025-02"
+    assert last_date == "2025-02-01 00:30:00"
+    # Передавший показания в новом месяце не получает его напоминания
+    assert db.get_broadcast_recipients("reminder-2025-02-0d", "2025-02") == []
@@ -0,0 +1,57 @@
+"""Общий отчет: файл загружается один раз и удаляется после последнего подписчика"""
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.types import FSInputFile
+
+from utils.report_jobs import ReportJob
+
+
+class FakeMessage:
+    def __init__(self, uploads: list):
+        self.uploads = uploads
+
+    async def answer_document(self, document, caption=None):
+        if isinstance(document, FSInputFile):
+            self.uploads.append(document.path)
+            # Загрузка в Telegram идет дольше, чем отправка по file_id
+            await asyncio.sleep(0.05)
+            return SimpleNamespace(document=SimpleNamespace(file_id="file-1"))
+        return SimpleNamespace(document=SimpleNamespace(file_id=document))
+
+
+def test_subscribers_share_one_upload(tmp_path):
+    report = tmp_path / "report.xlsx"
+    report.write_bytes(b"xlsx")
+
+    async def run():
+        job = ReportJob(1, "2025-01-01", "2025-01-31", 0)
+        job.subscribers = 3
+        job.future.set_result((str(report), 10))
+        uploads = []
+        sent = await asyncio.gather(*(job.send_document(FakeMessage(uploads), "Звіт") for _ in range(3)))
+        for _ in range(3):
+            job.release()
+        return uploads, sent
+
+    uploads, sent = asyncio.run(run())
+    assert uploads == [str(report)]
+    assert {message.document.file_id for message in sent} == {"file-1"}
+    assert not report.exists()
+
+
+def test_failed_build_removes_partial_file(tmp_path):
+    partial = tmp_path / "report.xlsx"
+    partial.write_bytes(b"partial")
+
+    async def run():
+        job = ReportJob(1, "2025-01-01", "2025-01-31", 0)
+        job.subscribers = 2
+        job.filename = str(partial)
+        job.future.set_exception(OSError("disk full"))
+        job.release()
+        assert partial.exists()
+        job.release()
+
+    asyncio.run(run())
+    assert not partial.exists()
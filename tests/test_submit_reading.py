@@ -0,0 +1,52 @@
+"""Проверка и запись показания одним вызовом: гонки и нижняя граница"""
+import asyncio
+
+import pytest
+
+from async_database import AsyncDatabase, ConnectionPool
+from database import Database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "readings.db")
+    db = Database(path)
+    db.register_user(10, "Мешканець", "380000000000", "вул. Тестова, 1", 1, "1001")
+    db.conn.close()
+    return path
+
+
+def readings(db_path, counter_id) -> list:
+    db = Database(db_path)
+    try:
+        return db.conn.execute("SELECT value FROM readings WHERE counter_id = ?", (counter_id,)).fetchall()
+    finally:
+        db.conn.close()
+
+
+@pytest.mark.parametrize("group_commit_ms", [0, 5])
+def test_racing_submissions_save_once(db_path, group_commit_ms):
+    async def race():
+        db = AsyncDatabase(ConnectionPool(db_path), group_commit_ms=group_commit_ms)
+        try:
+            counter_id = (await db.get_counters(10))[0][0]
+            results = await asyncio.gather(db.submit_reading(counter_id, 100), db.submit_reading(counter_id, 100))
+            return counter_id, results
+        finally:
+            db.close()
+
+    counter_id, results = asyncio.run(race())
+    assert sorted(saved for saved, _ in results) == [False, True]
+    # Проигравший получает показание победителя
+    assert (False, 100) in results
+    assert readings(db_path, counter_id) == [(100,)]
+
+
+def test_first_reading_must_be_positive(db_path):
+    db = Database(db_path)
+    counter_id = db.get_counters(10)[0][0]
+    assert db.submit_reading(counter_id, 0) == (False, 0)
+    assert db.submit_reading(counter_id, 1) == (True, None)
+    assert db.submit_reading(counter_id, 1) == (False, 1)
+    db.conn.close()
+    assert readings(db_path, counter_id) == [(1,)]
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from async_database import get_db
+from config import AUDIT_ENABLED, AUDIT_FLUSH_INTERVAL, AUDIT_BUFFER_SIZE, AUDIT_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Действия, которые пишутся в журнал
+REGISTERED = "register"
+READING_SUBMITTED = "reading"
+PROFILE_EDITED = "profile_edit"
+METERS_COUNT_CHANGED = "meters_count"
+COUNTER_ADDED = "counter_add"
+COUNTER_RENAMED = "counter_rename"
+COUNTER_DELETED = "counter_delete"
+
+# Сколько записей писать одной транзакцией: писатель в пуле один, и
+# большая пачка задержала бы показания, которые ждут его же
+FLUSH_BATCH = 200
+
+# Как часто (сек) удалять записи старше срока хранения
+PURGE_INTERVAL = 24 * 3600
+
+
+class AuditLog:
+    """
+    Журнал действий пользователей в таблице logs.
+
+    record() только добавляет запись в буфер в памяти и сразу возвращается,
+    поэтому обработчик не ждет базу. Фоновая задача раз в flush_interval
+    секунд записывает накопленное через писателя пула пачками по
+    FLUSH_BATCH записей и раз в сутки удаляет записи старше
+    retention_days. Если база долго недоступна и буфер переполнен,
+    отбрасываются самые старые записи (счетчик dropped).
+    """
+
+    def __init__(self, db, enabled=AUDIT_ENABLED, flush_interval=AUDIT_FLUSH_INTERVAL,
+                 buffer_size=AUDIT_BUFFER_SIZE, retention_days=AUDIT_RETENTION_DAYS):
+        self.db = db
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._buffer = deque(maxlen=buffer_size)
+        self._flusher = None
+        self._purged_at = 0.0
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, user_id: int, action: str, **details):
+        """Добавляет действие в журнал (без ожидания записи в базу)"""
+        if not self.enabled:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((
+            user_id,
+            action,
+            json.dumps(details, ensure_ascii=False, separators=(",", ":")) if details else None,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        ))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def flush(self):
+        """Записывает буфер в базу"""
+        events = list(self._buffer)
+        self._buffer.clear()
+        for start in range(0, len(events), FLUSH_BATCH):
+            batch = events[start:start + FLUSH_BATCH]
+            try:
+                await self.db.write_audit_events(batch)
+            except Exception:
+                # Вернем незаписанное в начало буфера, чтобы записать в следующий раз.
+                # Пока шла запись, буфер мог пополниться: extendleft в полный deque
+                # вытеснил бы новые записи справа, поэтому лишние старые отбрасываем
+                # здесь и учитываем в dropped
+                pending = events[start:]
+                free = self._buffer.maxlen - len(self._buffer)
+                if len(pending) > free:
+                    self.dropped += len(pending) - free
+                    pending = pending[len(pending) - free:]
+                self._buffer.extendleft(reversed(pending))
+                raise
+            self.written += len(batch)
+
+    async def purge(self) -> int:
+        """Удаляет записи старше срока хранения"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+        return await self.db.purge_audit_events(cutoff)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    self._purged_at = time.monotonic()
+                    deleted = await self.purge()
+                    if deleted:
+                        logger.info("Видалено старі записи журналу", extra={"deleted": deleted})
+            except Exception:
+                logger.exception("Помилка запису журналу дій", extra={"pending": len(self._buffer)})
+
+    def stats(self) -> dict:
+        return {"pending": len(self._buffer), "written": self.written, "dropped": self.dropped}
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+_audit = None
+
+
+def get_audit() -> AuditLog:
+    """Общий журнал действий процесса"""
+    global _audit
+    if _audit is None:
+        _audit = AuditLog(get_db())
+    return _audit
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import BROADCAST_RATE, BROADCAST_BURST, BROADCAST_CONCURRENCY, BROADCAST_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# Результаты, после которых пользователю эту рассылку больше не отправляем
+FINAL_STATUSES = ("sent", "blocked", "invalid")
+
+# Пауза между повторами одному чату при сетевых ошибках: не меньше секунды
+# (лимит Telegram - около одного сообщения в секунду в один чат), дальше удваивается
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Результаты доставки сохраняются пачками: не реже, чем раз в FLUSH_INTERVAL секунд
+# или каждые FLUSH_EVERY сообщений
+FLUSH_EVERY = 50
+FLUSH_INTERVAL = 2.0
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости: rate сообщений в секунду в среднем,
+    не больше capacity подряд. pause() останавливает выдачу на время,
+    которое Telegram вернул в ответе 429
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Ожидающие обслуживаются по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class Broadcaster:
+    """
+    Рассылка одного сообщения списку пользователей.
+
+    Сообщения отправляют concurrency задач через общий TokenBucket.
+    На 429 (TelegramRetryAfter) останавливается вся рассылка на указанное
+    время, сетевые ошибки повторяются с экспоненциальной паузой,
+    заблокировавшие бота и несуществующие чаты пропускаются.
+    Результаты пишутся в broadcast_deliveries, поэтому после перезапуска
+    выборка получателей рассылки с тем же campaign (get_broadcast_recipients)
+    содержит только тех, кому она не дошла.
+    """
+
+    def __init__(self, bot: Bot, db, campaign: str, text: str, rate=BROADCAST_RATE, burst=BROADCAST_BURST,
+                 concurrency=BROADCAST_CONCURRENCY, max_attempts=BROADCAST_MAX_ATTEMPTS):
+        self.bot = bot
+        self.db = db
+        self.campaign = campaign
+        self.text = text
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.limiter = TokenBucket(rate, burst)
+        self.stats = {"sent": 0, "blocked": 0, "invalid": 0, "failed": 0, "retries": 0}
+        self._results = []
+        self._flushed_at = time.monotonic()
+
+    async def run(self, user_ids) -> dict:
+        """
+        Отправляет сообщение всем user_ids и возвращает статистику. user_ids -
+        список или асинхронный итератор; тех, кому рассылка уже доставлена,
+        исключает сама выборка (get_broadcast_recipients)
+        """
+        if await self.db.start_broadcast(self.campaign, self.text):
+            logger.info("Розсилку вже завершено", extra={"campaign": self.campaign})
+            return self.stats
+
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        tasks = [asyncio.create_task(self._produce(queue, user_ids))]
+        tasks += [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            # Ошибка любой задачи прерывает рассылку: иначе без живых отправителей
+            # производитель навсегда остановился бы на заполненной очереди
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._flush()
+
+        await self.db.finish_broadcast(self.campaign)
+        logger.info("Розсилку завершено", extra={"campaign": self.campaign, **self.stats})
+        return self.stats
+
+    async def _produce(self, queue: asyncio.Queue, user_ids):
+        async for user_id in _iterate(user_ids):
+            await queue.put(user_id)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            status, attempts = await self._deliver(user_id)
+            self.stats[status] += 1
+            self._results.append((user_id, status, attempts))
+            if len(self._results) >= FLUSH_EVERY or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                await self._flush()
+
+    async def _deliver(self, user_id: int):
+        """Отправляет сообщение одному пользователю: (статус, количество попыток)"""
+        for attempt in range(1, self.max_attempts + 1):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(user_id, self.text)
+                return "sent", attempt
+            except TelegramRetryAfter as e:
+                # Превышен общий лимит бота: ждут все отправители
+                self.limiter.pause(e.retry_after)
+                delay = e.retry_after
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота или удалил аккаунт
+                return "blocked", attempt
+            except TelegramBadRequest as e:
+                logger.info("Чат недоступний: %s", e.message, extra={"campaign": self.campaign, "user_id": user_id})
+                return "invalid", attempt
+            except (TelegramNetworkError, TelegramServerError):
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+            except Exception:
+                logger.exception("Помилка розсилки", extra={"campaign": self.campaign, "user_id": user_id})
+                return "failed", attempt
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+        return "failed", self.max_attempts
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        self._flushed_at = time.monotonic()
+        if results:
+            await self.db.record_broadcast_results(self.campaign, results)
+
+
+async def _iterate(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
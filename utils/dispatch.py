@@ -0,0 +1,79 @@
+"""
+Маршрутизация обновлений без перебора фильтров.
+
+aiogram проверяет обработчики роутера по очереди, вызывая фильтр каждого.
+Здесь:
+- ButtonIndex - все обработчики reply-кнопок роутера за одним обработчиком,
+  который находит нужный по точному тексту в словаре;
+- bind_to_bot - роутер принимает обновления только своего бота: фильтр
+  стоит на уровне наблюдателя, поэтому обновления другого бота отсекаются
+  одной проверкой, не доходя до обработчиков.
+"""
+from typing import Callable, Dict, Optional
+
+from aiogram import Bot, Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters import Filter
+from aiogram.types import Message
+
+
+class ButtonIndex:
+    """
+    Обработчики кнопок по точному тексту сообщения:
+
+        buttons = ButtonIndex(router)
+
+        @buttons(Buttons.ABOUT)
+        async def show_about_us(message: types.Message): ...
+
+    Индекс регистрирует в роутере один обработчик при создании, поэтому
+    создавать его нужно сразу после роутера: нажатие кнопки меню
+    обрабатывается раньше обработчиков состояний и выводит из любого
+    незаконченного диалога. Аргументы (state, bot и т.д.) передаются
+    обработчику кнопки так же, как передал бы aiogram.
+    """
+
+    def __init__(self, router: Router):
+        self._handlers: Dict[str, CallableObject] = {}
+        router.message(self._match)(self._dispatch)
+
+    def __call__(self, *texts: str) -> Callable:
+        def register(callback):
+            handler = CallableObject(callback)
+            for text in texts:
+                if text in self._handlers:
+                    raise ValueError(f"Кнопка {text!r} вже має обробник {self._handlers[text].callback.__name__}")
+                self._handlers[text] = handler
+            return callback
+        return register
+
+    def get(self, text: Optional[str]) -> Optional[CallableObject]:
+        return self._handlers.get(text)
+
+    def _match(self, message: Message):
+        handler = self._handlers.get(message.text)
+        # Найденный обработчик передается в _dispatch (и в метрики) через данные фильтра
+        return {"button_handler": handler} if handler is not None else False
+
+    @staticmethod
+    async def _dispatch(message: Message, button_handler: CallableObject, **data):
+        return await button_handler.call(message, **data)
+
+
+class FromBot(Filter):
+    """Обновление пришло боту с этим id"""
+
+    def __init__(self, bot_id: int):
+        self.bot_id = bot_id
+
+    async def __call__(self, event, bot: Bot) -> bool:
+        return bot.id == self.bot_id
+
+
+def bind_to_bot(router: Router, bot: Bot):
+    """Роутер (с вложенными) получает только обновления bot"""
+    bot_filter = FromBot(bot.id)
+    for name, observer in router.observers.items():
+        # update и error - служебные наблюдатели, в них обработчики этого бота не регистрируются
+        if name not in ("update", "error"):
+            observer.filter(bot_filter)
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+BASE_COLUMNS = [
+    'Особовий рахунок',
+    'ПІБ',
+    'Адреса',
+    'Телефон'
+]
+
+COUNTER_COLUMNS = ['поточні', 'дата', 'попередні', 'дата попередніх']
+
+# Как часто (в пользователях) сообщать о прогрессе записи
+PROGRESS_EVERY = 1000
+
+
+def report_columns(max_counters: int) -> list:
+    """Базовые колонки и по четыре колонки на каждый счетчик"""
+    columns = list(BASE_COLUMNS)
+    for i in range(1, max_counters + 1):
+        columns.extend(f'Лічильник-{i} {suffix}' for suffix in COUNTER_COLUMNS)
+    return columns
+
+
+def user_row(user: dict, max_counters: int) -> list:
+    """Строка отчета для одного пользователя из словаря get_readings_report"""
+    row = [user['account_number'], user['full_name'], user['address'], user['phone_number']]
+
+    user_counters = {c['alias']: c for c in user['counters']}
+    for i in range(1, max_counters + 1):
+        counter = user_counters.get(f'Лічильник-{i}')
+        if counter and counter['readings']:
+            reading = counter['readings'][0]
+            row.extend([reading['value'], reading['date'], reading['prev_value'], reading['prev_date']])
+        else:
+            row.extend([None, None, None, None])
+    return row
+
+
+def write_report(users, max_counters: int, longest: dict = None, filename: str = None, progress=None):
+    """
+    Потоково пишет отчет в xlsx, не держа в памяти ни все строки, ни ячейки.
+
+    Рабочая книга открывается в режиме write_only, поэтому ширину колонок
+    нужно знать до первой строки: она считается по заголовку и по longest -
+    максимальной длине значений базовых колонок ({колонка: длина}).
+    Args:
+        users: любой итерируемый источник словарей пользователей
+        max_counters: сколько счетчиков выводить на пользователя
+        longest: максимальные длины значений по колонкам (необязательно)
+        filename: имя файла (по умолчанию readings_report_<время>.xlsx)
+        progress: необязательный callback(stage, count), stage - "rows" или "saving"
+    Returns:
+        (имя файла, количество записанных пользователей)
+    """
+    if filename is None:
+        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f'readings_report_{current_time}.xlsx'
+    longest = longest or {}
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Report')
+
+    columns = report_columns(max_counters)
+    for index, column in enumerate(columns, start=1):
+        max_length = max(len(column), longest.get(column, 0))
+        worksheet.column_dimensions[get_column_letter(index)].width = (max_length + 2) * 1.2
+
+    worksheet.append(columns)
+    count = 0
+    for user in users:
+        worksheet.append(user_row(user, max_counters))
+        count += 1
+        if progress and count % PROGRESS_EVERY == 0:
+            progress("rows", count)
+
+    if progress:
+        progress("saving", count)
+    workbook.save(filename)
+    return filename, count
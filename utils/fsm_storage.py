@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_TTL, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE
+from utils.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Как часто (сек) удалять из базы устаревшие состояния
+PURGE_INTERVAL = 3600
+
+
+def _dump(data: Dict[str, Any]) -> Optional[str]:
+    # Компактный JSON без пробелов и \u-экранирования кириллицы; пустые данные не храним
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+
+
+def _load(data: Optional[str]) -> Dict[str, Any]:
+    return json.loads(data) if data else {}
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states того же файла базы.
+
+    Чтение идет из памяти (ограниченный кэш), в базу обращаемся только
+    для ключей, которых там нет. Изменения пишутся отложенно: накопленные
+    за flush_interval секунд переходы сохраняются одной транзакцией, так
+    что при падении теряются изменения не больше чем за этот интервал.
+    Состояния, которые не менялись ttl секунд, считаются брошенными и
+    забываются.
+    """
+
+    def __init__(self, db, ttl=FSM_TTL, flush_interval=FSM_FLUSH_INTERVAL, max_entries=FSM_CACHE_SIZE):
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # Ботов два, а пользователь один: ключ включает id бота
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._records = TTLCache(max_entries, ttl)
+        # Еще не сохраненные записи: key -> (state, data, updated_at)
+        self._dirty = {}
+        self._flusher = None
+        self._purged_at = 0.0
+        self.flushes = 0
+
+    async def _get(self, key: StorageKey):
+        storage_key = self.key_builder.build(key)
+        record = self._cached(storage_key)
+        if record is MISSING:
+            row = await self.db.load_fsm_state(storage_key, time.time() - self.ttl)
+            # Пока читали из базы, запись могла измениться - тогда новее она
+            record = self._cached(storage_key)
+            if record is MISSING:
+                record = (row[0], _load(row[1])) if row else (None, {})
+                self._records.put(storage_key, record)
+        return storage_key, record[0], record[1]
+
+    def _cached(self, storage_key: str):
+        if storage_key in self._dirty:
+            state, data, _ = self._dirty[storage_key]
+            return state, data
+        return self._records.get(storage_key)
+
+    async def _set(self, storage_key: str, state: Optional[str], data: Dict[str, Any]):
+        self._records.put(storage_key, (state, data))
+        self._dirty[storage_key] = (state, data, time.time())
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, _, data = await self._get(key)
+        await self._set(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key, state, _ = await self._get(key)
+        await self._set(storage_key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, _, data = await self._get(key)
+        return data.copy()
+
+    def stats(self) -> dict:
+        return {"cached": len(self._records), "pending": len(self._dirty), "flushes": self.flushes}
+
+    async def flush(self):
+        """Сохраняет все накопленные изменения одной транзакцией"""
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        rows = [(key, state, _dump(data), updated_at) for key, (state, data, updated_at) in dirty.items()]
+        try:
+            await self.db.save_fsm_states(rows)
+            self.flushes += 1
+        except Exception:
+            # Вернем несохраненное, не затирая более новые изменения
+            for key, value in dirty.items():
+                self._dirty.setdefault(key, value)
+            raise
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    self._purged_at = time.monotonic()
+                    await self.db.purge_fsm_states(time.time() - self.ttl)
+            except Exception:
+                logger.exception("Помилка збереження станів FSM", extra={"pending": len(self._dirty)})
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+def create_fsm_storage(db) -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE"""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(db)
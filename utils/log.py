@@ -0,0 +1,150 @@
+"""
+Логирование: структурированные записи, запись в поток вывода из
+отдельного потока, уровни по модулям, выборка отладочных записей и
+маскирование персональных данных.
+
+Модули пишут через logging.getLogger(__name__); данные передаются
+полями extra, а не подставляются в текст, например:
+    logger.info("Показання збережено", extra={"counter_id": counter_id, "value": value})
+
+Цикл событий только кладет запись в очередь; форматирование в JSON и
+запись в stdout идут в потоке QueueListener. Отладочные вызовы с
+выключенным DEBUG отсекаются logger.isEnabledFor до создания записи.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+from datetime import datetime, timezone
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_DEBUG_SAMPLE
+
+# Поля extra с персональными данными: в лог попадает только маска
+PERSONAL_FIELDS = frozenset({"full_name", "phone_number", "phone", "address", "account_number", "text"})
+REDACTED = "***"
+# Телефонные номера внутри текста сообщений
+PHONE_PATTERN = re.compile(r"\+?(?:38[\s-]*)?\(?0\d{2}\)?[\s-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}\b")
+
+# Атрибуты самой LogRecord: все остальное - поля из extra
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def redact(value):
+    return PHONE_PATTERN.sub(REDACTED, value) if isinstance(value, str) else value
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {
+        key: REDACTED if key in PERSONAL_FIELDS else redact(value)
+        for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+            **_extra_fields(record),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Читаемый формат для локального запуска: те же поля через key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {redact(record.getMessage())}"
+        fields = " ".join(f"{key}={value}" for key, value in _extra_fields(record).items())
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+class DebugSampler(logging.Filter):
+    """
+    Пропускает каждую rate-ю отладочную запись для каждого шаблона
+    сообщения (первая проходит всегда). Записи уровня INFO и выше не трогает
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._counts = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate <= 1:
+            return True
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        record.sampled = self.rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование - в потоке слушателя; здесь только фиксируем текст
+        # сообщения, чтобы аргументы не изменились, пока запись в очереди
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_levels(levels: str) -> dict:
+    """'database=WARNING,handlers=DEBUG' -> {'database': 'WARNING', 'handlers': 'DEBUG'}"""
+    result = {}
+    for item in filter(None, (part.strip() for part in levels.split(","))):
+        name, _, level = item.partition("=")
+        result[name.strip()] = level.strip().upper()
+    return result
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT, debug_sample=LOG_DEBUG_SAMPLE):
+    """Настраивает корневой логгер; вызывается один раз при запуске"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(DebugSampler(debug_sample))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Дописывает записи из очереди перед выходом"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
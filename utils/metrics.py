@@ -0,0 +1,211 @@
+"""
+Метрики в текстовом формате Prometheus (отдаются на /metrics).
+
+Счетчики и гистограммы собираются middleware обработчиков, middleware
+сессии Bot API и AsyncDatabase; значения, которые и так хранятся в
+объектах (размеры очередей, статистика пула), снимаются в момент
+запроса через зарегистрированные функции.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "meter_bot_"
+
+# Границы корзин гистограмм задержки (сек)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по корзинам..., сумма, количество]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.labelnames, labels, [('le', bound)])} {cumulative}")
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # (префикс, функция, которая возвращает словарь {имя: значение})
+        self._gauges = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(self, prefix: str, collect):
+        """Значения collect() отдаются как gauge с именами <prefix>_<ключ>"""
+        self._gauges.append((prefix, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for prefix, collect in self._gauges:
+            try:
+                values = collect()
+            except Exception:
+                logger.exception("Не вдалося зібрати метрики", extra={"prefix": prefix})
+                continue
+            for key, value in values.items():
+                name = f"{PREFIX}{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATES = REGISTRY.register(Counter(
+    "updates_total", "Отримані оновлення", ("bot", "type")))
+UPDATE_SECONDS = REGISTRY.register(Histogram(
+    "update_seconds", "Повний час обробки оновлення", ("bot", "type")))
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "handler_seconds", "Час роботи обробника", ("router", "handler")))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    "handler_errors_total", "Винятки в обробниках", ("router", "handler", "error")))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "db_query_seconds", "Час виконання методу Database (без очікування з'єднання)", ("method",)))
+DB_ERRORS = REGISTRY.register(Counter(
+    "db_errors_total", "Винятки в методах Database", ("method", "error")))
+TELEGRAM_SECONDS = REGISTRY.register(Histogram(
+    "telegram_api_seconds", "Час запиту до Bot API", ("method",)))
+TELEGRAM_ERRORS = REGISTRY.register(Counter(
+    "telegram_api_errors_total", "Помилки запитів до Bot API", ("method", "error")))
+
+
+async def update_middleware(handler, update, data):
+    """Outer-middleware Dispatcher.update: количество и полное время обработки обновлений"""
+    labels = (data["bot"].id, update.event_type)
+    UPDATES.inc(*labels)
+    with UPDATE_SECONDS.time(*labels):
+        return await handler(update, data)
+
+
+def handler_callback(data):
+    """Функция обработчика события; для кнопок меню - обработчик кнопки, а не общий ButtonIndex"""
+    return data.get("button_handler", data["handler"]).callback
+
+
+def handler_name(callback) -> str:
+    """Полное имя обработчика: одноименные функции разных диалогов и модулей не совпадают"""
+    return f"{callback.__module__}.{callback.__qualname__}"
+
+
+async def handler_middleware(handler, event, data):
+    """Middleware наблюдателей роутера: время и ошибки каждого обработчика"""
+    callback = handler_callback(data)
+    labels = (callback.__module__, callback.__qualname__)
+    started = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception as e:
+        HANDLER_ERRORS.inc(*labels, type(e).__name__)
+        raise
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - started, *labels)
+
+
+async def telegram_api_middleware(make_request, bot, method):
+    """Middleware сессии бота: время и ошибки запросов к Bot API"""
+    name = type(method).__name__
+    started = time.perf_counter()
+    try:
+        return await make_request(bot, method)
+    except Exception as e:
+        TELEGRAM_ERRORS.inc(name, type(e).__name__)
+        raise
+    finally:
+        TELEGRAM_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def setup_metrics(dp, bots):
+    """Подключает middleware метрик к диспетчеру и сессиям ботов"""
+    dp.update.outer_middleware(update_middleware)
+    # Middleware наблюдателя диспетчера действует и на обработчики вложенных
+    # роутеров; повторная регистрация в каждом роутере считала бы вызов дважды
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(handler_middleware)
+    for bot in bots:
+        bot.session.middleware(telegram_api_middleware)
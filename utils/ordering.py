@@ -0,0 +1,107 @@
+"""
+Порядок обработки обновлений.
+
+aiogram обрабатывает каждое обновление отдельной задачей, поэтому два
+быстрых нажатия одного мешканца могут выполняться одновременно: оба
+прочитают одно и то же состояние диалога и, например, оба пройдут
+проверку показания. ChatSequencer пропускает обновления одного чата по
+очереди, в порядке поступления, а обновления разных чатов - параллельно,
+не больше limit одновременно. Сами запросы к базе при этом безопасны:
+AsyncDatabase на каждый вызов берет из пула отдельное соединение.
+"""
+import asyncio
+from typing import Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import EventContext
+
+from config import UPDATE_CONCURRENCY
+
+
+class _ChatQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        # asyncio.Lock отдает блокировку ожидающим в порядке очереди
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class ChatSequencer:
+    """
+    Outer-middleware Dispatcher.update. Очередь чата существует, пока в
+    ней есть обновления, поэтому память растет только с числом чатов,
+    которые пишут боту прямо сейчас
+    """
+
+    def __init__(self, limit: int = UPDATE_CONCURRENCY):
+        self.limit = limit
+        self._slots = asyncio.Semaphore(limit)
+        self._chats: Dict[tuple, _ChatQueue] = {}
+        self.waiting = 0
+        self.active = 0
+        self.processed = 0
+
+    @staticmethod
+    def _key(bot: Bot, context: Optional[EventContext]):
+        if context is None:
+            return None
+        # У каждого бота свои диалоги: один и тот же человек в двух ботах - две очереди
+        chat_id = context.chat_id or context.user_id
+        return None if chat_id is None else (bot.id, chat_id)
+
+    async def __call__(self, handler, update, data):
+        self.waiting += 1
+        key = self._key(data["bot"], data.get("event_context"))
+        if key is None:
+            return await self._run(handler, update, data)
+
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        queue.pending += 1
+        try:
+            async with queue.lock:
+                return await self._run(handler, update, data)
+        finally:
+            queue.pending -= 1
+            if not queue.pending:
+                del self._chats[key]
+
+    async def _run(self, handler, update, data):
+        # Место занимается только когда подошла очередь чата: ждущие своей
+        # очереди обновления не мешают другим чатам
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            return await handler(update, data)
+        finally:
+            self.active -= 1
+            self.processed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "chats": len(self._chats),
+            "waiting": self.waiting,
+            "processed": self.processed,
+        }
+
+
+def setup_ordering(dp: Dispatcher, limit: int = UPDATE_CONCURRENCY) -> ChatSequencer:
+    """
+    Подключает ChatSequencer к диспетчеру. Он должен стоять раньше
+    FSMContextMiddleware: та читает состояние диалога до обработчика, и
+    следующее обновление чата иначе получило бы состояние, каким оно было
+    до обработки предыдущего
+    """
+    sequencer = ChatSequencer(limit)
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(sequencer)
+    dp.update.outer_middleware(dp.fsm)
+    return sequencer
@@ -0,0 +1,43 @@
+"""
+Запись входящих обновлений для воспроизведения под нагрузкой
+(benchmarks/fake_telegram.py).
+
+Обработчик обновления только кладет строку JSON в очередь; в файл пишет
+отдельный поток с одним открытым файлом, так что диск не задерживает
+цикл событий и не искажает записываемую нагрузку.
+"""
+import queue
+import threading
+
+# Сигнал потоку записи: очередь закрыта
+_STOP = None
+
+
+class UpdateRecorder:
+    """Outer-middleware Dispatcher.update: одно обновление - одна строка JSON в path"""
+
+    def __init__(self, path: str):
+        self._lines = queue.SimpleQueue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._write, name="update-recorder", daemon=True)
+        self._thread.start()
+
+    async def __call__(self, handler, update, data):
+        self._lines.put(update.model_dump_json(exclude_none=True))
+        return await handler(update, data)
+
+    def _write(self):
+        while True:
+            line = self._lines.get()
+            if line is _STOP:
+                break
+            self._file.write(line + "\n")
+            # Буфер сбрасывается, когда очередь опустела: при потоке обновлений - пачками
+            if self._lines.empty():
+                self._file.flush()
+        self._file.close()
+
+    def close(self):
+        """Дописывает оставшиеся в очереди обновления и закрывает файл"""
+        self._lines.put(_STOP)
+        self._thread.join()
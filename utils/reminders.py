@@ -1,25 +1,158 @@
+import asyncio
+import logging
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
 from aiogram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
 
-from database import Database
+from async_database import get_db
+from config import TIMEZONE, REMINDER_WAVES, REMINDER_HOUR, REMINDER_MISFIRE_GRACE, REMINDER_PAGE_SIZE
+from utils.broadcast import Broadcaster
 
-db = Database()
+logger = logging.getLogger(__name__)
 
-async def send_reminders(bot: Bot):
-    today = datetime.now()
-    # Рассчитываем последний день текущего месяца
-    if today.month == 12:
-        last_day_of_month = today.replace(year=today.year + 1, month=1, day=1) - timedelta(days=1)
+db = get_db()
+
+TZ = ZoneInfo(TIMEZONE)
+
+
+def last_day_of_month(year: int, month: int) -> int:
+    next_month = datetime(year + month // 12, month % 12 + 1, 1)
+    return (next_month - timedelta(days=1)).day
+
+
+def reminder_time(year: int, month: int, days_before: int, hour=REMINDER_HOUR) -> datetime:
+    """
+    Когда в этом месяце отправляется волна напоминаний (по киевскому времени).
+    Если в месяце не больше days_before дней (февраль при days_before >= 28),
+    волна уходит первого числа
+    """
+    day = max(1, last_day_of_month(year, month) - days_before)
+    return datetime(year, month, day, hour, tzinfo=TZ)
+
+
+def campaign_name(due: datetime, days_before: int) -> str:
+    """Одна рассылка на волну в месяц: после перезапуска она продолжается, а не начинается заново"""
+    return f"reminder-{due:%Y-%m}-{days_before}d"
+
+
+def reminder_text(days_before: int) -> str:
+    if days_before == 0:
+        left = "сьогодні останній день місяця"
+    elif days_before % 10 == 1 and days_before % 100 != 11:
+        left = f"залишився {days_before} день до кінця місяця"
+    elif 2 <= days_before % 10 <= 4 and not 12 <= days_before % 100 <= 14:
+        left = f"залишилось {days_before} дні до кінця місяця"
     else:
-        last_day_of_month = today.replace(month=today.month + 1, day=1) - timedelta(days=1)
+        left = f"залишилось {days_before} днів до кінця місяця"
+    return f"Нагадування: {left}. Будь ласка, передайте показники лічильників."
+
+
+class MonthEndTrigger(BaseTrigger):
+    """
+    Триггер APScheduler: за days_before дней до конца каждого месяца в hour:00
+    по киевскому времени. Время считается от календаря, а не от момента
+    запуска бота, поэтому перезапуски его не сдвигают
+    """
+
+    def __init__(self, days_before: int, hour=REMINDER_HOUR):
+        self.days_before = days_before
+        self.hour = hour
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        moment = (previous_fire_time + timedelta(seconds=1) if previous_fire_time else now).astimezone(TZ)
+        year, month = moment.year, moment.month
+        due = reminder_time(year, month, self.days_before, self.hour)
+        if due < moment:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            due = reminder_time(year, month, self.days_before, self.hour)
+        return due
+
+    def __str__(self):
+        return f"month_end[days_before={self.days_before}, hour={self.hour}, tz={TZ.key}]"
+
+
+def missed_reminder(now: datetime, days_before: int, grace=REMINDER_MISFIRE_GRACE):
+    """
+    Время волны этого месяца, если оно уже прошло, но не больше grace
+    секунд назад (бот был выключен в назначенное время), иначе None
+    """
+    due = reminder_time(now.year, now.month, days_before)
+    if due <= now <= due + timedelta(seconds=grace):
+        return due
+    return None
+
+
+async def _recipients(campaign: str, month: str, page_size=REMINDER_PAGE_SIZE):
+    """
+    Получатели волны страницами по page_size: каждая страница читается из
+    базы перед отправкой, поэтому передавшие показания во время рассылки
+    уже не получат напоминание
+    """
+    after = 0
+    while True:
+        page = await db.get_broadcast_recipients(campaign, month, after, page_size)
+        if not page:
+            return
+        for user_id in page:
+            yield user_id
+        after = page[-1]
+
+
+async def send_reminders(bot: Bot, days_before: int):
+    """
+    Рассылает волну напоминаний этого месяца тем, кто еще не передал
+    показания по всем счетчикам. Список получателей фиксируется при первом
+    запуске волны; каждая следующая волна выбирается заново и потому уже.
+    Повторный вызов в том же месяце только дорассылает остаток
+    """
+    now = datetime.now(TZ)
+    due = missed_reminder(now, days_before)
+    if due is None:
+        logger.warning("Нагадування поза розкладом пропущено",
+                       extra={"now": now.isoformat(), "days_before": days_before})
+        return
+    campaign = campaign_name(due, days_before)
+    month = f"{due:%Y-%m}"
+    # В коротком месяце волна могла сдвинуться на первое число: в тексте реальный остаток дней
+    text = reminder_text(last_day_of_month(due.year, due.month) - due.day)
+    planned = await db.plan_broadcast(campaign, text, month)
+    logger.info("Хвиля нагадувань", extra={"campaign": campaign, "recipients": planned})
+    try:
+        await Broadcaster(bot, db, campaign, text).run(_recipients(campaign, month))
+    except asyncio.CancelledError:
+        # Остановка бота посреди волны: остаток дорассылается после перезапуска
+        logger.warning("Розсилку нагадувань перервано", extra={"campaign": campaign})
+        raise
 
-    # Рассчитываем разницу в днях до конца месяца
-    days_until_end = (last_day_of_month - today).days
 
-    # Отправляем напоминание, если до конца месяца осталось 5 дней
-    if days_until_end == 5:
-        users = db.get_all_users()
-        for user in users:
-            user_id = user[1]  # user_id находится на второй позиции в кортеже
-            await bot.send_message(user_id, "Нагадування: залишилось 5 днів до кінця місяця. Будь ласка, передайте показники лічильників.")
+def schedule_reminders(scheduler: AsyncIOScheduler, bot: Bot, waves=REMINDER_WAVES):
+    """
+    Добавляет в планировщик по задаче на каждую волну напоминаний. Если бот
+    был выключен в назначенное время (не дольше REMINDER_MISFIRE_GRACE),
+    сразу запускается последняя пропущенная волна; незавершенная рассылка
+    этого месяца продолжается
+    """
+    now = datetime.now(TZ)
+    missed = [days for days in waves if missed_reminder(now, days)]
+    # Более ранние пропущенные волны уже не нужны: последняя их заменяет
+    catch_up = min(missed, default=None)
+    for days_before in waves:
+        scheduler.add_job(
+            send_reminders,
+            MonthEndTrigger(days_before),
+            args=(bot, days_before),
+            id=f"monthly_reminder_{days_before}d",
+            replace_existing=True,
+            misfire_grace_time=REMINDER_MISFIRE_GRACE,
+            coalesce=True,
+            max_instances=1,
+            # Для пропущенной волны запуск сейчас; повторный запуск
+            # завершенной рассылки ничего не отправляет
+            **({"next_run_time": now} if days_before == catch_up else {}),
+        )
+    if catch_up is not None:
+        logger.info("Запуск пропущеного нагадування",
+                    extra={"campaign": campaign_name(missed_reminder(now, catch_up), catch_up)})
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+from config import REPORT_CACHE_SIZE, REPORT_CACHE_TTL
+
+
+class ReportCache:
+    """
+    Кэш готовых отчетов по ключу (начало, конец, формат).
+
+    Хранится не сам файл, а file_id, который Telegram вернул после первой
+    отправки, так что повторная отправка не трогает ни SQLite, ни диск.
+    Каждая запись помечена версией данных (AsyncDatabase.data_version) на
+    момент построения: после любой записи в базу запись устаревает.
+    Вытеснение - по количеству записей (LRU) и по возрасту.
+    """
+
+    def __init__(self, max_entries=REPORT_CACHE_SIZE, max_age=REPORT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, start_date: str, end_date: str, fmt: str, data_version: int):
+        """
+        Возвращает (file_id, количество пользователей) или None.
+        file_id равен None, если за период данных нет
+        """
+        key = (start_date, end_date, fmt)
+        entry = self._entries.get(key)
+        if entry is not None:
+            version, created_at, file_id, users_count = entry
+            if version == data_version and time.monotonic() - created_at <= self.max_age:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return file_id, users_count
+            del self._entries[key]
+            self.evictions += 1
+
+        self.misses += 1
+        return None
+
+    def put(self, start_date: str, end_date: str, fmt: str, data_version: int, file_id, users_count: int):
+        key = (start_date, end_date, fmt)
+        self._entries[key] = (data_version, time.monotonic(), file_id, users_count)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiogram import types
+from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+
+from config import REPORT_WORKERS, REPORT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного редактирования сообщения о прогрессе за этот интервал (сек)
+PROGRESS_INTERVAL = 1.5
+
+
+class ReportQueueFull(Exception):
+    """В очереди уже максимальное количество отчетов"""
+
+
+class ReportJob:
+    """
+    Один отчет за период. К уже запущенному отчету за тот же период
+    присоединяются следующие запросы: все получают один и тот же файл,
+    а сообщения о прогрессе обновляются у всех.
+    """
+
+    def __init__(self, job_id: int, start_date: str, end_date: str, data_version: int):
+        self.job_id = job_id
+        self.start_date = start_date
+        self.end_date = end_date
+        # Версия данных на момент запуска: с ней результат попадет в кэш
+        self.data_version = data_version
+        self.future = asyncio.get_running_loop().create_future()
+        self.messages = []
+        self.subscribers = 0
+        # file_id после первой отправки: остальным подписчикам файл не загружаем заново
+        self.file_id = None
+        # Первую загрузку делает один подписчик, остальные ждут его file_id
+        self._upload_lock = asyncio.Lock()
+        # Файл, в который пишется отчет (задается при запуске построения)
+        self.filename = None
+        # Меняются из рабочего потока, читаются из цикла событий
+        self.stage = "queued"
+        self.rows = 0
+
+    def set_progress(self, stage: str, count: int):
+        self.stage = stage
+        self.rows = count
+
+    def progress_text(self) -> str:
+        if self.stage == "queued":
+            return "⏳ Звіт у черзі, зачекайте..."
+        if self.stage == "saving":
+            return f"💾 Записую файл... (рядків: {self.rows})"
+        return f"⏳ Формую звіт: отримано рядків: {self.rows}"
+
+    async def wait(self):
+        """Ждет окончания отчета: (имя файла, количество пользователей)"""
+        return await asyncio.shield(self.future)
+
+    async def send_document(self, message: types.Message, caption: str) -> types.Message:
+        """
+        Отправляет готовый файл отчета. Файл загружается в Telegram один раз:
+        пока идет первая загрузка, остальные подписчики ждут ее file_id
+        """
+        if self.file_id is None:
+            async with self._upload_lock:
+                if self.file_id is None:
+                    filename, _ = self.future.result()
+                    sent = await message.answer_document(FSInputFile(filename), caption=caption)
+                    self.file_id = sent.document.file_id
+                    return sent
+        return await message.answer_document(self.file_id, caption=caption)
+
+    def release(self):
+        """Подписчик отправил файл; последний удаляет его с сервера (и недописанный - после ошибки)"""
+        self.subscribers -= 1
+        if self.subscribers > 0 or not self.future.done():
+            return
+        filename = self.filename if self.future.exception() else self.future.result()[0]
+        if filename and os.path.exists(filename):
+            try:
+                os.remove(filename)
+                logger.info("Файл звіту видалено", extra={"file": filename})
+            except Exception:
+                logger.exception("Помилка при видаленні файлу звіту", extra={"file": filename})
+
+
+class ReportJobs:
+    """
+    Очередь отчетов: отчеты строятся в отдельном пуле потоков, каждый
+    со своим соединением для чтения из общего пула, так что
+    обработчики обоих ботов продолжают работать, пока строится отчет.
+    """
+
+    def __init__(self, db, workers=REPORT_WORKERS, queue_size=REPORT_QUEUE_SIZE):
+        self._db = db
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, start_date: str, end_date: str, progress_message: types.Message) -> ReportJob:
+        """
+        Возвращает отчет за период: уже запущенный или новый.
+        progress_message - сообщение, которое будет обновляться по ходу работы
+        """
+        key = (start_date, end_date)
+        job = self._jobs.get(key)
+        if job is None:
+            if len(self._jobs) >= self.queue_size:
+                raise ReportQueueFull()
+            job = ReportJob(next(self._ids), start_date, end_date, self._db.data_version)
+            self._jobs[key] = job
+            asyncio.create_task(self._run(key, job))
+        job.subscribers += 1
+        job.messages.append(progress_message)
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "queued": sum(1 for job in self._jobs.values() if job.stage == "queued"),
+            "active": len(self._jobs),
+        }
+
+    def _build(self, job: ReportJob):
+        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = job.filename = f"readings_report_{current_time}_{job.job_id}.xlsx"
+        job.set_progress("rows", 0)
+        with self._db.pool.reader() as database:
+            return database.export_readings_report(
+                job.start_date, job.end_date, filename=filename, progress=job.set_progress
+            )
+
+    async def _report_progress(self, job: ReportJob):
+        shown = None
+        while not job.future.done():
+            text = job.progress_text()
+            if text != shown:
+                shown = text
+                for message in list(job.messages):
+                    try:
+                        await message.edit_text(text)
+                    except TelegramBadRequest:
+                        pass
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    async def _run(self, key, job: ReportJob):
+        loop = asyncio.get_running_loop()
+        progress = asyncio.create_task(self._report_progress(job))
+        try:
+            result = await loop.run_in_executor(self._executor, self._build, job)
+            job.future.set_result(result)
+        except Exception as e:
+            logger.exception("Помилка при генерації звіту", extra={"job_id": job.job_id})
+            job.future.set_exception(e)
+        finally:
+            del self._jobs[key]
+            progress.cancel()
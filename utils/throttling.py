@@ -0,0 +1,158 @@
+"""
+Ограничение частоты запросов одного пользователя.
+
+У каждого пользователя есть общий "бак" токенов на все обработчики и
+отдельные баки для дорогих обработчиков (THROTTLE_LIMITS): каждое
+обновление забирает токен из обоих, токены восполняются с постоянной
+скоростью. Когда бак пуст, обработчик не вызывается, а пользователь один
+раз получает короткий ответ "зачекайте" - повторно только после того, как
+бак снова начнет пропускать запросы.
+
+Баки хранятся в LRU ограниченного размера. Вытесняются те, к которым дольше
+всего не обращались, а бак, который не трогали дольше времени полного
+восполнения, и так полон - его потеря ничего не меняет.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import types
+
+from config import THROTTLE_DEFAULT, THROTTLE_LIMITS, THROTTLE_MAX_USERS
+from utils.metrics import REGISTRY, Counter, handler_callback, handler_name
+
+THROTTLED = REGISTRY.register(Counter(
+    "throttled_total", "Відхилені через ліміт частоти оновлення", ("handler",)))
+
+# Ответ на отклоненное обновление: без клавиатуры, чтобы не менять текущую
+WAIT_TEXT = "⏳ Забагато запитів. Зачекайте кілька секунд і спробуйте ще раз."
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """"20/10" - 20 запросов за 10 секунд -> (емкость бака, токенов в секунду)"""
+    count, seconds = spec.split("/")
+    return int(count), int(count) / float(seconds)
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, float]]:
+    """"handlers.user_handlers.process_reading=10/60,..." -> {полное имя обработчика: лимит}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, limit = item.split("=")
+        limits[name.strip()] = parse_limit(limit)
+    return limits
+
+
+class TokenBuckets:
+    """Баки токенов по ключу с общей емкостью и скоростью восполнения"""
+
+    def __init__(self, capacity: int, rate: float, max_entries: int = THROTTLE_MAX_USERS):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_entries = max_entries
+        # ключ -> [токены, время последнего обновления, предупрежден ли после последнего пропуска]
+        self._buckets = OrderedDict()
+        self.evicted = 0
+
+    def take(self, key, now: Optional[float] = None) -> bool:
+        """Забирает токен; False - бак пуст"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.capacity), now, False]
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def refund(self, key):
+        """Возвращает токен, взятый для обновления, которое все равно отклонено"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.capacity, bucket[0] + 1)
+
+    def warn(self, key) -> bool:
+        """True, если пользователя еще не предупреждали с последнего пропущенного обновления"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[2]:
+            return False
+        bucket[2] = True
+        return True
+
+    def served(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[2] = False
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Throttler:
+    """
+    Middleware наблюдателей message и callback_query. Обработчик
+    определяется так же, как для метрик: для кнопок меню - обработчик кнопки,
+    имя - модуль и qualname функции
+    """
+
+    def __init__(self, default: str = THROTTLE_DEFAULT, limits: str = THROTTLE_LIMITS,
+                 max_users: int = THROTTLE_MAX_USERS):
+        self._default = TokenBuckets(*parse_limit(default), max_users)
+        self._handlers = {
+            name: TokenBuckets(capacity, rate, max_users)
+            for name, (capacity, rate) in parse_limits(limits).items()
+        }
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        name = handler_name(handler_callback(data))
+        key = (data["bot"].id, user.id)
+        allowed = self._default.take(key)
+        buckets = self._handlers.get(name)
+        if allowed and buckets is not None and not buckets.take(key):
+            # Отказ по лимиту обработчика не расходует общий лимит
+            self._default.refund(key)
+            allowed = False
+        if allowed:
+            self._default.served(key)
+            return await handler(event, data)
+
+        THROTTLED.inc(name)
+        # Предупреждение - одно на серию отказов подряд, отметка хранится в общем баке
+        warn = self._default.warn(key)
+        if isinstance(event, types.CallbackQuery):
+            # На нажатие инлайн-кнопки нужно ответить в любом случае, иначе она "крутится"
+            await event.answer(WAIT_TEXT if warn else None)
+        elif warn:
+            await event.answer(WAIT_TEXT)
+
+    def stats(self) -> dict:
+        stats = {"default_users": len(self._default), "default_evicted": self._default.evicted}
+        for name, buckets in self._handlers.items():
+            # Точки в имени метрики Prometheus недопустимы
+            name = name.replace(".", "_")
+            stats[f"{name}_users"] = len(buckets)
+            stats[f"{name}_evicted"] = buckets.evicted
+        return stats
+
+
+def setup_throttling(dp, throttler: Throttler = None) -> Throttler:
+    """
+    Подключает ограничение частоты к диспетчеру. Вызывать до setup_metrics:
+    отклоненные обновления не попадают во время обработчиков
+    """
+    throttler = throttler or Throttler()
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(throttler)
+    return throttler
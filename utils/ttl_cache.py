@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+
+# Отличает "нет в кэше" от закэшированного None
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш с временем жизни записей.
+    on_evict(key, value) вызывается для записей, вытесненных по размеру или возрасту
+    """
+
+    def __init__(self, max_entries: int, ttl: float, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Возвращает значение или MISSING"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._evict(key)
+        self.misses += 1
+        return MISSING
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return MISSING if entry is None else entry[1]
+
+    def _evict(self, key):
+        _, value = self._entries.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value)
+
+    def __len__(self):
+        return len(self._entries)